@@ -0,0 +1,180 @@
+"""
+Content-addressed blob store shared by the download scripts.
+
+Every saved document is stored once under its SHA-256 in BLOB_STORE, and
+the matter and practice-area folders are built from links into the store:
+a hardlink where the filesystem allows it, else a reflink (copy-on-write
+clone), else a plain copy. The same exhibit filed under several tickers
+or accessions then takes its bytes on disk once, and a file already
+linked to the right blob is not written again.
+
+Blobs are copied into the store, never linked from the file they came
+from, and are made read-only, so the hardlinks in the matter folders are
+read-only too: an in-place edit fails instead of changing the blob and
+every other matter linked to it. Editors that save by writing a new file
+and renaming it over the old one just replace the link. Show how much
+the store is saving:
+
+    python blob_store.py [store folder]
+"""
+
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+
+try:
+    import fcntl
+except ImportError:  # Windows: no reflinks
+    fcntl = None
+
+BLOB_STORE = "./blob_store"
+
+CHUNK_SIZE = 1024 * 1024
+
+# Blobs, and so the hardlinks to them, are read-only
+BLOB_MODE = 0o444
+
+# ioctl that clones one file's extents into another (btrfs, XFS, bcachefs)
+FICLONE = 0x40049409
+
+
+def reflink(src_path, dest_path):
+    """Clone src_path to dest_path copy-on-write; raises OSError where unsupported."""
+    if fcntl is None:
+        raise OSError("reflinks are not supported here")
+    with open(src_path, 'rb') as src, open(dest_path, 'wb') as dest:
+        try:
+            fcntl.ioctl(dest.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dest.close()
+            os.remove(dest_path)
+            raise
+
+
+class BlobStore:
+    """Files stored once by SHA-256, linked into place wherever they are needed."""
+
+    def __init__(self, root=BLOB_STORE):
+        self.root = root
+
+    def path(self, digest):
+        """Where the blob with this SHA-256 lives."""
+        return os.path.join(self.root, digest[:2], digest)
+
+    def _commit(self, tmp_path, digest):
+        """Move a finished temp file into place read-only, unless the blob already exists."""
+        blob_path = self.path(digest)
+        if os.path.exists(blob_path):
+            os.remove(tmp_path)
+        else:
+            os.chmod(tmp_path, BLOB_MODE)
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            os.replace(tmp_path, blob_path)
+        return digest
+
+    def _temp(self):
+        os.makedirs(self.root, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        return os.fdopen(fd, 'wb'), tmp_path
+
+    def put_stream(self, src):
+        """Store everything read from a binary file object; returns its SHA-256."""
+        sha = hashlib.sha256()
+        dest, tmp_path = self._temp()
+        with dest:
+            for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+                sha.update(chunk)
+                dest.write(chunk)
+        return self._commit(tmp_path, sha.hexdigest())
+
+    def put_bytes(self, data):
+        """Store a bytes object; returns its SHA-256."""
+        digest = hashlib.sha256(data).hexdigest()
+        if not os.path.exists(self.path(digest)):
+            dest, tmp_path = self._temp()
+            with dest:
+                dest.write(data)
+            self._commit(tmp_path, digest)
+        return digest
+
+    def put_file(self, src_path):
+        """
+        Store a copy of a file's contents; returns its SHA-256. The file is
+        only hashed when the store already has it.
+        """
+        sha = hashlib.sha256()
+        with open(src_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+
+        if os.path.exists(self.path(digest)):
+            return digest
+        # Hashed again while copying, in case the file changed in between
+        with open(src_path, 'rb') as src:
+            return self.put_stream(src)
+
+    def link(self, digest, dest_path):
+        """
+        Make dest_path a link to the blob. Returns False without touching
+        anything if dest_path already is one.
+        """
+        blob_path = self.path(digest)
+        if os.path.exists(dest_path) and os.path.samefile(blob_path, dest_path):
+            return False
+
+        # Build the link beside dest_path, then swap it in over any old file
+        tmp_path = f"{dest_path}.{digest[:12]}.tmp"
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+        try:
+            os.link(blob_path, tmp_path)
+        except OSError:
+            try:
+                reflink(blob_path, tmp_path)
+            except OSError:
+                shutil.copyfile(blob_path, tmp_path)
+        os.replace(tmp_path, dest_path)
+        return True
+
+    def save_file(self, src_path, dest_path):
+        """Store a file and link it to dest_path; returns False if it was already there."""
+        return self.link(self.put_file(src_path), dest_path)
+
+    def save_stream(self, src, dest_path):
+        """Store a binary stream and link it to dest_path; returns False if it was already there."""
+        return self.link(self.put_stream(src), dest_path)
+
+    def save_text(self, text, dest_path, encoding='utf-8'):
+        """Store text and link it to dest_path; returns False if it was already there."""
+        return self.link(self.put_bytes(text.encode(encoding)), dest_path)
+
+    def stats(self):
+        """
+        Return (blobs, bytes stored, bytes saved by links beyond the first).
+
+        Every link to a blob besides the store's own is a file made by
+        link().
+        """
+        blobs = stored = saved = 0
+        if not os.path.isdir(self.root):
+            return blobs, stored, saved
+        for root, _, names in os.walk(self.root):
+            for name in names:
+                if name.endswith('.tmp'):
+                    continue
+                st = os.stat(os.path.join(root, name))
+                blobs += 1
+                stored += st.st_size
+                # One link is the store's own; one more is the first real copy
+                saved += max(st.st_nlink - 2, 0) * st.st_size
+        return blobs, stored, saved
+
+
+if __name__ == "__main__":
+    store = BlobStore(sys.argv[1] if len(sys.argv) > 1 else BLOB_STORE)
+    blobs, stored, saved = store.stats()
+    print(f"{store.root}: {blobs} blobs, {stored / 1e6:.1f} MB stored, "
+          f"{saved / 1e6:.1f} MB saved by hardlinks")
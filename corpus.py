@@ -0,0 +1,384 @@
+"""
+Document discovery and metadata for the corpus trees.
+
+Documents are identified by their path under the working folder, e.g.
+'legal_test_matters/15001-00002_MandA/Merger_Agreement.txt' or
+'sec_filings_clean/KKR/10-K_0001404912-25-000015/EX-31.1_kkr-20241231xex311.htm.txt',
+and carry the fields the tree layout implies:
+
+    matter         matter folder, or '<ticker>/<form>_<accession>' for filings
+    practice_area  IFG, LevFin, MandA or Mixed for test matters
+    ticker, form   for SEC filings
+    exhibit        the document type prefix of a filing's file (10-K, EX-31.1, ...)
+
+Filing documents that process_sec_filings now skips (uuencoded images,
+ZIPs, XBRL support files) but older builds kept are not documents here.
+
+Corpus, Matter and Document give the same trees as objects. Their metadata
+is parsed from folder and file names once and kept in MANIFEST_FILE; a
+later Corpus() stats the matter folders and rescans only the ones whose
+listing changed, so it starts without walking the trees:
+
+    corpus = Corpus()
+    for document, text in corpus.texts(practice_area="IFG", doc_type="LPA"):
+        ...
+    for matter in corpus.matters(clients=range(14000, 16000)):
+        print(matter.name, len(matter))
+"""
+
+import json
+import os
+import re
+
+from process_sec_filings import document_policy
+
+CORPUS_ROOTS = ["./legal_test_matters", "./sec_filings_clean"]
+
+FIELDS = ["matter", "practice_area", "ticker", "form", "exhibit"]
+
+# Practice area by the first two digits of the client ID (see README)
+CLIENT_PRACTICE_AREAS = {"12": "IFG", "13": "IFG", "14": "LevFin", "15": "MandA"}
+
+# Folders written by download_legal_docs.py, e.g. M_and_A_3
+PILE_OF_LAW_AREAS = {"M_and_A": "MandA", "Funds": "IFG", "LevFin": "LevFin"}
+
+MATTER_RE = re.compile(r'^(\d{5})-\d{5}(?:_([A-Za-z]+))?')
+
+MANIFEST_FILE = "./corpus_manifest.json"
+# Bump when the manifest layout or the metadata parsed into it changes
+MANIFEST_VERSION = 1
+
+# Folder levels between a root and its matter folders (sec_filings_clean/<ticker>/<filing>)
+MATTER_DEPTH = {"sec_filings_clean": 2}
+
+# Binary documents; their text comes from extract_text.py
+BINARY_EXTENSIONS = ('.pdf', '.docx')
+
+NAME_RE = re.compile(r'^(\d{5})-(\d{5})(?:_(.*))?$')
+
+
+def find_documents(roots=CORPUS_ROOTS, extensions=('.txt',)):
+    """Return sorted [(doc_id, path)] for every document under the roots, skipping hidden files."""
+    documents = []
+    for root in roots:
+        base = os.path.dirname(os.path.normpath(root))
+        for folder, dirs, names in os.walk(root):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            for name in names:
+                if name.startswith('.') or not name.lower().endswith(tuple(extensions)):
+                    continue
+                path = os.path.join(folder, name)
+                doc_id = os.path.relpath(path, base or '.').replace(os.sep, '/')
+                if is_text_document(doc_id):
+                    documents.append((doc_id, path))
+    return sorted(documents)
+
+
+def is_text_document(doc_id):
+    """False for filing documents process_sec_filings would not keep as text."""
+    parts = doc_id.split('/')
+    if parts[0] != "sec_filings_clean" or len(parts) != 4:
+        return True
+    return is_text_filing_file(parts[3])
+
+
+def is_text_filing_file(name):
+    """Whether a '<TYPE>_<filename>.txt' file of a filing folder is kept as text."""
+    if '_' not in name:
+        return True
+    doc_type, filename = name.split('_', 1)
+    if filename.endswith('.txt'):
+        filename = filename[:-4]
+    return document_policy(doc_type, filename) == 'text'
+
+
+def practice_area(matter):
+    """Practice area code for a test matter folder name."""
+    match = MATTER_RE.match(matter)
+    if match:
+        if match.group(2) in CLIENT_PRACTICE_AREAS.values():
+            return match.group(2)
+        return CLIENT_PRACTICE_AREAS.get(match.group(1)[:2], "Mixed")
+    area = re.sub(r'_\d+$', '', matter)
+    return PILE_OF_LAW_AREAS.get(area, area)
+
+
+def document_fields(doc_id):
+    """Return {field: value} for a document ID; fields that do not apply are ''."""
+    fields = dict.fromkeys(FIELDS, '')
+    parts = doc_id.split('/')
+
+    if parts[0] == "sec_filings_clean" and len(parts) == 4:
+        ticker, filing, name = parts[1:]
+        fields.update(
+            matter=f"{ticker}/{filing}",
+            ticker=ticker,
+            form=filing.rsplit('_', 1)[0],
+            exhibit=name.split('_', 1)[0],
+        )
+    elif len(parts) >= 3:
+        fields.update(matter=parts[1], practice_area=practice_area(parts[1]))
+    return fields
+
+
+# ---------------------------------------------------------
+# CORPUS API
+# ---------------------------------------------------------
+def document_type(filename, exhibit=''):
+    """
+    A filing document's exhibit type, else the file name without HERO_,
+    a trailing _<number>, and extensions: 'HERO_LPA_3.txt' -> 'LPA'.
+    """
+    if exhibit:
+        return exhibit
+    stem = filename.split('.', 1)[0]
+    if stem.startswith('HERO_'):
+        stem = stem[len('HERO_'):]
+    return re.sub(r'_\d+$', '', stem)
+
+
+def matter_metadata(root_name, rel_path):
+    """Parse {name, client_id, matter_id, practice_area, description, ticker, form} from a matter folder path."""
+    name = rel_path.replace(os.sep, '/')
+    meta = {'name': name, 'client_id': None, 'matter_id': None, 'practice_area': '',
+            'description': '', 'ticker': '', 'form': ''}
+
+    if root_name == "sec_filings_clean":
+        ticker, filing = name.split('/', 1)
+        meta.update(ticker=ticker, form=filing.rsplit('_', 1)[0])
+        return meta
+
+    meta['practice_area'] = practice_area(name)
+    match = NAME_RE.match(name)
+    if match:
+        meta.update(client_id=int(match.group(1)), matter_id=int(match.group(2)))
+        rest = match.group(3) or ''
+        if rest.split('_', 1)[0] == meta['practice_area']:
+            rest = rest[len(meta['practice_area']):].lstrip('_')
+        meta['description'] = rest
+    return meta
+
+
+def list_documents(folder, root_name):
+    """[(file name, size)] of a matter folder's documents, sorted."""
+    names = set(os.listdir(folder))
+    documents = []
+    for name in sorted(names):
+        path = os.path.join(folder, name)
+        if name.startswith('.') or not os.path.isfile(path):
+            continue
+        lower = name.lower()
+        # Text extracted from a binary beside it belongs to that binary
+        if lower.endswith('.txt') and name[:-4] in names and lower[:-4].endswith(BINARY_EXTENSIONS):
+            continue
+        if lower.endswith('.txt'):
+            if root_name == "sec_filings_clean" and not is_text_filing_file(name):
+                continue
+        elif not lower.endswith(BINARY_EXTENSIONS):
+            continue
+        documents.append((name, os.path.getsize(path)))
+    return documents
+
+
+class Document:
+    """One document of a matter; its text is read only when asked for."""
+
+    __slots__ = ('matter', 'name', 'size', 'doc_type', 'hero')
+
+    def __init__(self, matter, name, size):
+        self.matter = matter
+        self.name = name
+        self.size = size
+        self.doc_type = document_type(name, name.split('_', 1)[0] if matter.ticker else '')
+        self.hero = name.startswith('HERO_')
+
+    def __repr__(self):
+        return f"Document({self.doc_id!r})"
+
+    @property
+    def doc_id(self):
+        return f"{self.matter.root_name}/{self.matter.name}/{self.name}"
+
+    @property
+    def path(self):
+        return os.path.join(self.matter.path, self.name)
+
+    @property
+    def is_binary(self):
+        return self.name.lower().endswith(BINARY_EXTENSIONS)
+
+    def text(self, cache=False):
+        """
+        The document's text. PDF and DOCX text comes from the extract_text
+        cache when it is current, else is extracted now; only with `cache`
+        is it written into the matter folder (as '<name>.txt' and a hidden
+        sidecar) for next time. Raises ImportError for a PDF without pypdf.
+        """
+        if self.is_binary:
+            from extract_text import load_text
+            return load_text(self.path, cache=cache)[0]
+        with open(self.path, 'r', encoding='utf-8', errors='ignore') as f:
+            return f.read()
+
+
+class Matter:
+    """A matter folder and the metadata parsed from its name."""
+
+    __slots__ = ('root', 'root_name', 'name', 'client_id', 'matter_id', 'practice_area',
+                 'description', 'ticker', 'form', 'entries')
+
+    def __init__(self, root, root_name, meta, entries):
+        self.root = root
+        self.root_name = root_name
+        self.name = meta['name']
+        self.client_id = meta['client_id']
+        self.matter_id = meta['matter_id']
+        self.practice_area = meta['practice_area']
+        self.description = meta['description']
+        self.ticker = meta['ticker']
+        self.form = meta['form']
+        self.entries = entries  # [(file name, size)]
+
+    def __repr__(self):
+        return f"Matter({self.root_name + '/' + self.name!r})"
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def path(self):
+        return os.path.join(self.root, self.name)
+
+    def documents(self, doc_type=None):
+        """Yield the matter's Documents, optionally only those of doc_type (a name or a tuple)."""
+        for name, size in self.entries:
+            document = Document(self, name, size)
+            if doc_type is None or matches(document.doc_type, doc_type):
+                yield document
+
+
+def matches(value, wanted):
+    """Case-insensitive match of value against one string or a tuple of them."""
+    wanted = (wanted,) if isinstance(wanted, str) else wanted
+    return value.lower() in {w.lower() for w in wanted}
+
+
+class Corpus:
+    """
+    The matters and documents under the corpus roots.
+
+    Loaded from the manifest; matter folders whose listing changed (their
+    modification time moved) are rescanned and the manifest rewritten, so
+    document sizes are as of the folder's last rescan. File contents are
+    never read until Document.text() is called, and nothing is written into
+    the matter folders unless a text is asked for with cache=True.
+    """
+
+    def __init__(self, roots=CORPUS_ROOTS, manifest=MANIFEST_FILE):
+        self.roots = roots
+        self.manifest = manifest
+        self._matters = []
+
+        cached = {}
+        if manifest and os.path.exists(manifest):
+            with open(manifest, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == MANIFEST_VERSION:
+                cached = data['folders']
+
+        folders = {}
+        for root in roots:
+            if not os.path.isdir(root):
+                continue
+            root_name = os.path.basename(os.path.normpath(root))
+            for rel_path in self._matter_folders(root, MATTER_DEPTH.get(root_name, 1), cached, folders):
+                key = f"{root_name}/{rel_path.replace(os.sep, '/')}"
+                mtime = os.stat(os.path.join(root, rel_path)).st_mtime_ns
+                entry = cached.get(key)
+                if not entry or entry.get('mtime') != mtime or 'meta' not in entry:
+                    entry = {
+                        'mtime': mtime,
+                        'meta': matter_metadata(root_name, rel_path),
+                        'documents': list_documents(os.path.join(root, rel_path), root_name),
+                    }
+                folders[key] = entry
+                self._matters.append(Matter(root, root_name, entry['meta'],
+                                            [tuple(doc) for doc in entry['documents']]))
+
+        if manifest and folders != cached:
+            tmp_file = manifest + '.tmp'
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump({'version': MANIFEST_VERSION, 'folders': folders}, f)
+            os.replace(tmp_file, manifest)
+
+    @staticmethod
+    def _matter_folders(root, depth, cached, folders, rel_path=''):
+        """
+        Relative paths of the folders `depth` levels below root. A container
+        folder whose modification time is unchanged is not listed again.
+        """
+        if depth == 0:
+            return [rel_path]
+        path = os.path.join(root, rel_path)
+        key = f"{os.path.basename(os.path.normpath(root))}/{rel_path.replace(os.sep, '/')}:"
+        mtime = os.stat(path).st_mtime_ns
+        entry = cached.get(key)
+        if entry and entry['mtime'] == mtime:
+            children = entry['children']
+        else:
+            children = sorted(name for name in os.listdir(path)
+                              if not name.startswith('.') and os.path.isdir(os.path.join(path, name)))
+        folders[key] = {'mtime': mtime, 'children': children}
+
+        found = []
+        for child in children:
+            found.extend(Corpus._matter_folders(root, depth - 1, cached, folders,
+                                                os.path.join(rel_path, child)))
+        return found
+
+    def __len__(self):
+        return len(self._matters)
+
+    def matters(self, practice_area=None, clients=None, ticker=None, form=None, root=None):
+        """
+        Yield matters matching every filter given: practice_area, ticker and
+        form (a name or a tuple of names), clients (anything supporting
+        `in` on the client ID, e.g. range(12000, 14000)) and root (the tree name).
+        """
+        for matter in self._matters:
+            if practice_area is not None and not matches(matter.practice_area, practice_area):
+                continue
+            if clients is not None and (matter.client_id is None or matter.client_id not in clients):
+                continue
+            if ticker is not None and not matches(matter.ticker, ticker):
+                continue
+            if form is not None and not matches(matter.form, form):
+                continue
+            if root is not None and matter.root_name != root:
+                continue
+            yield matter
+
+    def documents(self, doc_type=None, **filters):
+        """Yield the Documents of the matching matters (see matters()), optionally of doc_type."""
+        for matter in self.matters(**filters):
+            yield from matter.documents(doc_type)
+
+    def texts(self, doc_type=None, cache=False, on_error=None, **filters):
+        """
+        Yield (Document, text) one document at a time; only one text is held
+        at once. A PDF or DOCX whose text cannot be extracted (a PDF without
+        pypdf, a damaged file) is left out and passed with the exception to
+        on_error, which by default prints it. `cache` is as for Document.text().
+        """
+        for document in self.documents(doc_type, **filters):
+            try:
+                text = document.text(cache=cache)
+            except Exception as e:
+                if not document.is_binary:
+                    raise
+                if on_error is None:
+                    print(f"  Skipped {document.doc_id}: {type(e).__name__}: {e}")
+                else:
+                    on_error(document, e)
+                continue
+            yield document, text
@@ -0,0 +1,522 @@
+"""
+Persistent inverted full-text index over legal_test_matters and sec_filings_clean.
+
+Every word position of every document is indexed, so phrase and boolean
+queries are answered from the index instead of by reading the corpus:
+
+    python corpus_index.py --update
+    python corpus_index.py '"most favored nation" area:IFG'
+    python corpus_index.py '(indemnification OR indemnify) AND NOT form:8-K'
+    python corpus_index.py 'exhibit:EX-10* "credit agreement"' --limit 20
+
+Queries combine words, "quoted phrases" and field:value filters (matter,
+practice_area or area, ticker, form, exhibit; a trailing * matches a
+prefix; any other x:y is searched as words) with AND (the default between
+terms), OR, NOT or a leading -, and parentheses. Matching is
+case-insensitive on \\w+ words.
+
+The index is a folder of segments. Each update writes one segment for the
+new and changed documents and drops removed or changed ones from the
+document table; their old postings are ignored until compaction merges the
+segments. A segment holds:
+
+    <name>.postings  each term's delta-coded document numbers, per-document
+                     counts and delta-coded positions as uint32s, in term
+                     order, zlib-compressed in blocks of about 64 KB
+    <name>.terms     the term dictionary, split into hash buckets that are
+                     compressed separately, so a lookup reads one bucket
+"""
+
+import argparse
+import heapq
+import json
+import os
+import re
+import sys
+import time
+import zlib
+from array import array
+
+from corpus import CORPUS_ROOTS, FIELDS, document_fields, find_documents
+
+INDEX_PATH = "./corpus_index"
+META_FILE = "index.json"
+
+TERM_BUCKETS = 4096
+BLOCK_SIZE = 64 * 1024  # Uncompressed postings bytes per zlib block
+SEGMENT_TOKENS = 2 * 1024 * 1024  # Token positions buffered before a segment is written
+MAX_SEGMENTS = 16  # More than this, or mostly dead postings, and update() compacts
+
+FIELD_ALIASES = {"area": "practice_area"}
+
+WORD_RE = re.compile(r'\w+')
+# Groups: leading '-', '(', ')', "phrase", word or field:value
+QUERY_RE = re.compile(r'\s*(-)?(?:(\()|(\))|"([^"]*)"|([^\s()"]+))')
+
+
+def tokenize(text):
+    return WORD_RE.findall(text.lower())
+
+
+def is_field_filter(token):
+    """Whether a query token is field:value for a known field."""
+    field, sep, value = token.partition(':')
+    return bool(sep and value) and FIELD_ALIASES.get(field.lower(), field.lower()) in FIELDS
+
+
+def term_bucket(term):
+    return zlib.crc32(term.encode('utf-8')) % TERM_BUCKETS
+
+
+def encode_postings(postings):
+    """Pack [(doc number, [positions])] (doc numbers ascending) into bytes."""
+    values = array('I', [len(postings)])
+    previous = 0
+    for doc, _ in postings:
+        values.append(doc - previous)
+        previous = doc
+    values.extend(len(positions) for _, positions in postings)
+    for _, positions in postings:
+        previous = 0
+        for position in positions:
+            values.append(position - previous)
+            previous = position
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes()
+
+
+def decode_postings(data):
+    """Unpack bytes written by encode_postings into {doc number: [positions]}."""
+    values = array('I')
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+
+    n = values[0]
+    docs = []
+    previous = 0
+    for delta in values[1:n + 1]:
+        previous += delta
+        docs.append(previous)
+
+    postings = {}
+    i = 2 * n + 1
+    for doc, count in zip(docs, values[n + 1:2 * n + 1]):
+        positions = []
+        previous = 0
+        for delta in values[i:i + count]:
+            previous += delta
+            positions.append(previous)
+        postings[doc] = positions
+        i += count
+    return postings
+
+
+class Segment:
+    """One immutable segment file pair of the index."""
+
+    def __init__(self, path, name, buckets, docs):
+        self.path = path
+        self.name = name
+        self.buckets = buckets  # [(offset, length)] into the .terms file
+        self.docs = docs  # Document numbers indexed in this segment
+        self.cache = {}
+        self.postings_file = None
+        self.block = (None, b'')  # Last decompressed postings block
+
+    def terms(self, bucket):
+        """The {term: [block offset, block length, start, length]} dictionary of one bucket."""
+        if bucket not in self.cache:
+            offset, length = self.buckets[bucket]
+            with open(os.path.join(self.path, self.name + '.terms'), 'rb') as f:
+                f.seek(offset)
+                self.cache[bucket] = json.loads(zlib.decompress(f.read(length))) if length else {}
+        return self.cache[bucket]
+
+    def read(self, entry):
+        offset, length, start, size = entry
+        if self.block[0] != offset:
+            if self.postings_file is None:
+                self.postings_file = open(os.path.join(self.path, self.name + '.postings'), 'rb')
+            self.postings_file.seek(offset)
+            self.block = (offset, zlib.decompress(self.postings_file.read(length)))
+        return decode_postings(self.block[1][start:start + size])
+
+    def postings(self, term):
+        """{doc number: [positions]} for a term, empty if the segment lacks it."""
+        entry = self.terms(term_bucket(term)).get(term)
+        return self.read(entry) if entry else {}
+
+    def sorted_terms(self):
+        """Yield (term, entry) in term order, which is the order of the postings file."""
+        entries = []
+        for bucket in range(TERM_BUCKETS):
+            entries.extend(self.terms(bucket).items())
+            self.cache.pop(bucket)
+        entries.sort(key=lambda item: (item[1][0], item[1][2]))
+        return entries
+
+    def close(self):
+        if self.postings_file is not None:
+            self.postings_file.close()
+            self.postings_file = None
+
+    def remove_files(self):
+        self.close()
+        for ext in ('.terms', '.postings'):
+            path = os.path.join(self.path, self.name + ext)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def write_segment(path, name, postings):
+    """
+    Write (term, [(doc number, [positions])]) pairs, in term order, as a
+    segment; returns its bucket table.
+    """
+    buckets = [{} for _ in range(TERM_BUCKETS)]
+    with open(os.path.join(path, name + '.postings'), 'wb') as f:
+        block = bytearray()
+        pending = []
+
+        def flush():
+            data = zlib.compress(block)
+            offset = f.tell()
+            for term, start, size in pending:
+                buckets[term_bucket(term)][term] = [offset, len(data), start, size]
+            f.write(data)
+            block.clear()
+            pending.clear()
+
+        for term, term_postings in postings:
+            data = encode_postings(term_postings)
+            pending.append((term, len(block), len(data)))
+            block += data
+            if len(block) >= BLOCK_SIZE:
+                flush()
+        if pending:
+            flush()
+
+    table = []
+    with open(os.path.join(path, name + '.terms'), 'wb') as f:
+        for terms in buckets:
+            data = zlib.compress(json.dumps(terms, separators=(',', ':')).encode('utf-8')) if terms else b''
+            table.append((f.tell(), len(data)))
+            f.write(data)
+    return table
+
+
+class CorpusIndex:
+    """
+    On-disk positional index of the corpus.
+
+    docs maps document numbers to {'id', 'size', 'mtime', 'fields'}; only
+    numbers in docs are live, whatever the segments still hold.
+    """
+
+    def __init__(self, path=INDEX_PATH):
+        self.path = path
+        self.docs = {}
+        self.next_doc = 0
+        self.next_segment = 0
+        self.segments = []
+
+        meta_file = os.path.join(path, META_FILE)
+        if os.path.exists(meta_file):
+            with open(meta_file, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            self.docs = {int(doc): info for doc, info in meta['docs'].items()}
+            self.next_doc = meta['next_doc']
+            self.next_segment = meta['next_segment']
+            self.segments = [Segment(path, name, buckets, docs)
+                             for name, buckets, docs in meta['segments']]
+
+    def __len__(self):
+        return len(self.docs)
+
+    def save(self):
+        """Write the document table and segment list atomically."""
+        meta = {
+            'next_doc': self.next_doc,
+            'next_segment': self.next_segment,
+            'docs': self.docs,
+            'segments': [(segment.name, segment.buckets, segment.docs) for segment in self.segments],
+        }
+        meta_file = os.path.join(self.path, META_FILE)
+        tmp_file = meta_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_file, meta_file)
+
+    # -----------------------------------------------------
+    # Updating
+    # -----------------------------------------------------
+    def _flush(self, postings, docs):
+        """Write a new segment from (term, postings) pairs in term order."""
+        if docs:
+            name = f"seg_{self.next_segment:05d}"
+            self.next_segment += 1
+            self.segments.append(Segment(self.path, name, write_segment(self.path, name, postings), docs))
+
+    def update(self, roots=CORPUS_ROOTS, verbose=False):
+        """
+        Bring the index up to date with the documents under roots: new and
+        changed files are indexed, removed ones dropped. Returns
+        (added, changed, removed) counts.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        by_id = {info['id']: doc for doc, info in self.docs.items()}
+
+        found = {}
+        changed = []
+        for doc_id, path in find_documents(roots):
+            st = os.stat(path)
+            found[doc_id] = path
+            doc = by_id.get(doc_id)
+            if doc is None:
+                changed.append((doc_id, path, st))
+            elif (self.docs[doc]['size'], self.docs[doc]['mtime']) != (st.st_size, st.st_mtime_ns):
+                del self.docs[doc]
+                changed.append((doc_id, path, st))
+
+        removed = [doc for doc_id, doc in by_id.items() if doc_id not in found]
+        for doc in removed:
+            del self.docs[doc]
+
+        postings = {}
+        docs = []
+        buffered = 0
+        for doc_id, path, st in changed:
+            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+                words = tokenize(f.read())
+            doc = self.next_doc
+            self.next_doc += 1
+            docs.append(doc)
+            self.docs[doc] = {'id': doc_id, 'size': st.st_size, 'mtime': st.st_mtime_ns,
+                              'fields': document_fields(doc_id)}
+
+            positions = {}
+            for position, word in enumerate(words):
+                positions.setdefault(word, []).append(position)
+            for word, found_at in positions.items():
+                postings.setdefault(word, []).append((doc, found_at))
+
+            buffered += len(words)
+            if buffered >= SEGMENT_TOKENS:
+                self._flush(sorted(postings.items()), docs)
+                postings, docs, buffered = {}, [], 0
+            if verbose:
+                print(f"  indexed {doc_id} ({len(words)} words)")
+        self._flush(sorted(postings.items()), docs)
+
+        self.save()
+        self.compact(only_if_needed=True)
+        added = sum(1 for doc_id, _, _ in changed if doc_id not in by_id)
+        return added, len(changed) - added, len(removed)
+
+    def compact(self, only_if_needed=False):
+        """
+        Merge every segment into one, leaving out postings of documents no
+        longer in the index. With only_if_needed, merge only when there are
+        too many segments or less than half the indexed documents are live.
+        """
+        if only_if_needed:
+            indexed = sum(len(segment.docs) for segment in self.segments)
+            if len(self.segments) <= MAX_SEGMENTS and len(self.docs) * 2 >= indexed:
+                return False
+
+        old = self.segments
+
+        # Walk the segments' term lists together; segments hold ascending
+        # document numbers in creation order, so concatenating each term's
+        # postings keeps them sorted
+        def merged():
+            streams = [[(term, i, entry) for term, entry in segment.sorted_terms()]
+                       for i, segment in enumerate(old)]
+            term, live = None, []
+            for next_term, i, entry in heapq.merge(*streams):
+                if next_term != term:
+                    if live:
+                        yield term, live
+                    term, live = next_term, []
+                live.extend((doc, positions) for doc, positions in old[i].read(entry).items()
+                            if doc in self.docs)
+            if live:
+                yield term, live
+
+        docs = sorted(doc for segment in old for doc in segment.docs if doc in self.docs)
+        self.segments = []
+        self._flush(merged(), docs)
+        self.save()
+        for segment in old:
+            segment.remove_files()
+        return True
+
+    # -----------------------------------------------------
+    # Searching
+    # -----------------------------------------------------
+    def postings(self, term):
+        """{doc number: [positions]} for a word across segments, live documents only."""
+        merged = {}
+        for segment in self.segments:
+            for doc, positions in segment.postings(term).items():
+                if doc in self.docs:
+                    merged[doc] = positions
+        return merged
+
+    def phrase_docs(self, phrase):
+        """{doc number: number of occurrences} for a phrase of one or more words."""
+        words = tokenize(phrase)
+        if not words:
+            return {}
+        lists = [self.postings(word) for word in words]
+        docs = set(lists[0]).intersection(*lists[1:])
+
+        found = {}
+        for doc in docs:
+            starts = set(lists[0][doc])
+            for offset, postings in enumerate(lists[1:], 1):
+                starts &= {position - offset for position in postings[doc]}
+                if not starts:
+                    break
+            if starts:
+                found[doc] = len(starts)
+        return found
+
+    def field_docs(self, field, value):
+        field = FIELD_ALIASES.get(field.lower(), field.lower())
+        if field not in FIELDS:
+            raise ValueError(f"unknown field {field!r}; use one of {', '.join(FIELDS)}")
+        value = value.lower()
+        if value.endswith('*'):
+            return {doc for doc, info in self.docs.items()
+                    if info['fields'][field].lower().startswith(value[:-1])}
+        return {doc for doc, info in self.docs.items() if info['fields'][field].lower() == value}
+
+    def search(self, query):
+        """
+        Return matching documents as [{'id', 'fields', 'hits'}], most hits
+        first; hits counts the words and phrases of the query found.
+        """
+        tokens = [match for match in QUERY_RE.finditer(query) if match.group().strip()]
+        if not tokens or sum(len(match.group()) for match in tokens) != len(query.rstrip()):
+            raise ValueError(f"cannot parse query {query!r}")
+        hits = {}
+        docs = QueryParser(self, tokens, hits).parse()
+        results = [{'id': self.docs[doc]['id'], 'fields': self.docs[doc]['fields'],
+                    'hits': hits.get(doc, 0)} for doc in docs]
+        return sorted(results, key=lambda result: (-result['hits'], result['id']))
+
+
+class QueryParser:
+    """
+    Recursive-descent evaluation of a tokenized query:
+
+        query  := and ('OR' and)*
+        and    := unary (['AND'] unary)*
+        unary  := ('NOT' | '-') unary | '(' query ')' | phrase | field:value | word
+    """
+
+    def __init__(self, index, tokens, hits):
+        self.index = index
+        self.tokens = tokens
+        self.i = 0
+        self.hits = hits
+
+    def peek(self):
+        return self.tokens[self.i] if self.i < len(self.tokens) else None
+
+    def keyword(self, word):
+        token = self.peek()
+        if token and token.group(5) == word and not token.group(1):
+            self.i += 1
+            return True
+        return False
+
+    def parse(self):
+        docs = self.query()
+        if self.peek() is not None:
+            raise ValueError(f"unexpected {self.peek().group().strip()!r} in query")
+        return docs
+
+    def query(self):
+        docs = self.conjunction()
+        while self.keyword('OR'):
+            docs = docs | self.conjunction()
+        return docs
+
+    def conjunction(self):
+        docs = self.unary()
+        while True:
+            token = self.peek()
+            if token is None or token.group(3) or (token.group(5) == 'OR' and not token.group(1)):
+                return docs
+            self.keyword('AND')
+            docs = docs & self.unary()
+
+    def unary(self):
+        token = self.peek()
+        if token is None:
+            raise ValueError("query ends too early")
+        if self.keyword('NOT'):
+            return set(self.index.docs) - self.unary()
+        self.i += 1
+
+        if token.group(2):
+            docs = self.query()
+            end = self.peek()
+            if end is None or not end.group(3) or end.group(1):
+                raise ValueError("missing ')' in query")
+            self.i += 1
+            found = dict.fromkeys(docs, 0)
+        elif token.group(3):
+            raise ValueError("unexpected ')' in query")
+        elif token.group(4) is not None:
+            found = self.index.phrase_docs(token.group(4))
+        elif is_field_filter(token.group(5)):
+            field, value = token.group(5).split(':', 1)
+            found = dict.fromkeys(self.index.field_docs(field, value), 0)
+        else:
+            # Plain words, including ones like 10:30 that only look like a filter
+            found = self.index.phrase_docs(token.group(5))
+
+        if token.group(1):
+            return set(self.index.docs) - set(found)
+        for doc, count in found.items():
+            self.hits[doc] = self.hits.get(doc, 0) + count
+        return set(found)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search the corpus through its inverted index.")
+    parser.add_argument("query", nargs="?", help="words, \"phrases\", field:value, AND/OR/NOT, ( )")
+    parser.add_argument("--update", action="store_true",
+                        help="index new and changed documents first (done automatically the first time)")
+    parser.add_argument("--compact", action="store_true", help="merge all segments into one")
+    parser.add_argument("--index", default=INDEX_PATH, help=f"index folder (default: {INDEX_PATH})")
+    parser.add_argument("--limit", type=int, default=50, help="results to print (default: 50)")
+    args = parser.parse_args()
+
+    index = CorpusIndex(args.index)
+    if args.update or not index.segments:
+        added, changed, removed = index.update()
+        print(f"Indexed {added} new and {changed} changed documents, dropped {removed}; "
+              f"{len(index)} documents in {len(index.segments)} segment(s)")
+    if args.compact:
+        index.compact()
+
+    if args.query:
+        start = time.perf_counter()
+        try:
+            results = index.search(args.query)
+        except ValueError as e:
+            parser.error(str(e))
+        elapsed = (time.perf_counter() - start) * 1000
+        for result in results[:args.limit]:
+            print(f"{result['hits']:6d}  {result['id']}")
+        print(f"\n{len(results)} documents ({elapsed:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Parquet export of the corpus, partitioned by practice area, and its reader.
+
+export() writes one row per document under legal_test_matters and
+sec_filings_clean (see corpus.Corpus) to
+
+    corpus_parquet/practice_area=<area>/part-0.parquet
+
+with the columns of schema(). Metadata string columns are dictionary-encoded
+and every column is zstd-compressed. Because Parquet stores each column
+separately, a scan that leaves out 'text' never reads a document body,
+and a practice_area filter only opens that partition:
+
+    python corpus_parquet.py --export
+    python corpus_parquet.py --where practice_area=IFG --columns doc_id,exhibit,length
+    python corpus_parquet.py --where ticker=KKR --where form=10-K
+    python corpus_parquet.py --where client_id=12001 --where hero=true
+
+Filings have no practice area; they are stored under 'Unassigned'. Needs
+the pyarrow package.
+"""
+
+import argparse
+import os
+import shutil
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+from corpus import CORPUS_ROOTS, Corpus
+
+PARQUET_PATH = "./corpus_parquet"
+UNASSIGNED = "Unassigned"
+
+BATCH_ROWS = 256  # Documents buffered per partition before a row group is written
+ZSTD_LEVEL = 9
+
+# Metadata columns worth a dictionary: few distinct values, repeated per row
+DICTIONARY_COLUMNS = ['matter', 'practice_area', 'ticker', 'form', 'accession', 'exhibit', 'doc_type']
+
+COLUMNS = ['doc_id', 'matter', 'practice_area', 'client_id', 'ticker', 'form', 'accession',
+           'exhibit', 'doc_type', 'hero', 'length', 'text']
+
+
+def require_pyarrow():
+    if pa is None:
+        raise ImportError("pip install pyarrow to export or read the Parquet corpus")
+
+
+def schema():
+    require_pyarrow()
+    return pa.schema([
+        ('doc_id', pa.string()),
+        ('matter', pa.string()),
+        ('practice_area', pa.string()),
+        ('client_id', pa.int32()),
+        ('ticker', pa.string()),
+        ('form', pa.string()),
+        ('accession', pa.string()),
+        ('exhibit', pa.string()),
+        ('doc_type', pa.string()),
+        ('hero', pa.bool_()),
+        ('length', pa.int64()),
+        ('text', pa.large_string()),
+    ])
+
+
+def document_row(document, text):
+    """The Parquet row of a corpus Document."""
+    matter = document.matter
+    accession = matter.name.rsplit('_', 1)[-1] if matter.ticker else ''
+    return {
+        'doc_id': document.doc_id,
+        'matter': matter.name,
+        'practice_area': matter.practice_area or UNASSIGNED,
+        'client_id': matter.client_id,
+        'ticker': matter.ticker,
+        'form': matter.form,
+        'accession': accession,
+        'exhibit': document.doc_type if matter.ticker else '',
+        'doc_type': document.doc_type,
+        'hero': document.hero,
+        'length': len(text),
+        'text': text,
+    }
+
+
+def export(out_path=PARQUET_PATH, roots=CORPUS_ROOTS):
+    """
+    Write the corpus to out_path, replacing an earlier export. Documents
+    are read one at a time and written in row groups of BATCH_ROWS; a PDF
+    or DOCX whose text cannot be extracted is reported and left out.
+    Returns {practice area: rows}.
+    """
+    table_schema = schema()
+    if os.path.exists(out_path):
+        shutil.rmtree(out_path)
+
+    writers = {}
+    buffers = {}
+    counts = {}
+
+    def flush(area):
+        rows = buffers.pop(area, [])
+        if not rows:
+            return
+        if area not in writers:
+            folder = os.path.join(out_path, f"practice_area={area}")
+            os.makedirs(folder, exist_ok=True)
+            writers[area] = pq.ParquetWriter(
+                os.path.join(folder, "part-0.parquet"),
+                # The partition folder carries practice_area
+                table_schema.remove(table_schema.get_field_index('practice_area')),
+                compression='zstd',
+                compression_level=ZSTD_LEVEL,
+                use_dictionary=[c for c in DICTIONARY_COLUMNS if c != 'practice_area'],
+            )
+        columns = {name: [row[name] for row in rows] for name in COLUMNS if name != 'practice_area'}
+        writers[area].write_table(pa.table(columns, schema=writers[area].schema))
+
+    try:
+        for document, text in Corpus(roots).texts():
+            row = document_row(document, text)
+            area = row['practice_area']
+            buffers.setdefault(area, []).append(row)
+            counts[area] = counts.get(area, 0) + 1
+            if len(buffers[area]) >= BATCH_ROWS:
+                flush(area)
+        for area in list(buffers):
+            flush(area)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return counts
+
+
+def dataset(path=PARQUET_PATH):
+    """The exported corpus as a pyarrow dataset with practice_area from the folder names."""
+    require_pyarrow()
+    return ds.dataset(path, format='parquet',
+                      partitioning=ds.partitioning(pa.schema([('practice_area', pa.string())]),
+                                                   flavor='hive'))
+
+
+def where(**equals):
+    """
+    A filter expression requiring each column to equal the given value, or
+    to be one of the values when a list or tuple is given.
+    """
+    expression = None
+    for column, value in equals.items():
+        if isinstance(value, (list, tuple, set)):
+            term = ds.field(column).isin(list(value))
+        else:
+            term = ds.field(column) == value
+        expression = term if expression is None else expression & term
+    return expression
+
+
+def parse_condition(condition):
+    """
+    Split a COLUMN=VALUE condition into (column, value), with the value
+    converted to the column's type in schema(). Raises ValueError for an
+    unknown column or a value that does not fit it.
+    """
+    column, sep, value = condition.partition('=')
+    if not sep:
+        raise ValueError(f"expected COLUMN=VALUE, got {condition!r}")
+    table_schema = schema()
+    if table_schema.get_field_index(column) < 0:
+        raise ValueError(f"unknown column {column!r}; columns are {', '.join(COLUMNS)}")
+    field_type = table_schema.field(column).type
+    if pa.types.is_boolean(field_type):
+        lowered = value.lower()
+        if lowered not in ('true', 'false', '1', '0'):
+            raise ValueError(f"{column} is true or false, got {value!r}")
+        return column, lowered in ('true', '1')
+    if pa.types.is_integer(field_type):
+        try:
+            return column, int(value)
+        except ValueError:
+            raise ValueError(f"{column} is an integer, got {value!r}") from None
+    return column, value
+
+
+def read(path=PARQUET_PATH, columns=None, **equals):
+    """
+    Read the rows matching the equality filters as a pyarrow Table, with
+    only the given columns; leave out 'text' and no document body is read.
+    """
+    return dataset(path).to_table(columns=columns, filter=where(**equals))
+
+
+def read_metadata(path=PARQUET_PATH, **equals):
+    """Every column except the document text."""
+    return read(path, [c for c in COLUMNS if c != 'text'], **equals)
+
+
+def iter_batches(path=PARQUET_PATH, columns=None, batch_size=BATCH_ROWS, **equals):
+    """Yield RecordBatches of the matching rows, so the texts never all sit in memory."""
+    yield from dataset(path).to_batches(columns=columns, filter=where(**equals), batch_size=batch_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the corpus to Parquet or query the export.")
+    parser.add_argument("--export", action="store_true", help="(re)write the Parquet export")
+    parser.add_argument("--path", default=PARQUET_PATH, help=f"export folder (default: {PARQUET_PATH})")
+    parser.add_argument("--where", action="append", default=[], metavar="COLUMN=VALUE",
+                        help="keep rows where COLUMN equals VALUE (repeatable)")
+    parser.add_argument("--columns", default="doc_id,practice_area,exhibit,hero,length",
+                        help="comma-separated columns to print")
+    parser.add_argument("--limit", type=int, default=20, help="rows to print (default: 20)")
+    args = parser.parse_args()
+
+    if args.export:
+        counts = export(args.path)
+        for area, count in sorted(counts.items()):
+            print(f"  practice_area={area}: {count} documents")
+        print(f"Exported {sum(counts.values())} documents to {args.path}")
+
+    if args.where or not args.export:
+        try:
+            equals = dict(parse_condition(condition) for condition in args.where)
+        except ValueError as e:
+            parser.error(str(e))
+        table = read(args.path, args.columns.split(','), **equals)
+        for row in table.slice(0, args.limit).to_pylist():
+            print("  ".join(str(value) for value in row.values()))
+        print(f"\n{table.num_rows} rows")
+
+
+if __name__ == "__main__":
+    main()
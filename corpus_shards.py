@@ -0,0 +1,327 @@
+"""
+Packed, compressed shards of the corpus with a random-access reader.
+
+pack() writes every document under legal_test_matters and
+sec_filings_clean into a few shard files, so consumers make a handful of
+large reads instead of opening and stat-ing each small .txt file. A shard
+is laid out as
+
+    MAGIC, header length (uint32 LE), header JSON, compressed blocks
+
+The header holds the codec, the block table [(offset, length)] and, per
+document, its ID, fields (see corpus.py), block number, offset and size
+within the uncompressed block. Documents are packed into blocks of about
+BLOCK_SIZE bytes, each compressed on its own: reading one document
+decompresses one block, and streaming decompresses every block once.
+
+Blocks are zstd frames when the zstandard package is installed, else
+zlib streams; the codec is recorded per shard, so readers handle both.
+
+Shards save file opens, not time spent decompressing: on this machine with
+the zlib fallback, streaming the 951 documents (37 MB, 7.9 MB packed) took
+about 0.18 s from the shards against 0.05 s from the plain files when they
+are in the page cache. The shards pay off on cold or networked storage.
+
+    python corpus_shards.py --pack
+    python corpus_shards.py --get 'legal_test_matters/15001-00002_MandA/HERO_Merger_Agreement.txt'
+    python corpus_shards.py --bench
+"""
+
+import argparse
+import json
+import mmap
+import os
+import shutil
+import struct
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from corpus import CORPUS_ROOTS, document_fields, find_documents
+
+SHARD_PATH = "./corpus_shards"
+SHARD_SIZE = 64 * 1024 * 1024  # Uncompressed bytes per shard
+BLOCK_SIZE = 256 * 1024  # Uncompressed bytes per compressed block
+
+MAGIC = b'LEGALSHD'
+ZSTD_LEVEL = 10
+ZLIB_LEVEL = 6
+
+
+def compressor(codec):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ImportError("zstd shards need the zstandard package; pip install zstandard or use --codec zlib")
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress
+    return lambda data: zlib.compress(data, ZLIB_LEVEL)
+
+
+def decompressor(codec):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ImportError("this shard is zstd-compressed; pip install zstandard to read it")
+        return zstandard.ZstdDecompressor().decompress
+    if codec == 'zlib':
+        return zlib.decompress
+    raise ValueError(f"unknown shard codec {codec!r}")
+
+
+# ---------------------------------------------------------
+# WRITING
+# ---------------------------------------------------------
+def write_shard(path, documents, codec):
+    """
+    Write [(doc_id, data bytes)] as one shard; returns the number of
+    compressed bytes written.
+    """
+    compress = compressor(codec)
+    blocks = []
+    entries = []
+    block = bytearray()
+
+    def flush():
+        if block:
+            blocks.append(compress(bytes(block)))
+            block.clear()
+
+    for doc_id, data in documents:
+        if block and len(block) + len(data) > BLOCK_SIZE:
+            flush()
+        entries.append({
+            'id': doc_id,
+            'fields': document_fields(doc_id),
+            'block': len(blocks),
+            'offset': len(block),
+            'size': len(data),
+        })
+        block += data
+    flush()
+
+    offsets = []
+    position = 0
+    for data in blocks:
+        offsets.append((position, len(data)))
+        position += len(data)
+    header = json.dumps({'codec': codec, 'blocks': offsets, 'documents': entries},
+                        separators=(',', ':')).encode('utf-8')
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(header)))
+        f.write(header)
+        for data in blocks:
+            f.write(data)
+    os.replace(tmp_path, path)
+    return position
+
+
+def pack(roots=CORPUS_ROOTS, out_path=SHARD_PATH, shard_size=SHARD_SIZE, codec=None):
+    """
+    Pack every document under roots into shards in out_path, replacing the
+    folder. Returns (documents, uncompressed bytes, compressed bytes).
+
+    The shards are written to a temporary folder that is swapped in at the
+    end, so readers never see a half-written set and a failed pack keeps
+    the old one.
+    """
+    codec = codec or ('zstd' if zstandard is not None else 'zlib')
+    compressor(codec)  # Fail before writing anything
+    out_path = os.path.normpath(out_path)
+    tmp_path = out_path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    documents = find_documents(roots)
+    raw = packed = number = 0
+    shard, shard_bytes = [], 0
+    for i, (doc_id, path) in enumerate(documents):
+        with open(path, 'rb') as f:
+            data = f.read()
+        shard.append((doc_id, data))
+        shard_bytes += len(data)
+        raw += len(data)
+
+        if shard_bytes >= shard_size or i == len(documents) - 1:
+            name = f"corpus-{number:05d}.shard"
+            packed += write_shard(os.path.join(tmp_path, name), shard, codec)
+            print(f"  {name}: {len(shard)} documents, {shard_bytes / 1e6:.1f} MB")
+            number += 1
+            shard, shard_bytes = [], 0
+
+    # Directories cannot be replaced in one rename: move the old one aside first
+    old_path = out_path + '.old'
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(out_path):
+        os.rename(out_path, old_path)
+    os.rename(tmp_path, out_path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    return len(documents), raw, packed
+
+
+# ---------------------------------------------------------
+# READING
+# ---------------------------------------------------------
+class ShardReader:
+    """Memory-mapped reader of one shard file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a corpus shard")
+
+        (length,) = struct.unpack_from('<I', self.map, len(MAGIC))
+        start = len(MAGIC) + 4
+        header = json.loads(self.map[start:start + length])
+        self.data_start = start + length
+        self.codec = header['codec']
+        self.decompress = decompressor(self.codec)
+        self.blocks = header['blocks']
+        self.documents = header['documents']
+        self.by_id = {entry['id']: entry for entry in self.documents}
+        self.cached = (None, b'')  # Last decompressed block
+
+    def __len__(self):
+        return len(self.documents)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.by_id
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def block(self, number):
+        """Decompressed bytes of a block; the last one read is kept."""
+        if self.cached[0] != number:
+            offset, length = self.blocks[number]
+            start = self.data_start + offset
+            self.cached = (number, self.decompress(self.map[start:start + length]))
+        return self.cached[1]
+
+    def read_bytes(self, doc_id):
+        entry = self.by_id[doc_id]
+        block = self.block(entry['block'])
+        return block[entry['offset']:entry['offset'] + entry['size']]
+
+    def read(self, doc_id):
+        """Text of a document by ID."""
+        return self.read_bytes(doc_id).decode('utf-8', errors='ignore')
+
+    def fields(self, doc_id):
+        return self.by_id[doc_id]['fields']
+
+    def __iter__(self):
+        """Yield (doc_id, text) for every document, decompressing each block once."""
+        for entry in self.documents:
+            block = self.block(entry['block'])
+            data = block[entry['offset']:entry['offset'] + entry['size']]
+            yield entry['id'], data.decode('utf-8', errors='ignore')
+
+
+class CorpusShards:
+    """All shards in a folder, read as one corpus."""
+
+    def __init__(self, path=SHARD_PATH):
+        names = sorted(name for name in os.listdir(path) if name.endswith('.shard'))
+        self.shards = [ShardReader(os.path.join(path, name)) for name in names]
+        self.by_id = {doc_id: shard for shard in self.shards for doc_id in shard.by_id}
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.by_id
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+
+    def ids(self):
+        return [entry['id'] for shard in self.shards for entry in shard.documents]
+
+    def read(self, doc_id):
+        """Text of a document by ID."""
+        return self.by_id[doc_id].read(doc_id)
+
+    def fields(self, doc_id):
+        return self.by_id[doc_id].fields(doc_id)
+
+    def __iter__(self):
+        """Yield (doc_id, text) for every document, shard by shard."""
+        for shard in self.shards:
+            yield from shard
+
+    def select(self, **fields):
+        """Yield (doc_id, text) for documents whose fields equal the given values."""
+        for shard in self.shards:
+            for entry in shard.documents:
+                if all(entry['fields'].get(field) == value for field, value in fields.items()):
+                    yield entry['id'], shard.read(entry['id'])
+
+
+def benchmark(roots=CORPUS_ROOTS, path=SHARD_PATH):
+    """Time reading the whole corpus from the trees and from the shards; returns {name: seconds}."""
+    results = {}
+
+    start = time.perf_counter()
+    for _, file_path in find_documents(roots):
+        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+            f.read()
+    results['files'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with CorpusShards(path) as shards:
+        for _ in shards:
+            pass
+    results['shards'] = time.perf_counter() - start
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack the corpus into compressed shards and read it back.")
+    parser.add_argument("--pack", action="store_true", help="(re)write the shards from the corpus trees")
+    parser.add_argument("--get", metavar="DOC_ID", help="print one document")
+    parser.add_argument("--bench", action="store_true", help="compare reading the trees and the shards")
+    parser.add_argument("--path", default=SHARD_PATH, help=f"shard folder (default: {SHARD_PATH})")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE // (1024 * 1024),
+                        help=f"MB of documents per shard (default: {SHARD_SIZE // (1024 * 1024)})")
+    parser.add_argument("--codec", choices=['zstd', 'zlib'],
+                        help="block compression (default: zstd if installed, else zlib)")
+    args = parser.parse_args()
+
+    if args.pack:
+        count, raw, packed = pack(out_path=args.path, shard_size=args.shard_size * 1024 * 1024,
+                                  codec=args.codec)
+        print(f"Packed {count} documents: {raw / 1e6:.1f} MB -> {packed / 1e6:.1f} MB")
+
+    if args.get:
+        with CorpusShards(args.path) as shards:
+            print(shards.read(args.get))
+
+    if args.bench:
+        for name, seconds in benchmark(path=args.path).items():
+            print(f"  {name:8s} {seconds * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
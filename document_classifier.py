@@ -0,0 +1,604 @@
+"""
+Hashed TF-IDF linear classifier for practice areas and document types.
+
+The keyword rules in download_legal_docs.py and download_fund_sec_filings.py
+look at the first few KB of a document and take the first rule that
+matches. This model reads the whole document instead: its lowercased words
+and word pairs are hashed into 2**FEATURE_BITS features (a 64-bit
+polynomial hash of their bytes, so the same in every process) and weighted
+by sublinear TF-IDF; the document's
+DOC_FEATURES heaviest features, L2-normalized, are scored by one
+multinomial logistic regression per head:
+
+    practice_area  IFG, LevFin or MandA (the Mixed client matters are left out)
+    doc_type       the document type of the file name (see corpus.document_type),
+                   with types seen fewer than MIN_EXAMPLES times pooled as Other
+
+It is trained on the labeled legal_test_matters folders and saved as JSON
+to MODEL_FILE. Weights are one sparse dict per class. With NumPy and SciPy
+installed, a document's terms are hashed all at once from prefix sums of
+its bytes, training steps update weight matrices, and classify_batch()
+scores each batch as one sparse matrix product; without them the same
+features, model and scores come from dicts and map(). classify_batch()
+spreads batches of more than MIN_WORKER_TEXTS documents per process over
+processes.
+
+    python document_classifier.py --train
+    python document_classifier.py --evaluate
+    python document_classifier.py path/to/contract.txt ...
+
+Callers keep their keyword rules as the fallback for documents the model
+is not confident about (below MIN_CONFIDENCE) and for when no model has
+been trained.
+"""
+
+import argparse
+import heapq
+import json
+import math
+import os
+import random
+import re
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+from itertools import repeat
+from operator import mul, sub
+
+try:
+    import numpy as np
+    import scipy.sparse as sparse
+except ImportError:
+    np = None
+
+from corpus import Corpus
+
+MODEL_FILE = "./document_classifier.json"
+MODEL_VERSION = 2  # Bumped when the features change
+TRAINING_ROOTS = ["./legal_test_matters"]
+
+FEATURE_BITS = 20
+MIN_DF = 2  # Features in fewer training documents are dropped
+MAX_FEATURES = 1 << 15  # Most common features kept
+DOC_FEATURES = 1000  # Highest-weighted features kept per document
+MIN_EXAMPLES = 3  # Rarer document types are trained as OTHER
+OTHER = "Other"
+EPOCHS = 5
+LEARNING_RATE = 5.0
+MIN_GRADIENT = 0.01  # Smaller per-class gradients are not applied
+PRUNE_WEIGHT = 1e-3  # Smaller weights are not saved
+
+MIN_CONFIDENCE = 0.8  # Callers fall back to keyword rules below this probability
+BATCH_SIZE = 64  # Documents per worker task
+MIN_WORKER_TEXTS = 500  # Texts per worker process; starting one takes as long as classifying ~200
+TERM_CACHE = 1 << 20  # Hashed terms remembered per process
+
+HASH_BASE = 0x100000001B3  # Odd, so it has an inverse mod 2**64
+HASH_MASK = (1 << 64) - 1
+HASH_INVERSE = pow(HASH_BASE, -1, 1 << 64)
+
+# File name types that name the same document
+DOC_TYPE_ALIASES = {"LPA": "Limited_Partnership_Agreement"}
+
+WORD_RE = re.compile(r'[a-z]{2,}')
+
+
+# ---------------------------------------------------------
+# FEATURES
+# ---------------------------------------------------------
+@lru_cache(maxsize=TERM_CACHE)
+def word_hash(word):
+    """64-bit polynomial hash of a word's UTF-8 bytes: HASH_BASE**(n-1) * byte 0 + ... + byte n-1."""
+    h = 0
+    for byte in word.encode('utf-8'):
+        h = (h * HASH_BASE + byte) & HASH_MASK
+    return h
+
+
+@lru_cache(maxsize=None)
+def base_power(n):
+    return pow(HASH_BASE, n, 1 << 64)
+
+
+def term_hash(term):
+    """word_hash() of a word or an 'a b' word pair, the pair's from its words' hashes as in hashed_counts()."""
+    first, space, second = term.partition(' ')
+    if not space:
+        return word_hash(term)
+    n = len(second.encode('utf-8'))
+    return (word_hash(first) * base_power(n + 1) + ord(' ') * base_power(n) + word_hash(second)) & HASH_MASK
+
+
+def mix(h):
+    """MurmurHash3's 64-bit finalizer, so every bit of h reaches the top bits; for an int or a uint64 array."""
+    h = h ^ (h >> 33)
+    h = h * 0xFF51AFD7ED558CCD & HASH_MASK
+    h = h ^ (h >> 33)
+    h = h * 0xC4CEB9FE1A85EC53 & HASH_MASK
+    return h ^ (h >> 33)
+
+
+@lru_cache(maxsize=TERM_CACHE)
+def term_feature(term, bits):
+    return mix(term_hash(term)) >> (64 - bits)
+
+
+@lru_cache(maxsize=None)
+def term_frequency(count):
+    return 1.0 + math.log(count)
+
+
+def hashed_features(text, bits=FEATURE_BITS):
+    """
+    {feature: 1 + log(count)} of the text's words and adjacent word pairs.
+    Terms hashing to the same feature keep one count; with 2**20 features
+    that is rare enough not to matter.
+    """
+    if np is not None:
+        features, counts = hashed_counts(text, bits)
+        return dict(zip(features.tolist(), map(term_frequency, counts.tolist())))
+    words = WORD_RE.findall(text.lower())
+    counts = Counter(words)
+    counts.update(map(' '.join, zip(words, words[1:])))
+    # Both lookups are cached, so map() stays in C for terms seen before
+    return dict(zip(map(term_feature, counts, repeat(bits)), map(term_frequency, counts.values())))
+
+
+# HASH_BASE**k and HASH_BASE**-k mod 2**64 as uint64 arrays, extended as
+# longer texts come
+hash_powers = None
+inverse_powers = None
+
+
+def powers_to(n):
+    """hash_powers and inverse_powers for k < n at least."""
+    global hash_powers, inverse_powers
+    if hash_powers is None or len(hash_powers) < n:
+        n = max(n, 2 * len(hash_powers) if hash_powers is not None else 1 << 16)
+        hash_powers, inverse_powers = (np.cumprod(np.append(np.uint64(1), np.full(n - 1, base, dtype=np.uint64)))
+                                       for base in (HASH_BASE, HASH_INVERSE))
+    return hash_powers, inverse_powers
+
+
+def first_counts(keys):
+    """
+    (distinct keys, index of each one's first occurrence, occurrences):
+    np.unique(keys, return_index=True, return_counts=True) without the
+    stable sort, which takes five times as long.
+    """
+    order = np.argsort(keys)
+    ordered = keys[order]
+    starts = np.flatnonzero(np.append(True, ordered[1:] != ordered[:-1]))
+    return ordered[starts], np.minimum.reduceat(order, starts), np.diff(np.append(starts, len(keys)))
+
+
+def hashed_counts(text, bits=FEATURE_BITS, ordered=True):
+    """
+    (features, counts) arrays of a text's words and adjacent pairs, with
+    NumPy: what hashed_features() counts, with the same term_hash(). A
+    word's hash is read off prefix sums of the text's bytes, and a pair's
+    is combined from its words' as hash(a + ' ' + b) = hash(a) * B**(len(b)
+    + 1) + hash(' ') * B**len(b) + hash(b). Terms hashing to the same
+    feature are resolved as in the dict and, if ordered, put in its order
+    (which training's tie-breaks depend on).
+    """
+    data = np.frombuffer(text.lower().encode('utf-8', 'surrogatepass'), dtype=np.uint8)
+    # WORD_RE's words: runs of two or more a-z; any other byte, UTF-8 ones included, ends them
+    letters = np.concatenate(([False], (data >= ord('a')) & (data <= ord('z')), [False]))
+    edges = np.flatnonzero(letters[1:] != letters[:-1])
+    starts, ends = edges[::2], edges[1::2]
+    words = ends - starts >= 2
+    starts, ends = starts[words], ends[words]
+    if not len(starts):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    powers, inverses = powers_to(len(data) + 1)
+    # Bytes i..j-1 hash to B**(j-1) * (prefix[j] - prefix[i]), with prefix[i] the sum of byte k * B**-k for k < i
+    prefix = np.concatenate((np.zeros(1, dtype=np.uint64), np.cumsum(data * inverses[:len(data)], dtype=np.uint64)))
+    hashes = powers[ends - 1] * (prefix[ends] - prefix[starts])
+    lengths = ends - starts
+    pairs = hashes[:-1] * powers[lengths[1:] + 1] + ord(' ') * powers[lengths[1:]] + hashes[1:]
+
+    # Words before pairs, each in order of first occurrence, as in the Counter
+    terms, first, counts = first_counts(np.concatenate([hashes, pairs]))
+    features = (mix(terms) >> (64 - bits)).astype(np.int64)
+    # By feature, then by first occurrence
+    order = np.argsort(features << 32 | first)
+    features, first, counts = features[order], first[order], counts[order]
+    boundaries = features[1:] != features[:-1]
+    # The count of a feature's last term, at the place the dict would have it: its first term's
+    last = np.append(boundaries, True)
+    features, counts = features[last], counts[last]
+    if not ordered:
+        return features, counts
+    order = np.argsort(first[np.append(True, boundaries)])
+    return features[order], counts[order]
+
+
+def tfidf(features, idf, limit=DOC_FEATURES):
+    """
+    L2-normalized TF-IDF vector of the `limit` highest-weighted hashed
+    features that have an IDF (the ones kept in training).
+    """
+    weighted = [(features[feature] * idf[feature], feature) for feature in features.keys() & idf.keys()]
+    if len(weighted) > limit:
+        weighted = heapq.nlargest(limit, weighted)
+    norm = math.sqrt(sum(value * value for value, _ in weighted)) or 1.0
+    return {feature: value / norm for value, feature in weighted}
+
+
+def array_frequencies(documents):
+    """
+    [(feature, documents with it)] of feature arrays, with NumPy: most
+    common first and ties in order of first appearance, as
+    Counter.most_common() has them.
+    """
+    if not documents:
+        return []
+    features, first, counts = np.unique(np.concatenate(documents), return_index=True, return_counts=True)
+    order = np.lexsort((first, -counts))
+    return list(zip(features[order].tolist(), counts[order].tolist()))
+
+
+def softmax(scores):
+    top = max(scores)
+    exps = [math.exp(score - top) for score in scores]
+    total = sum(exps)
+    return [e / total for e in exps]
+
+
+# ---------------------------------------------------------
+# TRAINING
+# ---------------------------------------------------------
+def fit_dicts(model, vectors, examples, classes, epochs, rng):
+    """
+    One head's (biases, [{feature: weight} per class]) fit by SGD to
+    [(index, label)] examples of (features, values) vectors.
+    """
+    biases = [0.0] * len(classes)
+    weights = [{} for _ in classes]
+    for epoch in range(epochs):
+        rate = LEARNING_RATE / (1 + epoch)
+        rng.shuffle(examples)
+        for i, label in examples:
+            vector = vectors[i]
+            probabilities = model.probabilities(vector, (classes, biases, weights))
+            target = classes.index(label)
+            for c, p in enumerate(probabilities):
+                # Once an example is fit, most classes get next to no gradient
+                gradient = p - (c == target)
+                if abs(gradient) < MIN_GRADIENT:
+                    continue
+                biases[c] -= rate * gradient
+                w = weights[c]
+                keys, values = vector
+                w.update(zip(keys, map(sub, map(w.get, keys, repeat(0.0)),
+                                       map(mul, values, repeat(rate * gradient)))))
+    weights = [{feature: x for feature, x in w.items() if abs(x) >= PRUNE_WEIGHT} for w in weights]
+    return biases, weights
+
+
+def fit_arrays(model, vectors, examples, classes, epochs, rng):
+    """fit_dicts() with NumPy, for the rows of a CSR matrix over the model's features."""
+    biases = np.zeros(len(classes))
+    weights = np.zeros((vectors.shape[1], len(classes)))
+    targets = np.eye(len(classes))
+    indptr, indices, data = vectors.indptr, vectors.indices, vectors.data
+    for epoch in range(epochs):
+        rate = LEARNING_RATE / (1 + epoch)
+        rng.shuffle(examples)
+        for i, label in examples:
+            cols, values = indices[indptr[i]:indptr[i + 1]], data[indptr[i]:indptr[i + 1]]
+            scores = biases + values @ weights[cols]
+            probabilities = np.exp(scores - scores.max())
+            gradient = probabilities / probabilities.sum() - targets[classes.index(label)]
+            # Once an example is fit, most classes get next to no gradient
+            applied = np.flatnonzero(np.abs(gradient) >= MIN_GRADIENT)
+            biases[applied] -= rate * gradient[applied]
+            weights[np.ix_(cols, applied)] -= rate * np.outer(values, gradient[applied])
+
+    features = list(model.idf)
+    kept = [np.flatnonzero(np.abs(column) >= PRUNE_WEIGHT) for column in weights.T]
+    return biases.tolist(), [{features[j]: x for j, x in zip(rows.tolist(), weights[rows, c].tolist())}
+                             for c, rows in enumerate(kept)]
+
+
+# ---------------------------------------------------------
+# TRAINING DATA
+# ---------------------------------------------------------
+def training_labels(document):
+    """{head: label} of a legal_test_matters Document; a head is left out when unlabeled."""
+    labels = {'doc_type': DOC_TYPE_ALIASES.get(document.doc_type, document.doc_type)}
+    if document.matter.practice_area != "Mixed":
+        labels['practice_area'] = document.matter.practice_area
+    return labels
+
+
+def training_documents(roots=TRAINING_ROOTS):
+    """[(matter name, text, {head: label})] of every readable labeled document."""
+    documents = []
+    for document, text in Corpus(roots).texts():
+        documents.append((document.matter.name, text, training_labels(document)))
+
+    # Pool the rare document types
+    counts = Counter(labels['doc_type'] for _, _, labels in documents)
+    for _, _, labels in documents:
+        if counts[labels['doc_type']] < MIN_EXAMPLES:
+            labels['doc_type'] = OTHER
+    return documents
+
+
+# ---------------------------------------------------------
+# MODEL
+# ---------------------------------------------------------
+class DocumentClassifier:
+    """
+    Per head, a softmax over linear scores of the TF-IDF vector.
+    heads maps head -> (classes, biases, [{feature: weight} per class]).
+    """
+
+    def __init__(self, idf, heads, bits=FEATURE_BITS, documents=0):
+        self.idf = idf
+        self.heads = heads
+        self.bits = bits
+        self.documents = documents
+        self._arrays = None
+
+    @classmethod
+    def train(cls, documents, bits=FEATURE_BITS, epochs=EPOCHS, seed=0):
+        """
+        Fit a model to [(text, {head: label})] with stochastic gradient
+        descent. With NumPy and SciPy the documents are hashed and weighted
+        as arrays and each step updates a weight matrix; the steps, and so
+        the model, are the same as with dicts.
+        """
+        n = len(documents)
+        if np is not None:
+            hashed = [hashed_counts(text, bits) for text, _ in documents]
+            frequencies = array_frequencies([features for features, _ in hashed])
+        else:
+            features = [hashed_features(text, bits) for text, _ in documents]
+            frequencies = Counter(feature for doc in features for feature in doc).most_common()
+        idf = {feature: math.log((n + 1) / (count + 1)) + 1.0
+               for feature, count in frequencies[:MAX_FEATURES] if count >= MIN_DF}
+        model = cls(idf, {}, bits, n)
+        if np is not None:
+            vectors = model.count_matrix(hashed)
+            fit = fit_arrays
+        else:
+            vectors = [model.sparse(tfidf(doc, idf)) for doc in features]
+            fit = fit_dicts
+
+        rng = random.Random(seed)
+        for head in sorted({head for _, labels in documents for head in labels}):
+            examples = [(i, labels[head]) for i, (_, labels) in enumerate(documents) if head in labels]
+            classes = sorted({label for _, label in examples})
+            model.heads[head] = (classes, *fit(model, vectors, examples, classes, epochs, rng))
+
+        # Only features some head still weighs need an IDF; the rest count as unseen
+        used = {feature for _, _, weights in model.heads.values() for w in weights for feature in w}
+        model.idf = {feature: value for feature, value in idf.items() if feature in used}
+        model._arrays = None
+        return model
+
+    @staticmethod
+    def sparse(vector):
+        """A {feature: value} vector as (features, values) lists."""
+        return list(vector), list(vector.values())
+
+    @staticmethod
+    def probabilities(vector, head):
+        """Class probabilities of a (features, values) vector under one head."""
+        _, biases, weights = head
+        keys, values = vector
+        # Dot products with the per-class weight dicts, looped in C by map()
+        return softmax([bias + sum(map(mul, values, map(w.get, keys, repeat(0.0))))
+                        for bias, w in zip(biases, weights)])
+
+    def vectorize(self, text):
+        return self.sparse(tfidf(hashed_features(text, self.bits), self.idf))
+
+    def arrays(self):
+        """
+        With NumPy, the model as arrays, built on first use: the column of
+        each feature (-1 without an IDF), the IDF of each column, and per
+        head (classes, biases, columns x classes weight matrix).
+        """
+        if self._arrays is None:
+            features = np.fromiter(self.idf.keys(), dtype=np.int64, count=len(self.idf))
+            columns = np.full(1 << self.bits, -1, dtype=np.int32)
+            columns[features] = np.arange(len(features))
+            idf = np.fromiter(self.idf.values(), dtype=np.float64, count=len(self.idf))
+            heads = {}
+            for name, (classes, biases, weights) in self.heads.items():
+                matrix = np.zeros((len(features), len(classes)))
+                for c, w in enumerate(weights):
+                    rows = columns[np.fromiter(w.keys(), dtype=np.int64, count=len(w))]
+                    values = np.fromiter(w.values(), dtype=np.float64, count=len(w))
+                    # Features without an IDF are never in a vector
+                    matrix[rows[rows >= 0], c] = values[rows >= 0]
+                heads[name] = (classes, np.array(biases), matrix)
+            self._arrays = (columns, idf, heads)
+        return self._arrays
+
+    def matrix(self, texts):
+        """With NumPy and SciPy, tfidf() of each text as the rows of a sparse matrix over the model's columns."""
+        return self.count_matrix(hashed_counts(text, self.bits, ordered=False) for text in texts)
+
+    def count_matrix(self, hashed):
+        """matrix() of texts already hashed: (features, counts) pairs from hashed_counts()."""
+        columns, idf, _ = self.arrays()
+        indptr = [0]
+        indices = []
+        data = []
+        for features, counts in hashed:
+            cols = columns[features]
+            kept = cols >= 0
+            features, cols = features[kept], cols[kept]
+            weights = (1.0 + np.log(counts[kept])) * idf[cols]
+            if len(weights) > DOC_FEATURES:
+                # Heaviest first and ties to the higher feature, as heapq.nlargest() in tfidf()
+                top = np.lexsort((features, weights))[-DOC_FEATURES:]
+                cols, weights = cols[top], weights[top]
+            indices.append(cols)
+            data.append(weights / (np.sqrt(weights @ weights) or 1.0))
+            indptr.append(indptr[-1] + len(cols))
+        return sparse.csr_matrix((np.concatenate(data or [np.zeros(0)]), np.concatenate(indices or [np.zeros(0, int)]),
+                                  indptr), shape=(len(indptr) - 1, len(idf)))
+
+    def classify_many(self, texts):
+        """
+        [{head: (label, probability)}] of each text. With NumPy and SciPy
+        the texts are scored together, one sparse matrix product per head.
+        """
+        if np is None:
+            return [self.classify(text) for text in texts]
+        vectors = self.matrix(texts)
+        results = [{} for _ in range(vectors.shape[0])]
+        for name, (classes, biases, weights) in self.arrays()[2].items():
+            scores = vectors @ weights + biases
+            probabilities = np.exp(scores - scores.max(axis=1, keepdims=True))
+            probabilities /= probabilities.sum(axis=1, keepdims=True)
+            best = probabilities.argmax(axis=1)
+            for result, c, p in zip(results, best.tolist(), probabilities[np.arange(len(best)), best].tolist()):
+                result[name] = (classes[c], p)
+        return results
+
+    def classify(self, text):
+        """{head: (label, probability)} of a document's text."""
+        if np is not None:
+            return self.classify_many([text])[0]
+        vector = self.vectorize(text)
+        result = {}
+        for name, head in self.heads.items():
+            probabilities = self.probabilities(vector, head)
+            best = max(range(len(probabilities)), key=probabilities.__getitem__)
+            result[name] = (head[0][best], probabilities[best])
+        return result
+
+    def save(self, path=MODEL_FILE):
+        model = {
+            'version': MODEL_VERSION,
+            'bits': self.bits,
+            'documents': self.documents,
+            'idf': {str(feature): round(value, 5) for feature, value in self.idf.items()},
+            'heads': {
+                name: {
+                    'classes': classes,
+                    'biases': biases,
+                    'weights': [{str(feature): round(x, 5) for feature, x in w.items()} for w in weights],
+                }
+                for name, (classes, biases, weights) in self.heads.items()
+            },
+        }
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(model, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=MODEL_FILE):
+        with open(path, 'r', encoding='utf-8') as f:
+            model = json.load(f)
+        if model.get('version') != MODEL_VERSION:
+            raise ValueError(f"{path} was trained on other features; retrain it with: "
+                             "python document_classifier.py --train")
+        heads = {
+            name: (head['classes'], head['biases'],
+                   [{int(feature): x for feature, x in w.items()} for w in head['weights']])
+            for name, head in model['heads'].items()
+        }
+        idf = {int(feature): value for feature, value in model['idf'].items()}
+        return cls(idf, heads, model['bits'], model['documents'])
+
+
+@lru_cache(maxsize=4)
+def load_model(path=MODEL_FILE):
+    """The saved model, loaded once per process."""
+    return DocumentClassifier.load(path)
+
+
+def classify_chunk(path, texts):
+    """Worker: classify a list of texts with the model saved at path."""
+    return load_model(path).classify_many(texts)
+
+
+def classify_batch(texts, path=MODEL_FILE, workers=1):
+    """
+    [{head: (label, probability)}] for each text, in order, classified in
+    chunks of BATCH_SIZE: on up to `workers` processes when each gets
+    MIN_WORKER_TEXTS texts, as a worker starts by loading the model.
+    """
+    texts = list(texts)
+    chunks = [texts[i:i + BATCH_SIZE] for i in range(0, len(texts), BATCH_SIZE)]
+    workers = min(workers, len(texts) // MIN_WORKER_TEXTS)
+    if workers <= 1:
+        return [result for chunk in chunks for result in classify_chunk(path, chunk)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return [result for chunk in pool.map(partial(classify_chunk, path), chunks) for result in chunk]
+
+
+# ---------------------------------------------------------
+# EVALUATION
+# ---------------------------------------------------------
+def evaluate(documents, folds=5):
+    """
+    Cross-validated accuracy per head, holding out whole matters so no
+    matter is both trained and tested on. Returns {head: (correct, total)}.
+    """
+    matters = sorted({matter for matter, _, _ in documents})
+    fold_of = {matter: i % folds for i, matter in enumerate(matters)}
+    scores = {}
+    for fold in range(folds):
+        train = [(text, labels) for matter, text, labels in documents if fold_of[matter] != fold]
+        test = [(text, labels) for matter, text, labels in documents if fold_of[matter] == fold]
+        model = DocumentClassifier.train(train)
+        for text, labels in test:
+            predicted = model.classify(text)
+            for head, label in labels.items():
+                correct, total = scores.get(head, (0, 0))
+                scores[head] = (correct + (predicted[head][0] == label), total + 1)
+    return scores
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train or run the TF-IDF practice area / document type classifier.")
+    parser.add_argument("files", nargs="*", help="text files to classify")
+    parser.add_argument("--train", action="store_true", help="train on legal_test_matters and save the model")
+    parser.add_argument("--evaluate", action="store_true", help="report cross-validated accuracy by held-out matter")
+    parser.add_argument("--model", default=MODEL_FILE, help=f"model file (default: {MODEL_FILE})")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="processes to classify files with")
+    args = parser.parse_args()
+
+    if args.train or args.evaluate:
+        documents = training_documents()
+
+    if args.evaluate:
+        for head, (correct, total) in sorted(evaluate(documents).items()):
+            print(f"  {head}: {correct}/{total} correct ({correct / total:.1%})")
+
+    if args.train:
+        start = time.perf_counter()
+        model = DocumentClassifier.train([(text, labels) for _, text, labels in documents])
+        model.save(args.model)
+        print(f"Trained on {len(documents)} documents in {time.perf_counter() - start:.1f}s: "
+              + ", ".join(f"{head} {len(classes)} classes" for head, (classes, _, _) in sorted(model.heads.items()))
+              + f", {len(model.idf)} features")
+
+    if args.files:
+        texts = []
+        for path in args.files:
+            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+                texts.append(f.read())
+        start = time.perf_counter()
+        results = classify_batch(texts, args.model, args.workers)
+        elapsed = time.perf_counter() - start
+        for path, result in zip(args.files, results):
+            print(path + "  " + "  ".join(f"{head}={label} ({p:.2f})" for head, (label, p) in sorted(result.items())))
+        print(f"\n{len(texts)} documents in {elapsed:.2f}s ({len(texts) / max(elapsed, 1e-9):.0f}/s)")
+
+
+if __name__ == "__main__":
+    main()
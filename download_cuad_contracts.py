@@ -6,15 +6,21 @@ CUAD contains 510 commercial contracts in PDF format from SEC EDGAR filings.
 Source: https://huggingface.co/datasets/theatticusproject/cuad-qa
 
 Files are kept in their original PDF format - no conversion to text.
+The chosen PDFs are streamed straight out of the downloaded ZIP into the
+blob store and linked into the matter folders; the archive is never
+extracted.
 """
 
+import argparse
 import os
 import re
 import zipfile
-import shutil
 import requests
-import time
 from pathlib import Path
+from blob_store import BlobStore
+from extract_text import extract_all
+from keyword_matcher import KeywordMatcher
+from resumable_download import download_from_mirrors, load_records, save_records, verified
 
 # ---------------------------------------------------------
 # CONFIGURATION
@@ -22,7 +28,10 @@ from pathlib import Path
 OUTPUT_PATH = "./cuad_matters"
 TEMP_PATH = "./cuad_temp"
 
-# Try multiple sources
+# Size and SHA-256 of every completed download
+DOWNLOAD_RECORDS = os.path.join(TEMP_PATH, "downloads.json")
+
+# Equivalent mirrors, raced for the fastest and split across when large
 CUAD_SOURCES = [
     # GitHub release
     "https://github.com/TheAtticusProject/cuad/releases/download/v1/CUAD_v1.zip",
@@ -59,6 +68,8 @@ PRACTICE_AREA_MAPPINGS = {
     ]
 }
 
+PRACTICE_AREA_MATCHER = KeywordMatcher(PRACTICE_AREA_MAPPINGS)
+
 # Target matters per practice area
 TARGET_MATTERS_PER_AREA = 3
 DOCS_PER_MATTER = 15
@@ -66,15 +77,9 @@ DOCS_PER_MATTER = 15
 
 def classify_by_filename(filename):
     """Classify a contract into a practice area based on filename."""
-    name_lower = filename.lower()
-
-    for practice_area, keywords in PRACTICE_AREA_MAPPINGS.items():
-        for keyword in keywords:
-            if keyword in name_lower:
-                return practice_area
-
-    # Default to Commercial if no match
-    return "Commercial"
+    # First practice area in PRACTICE_AREA_MAPPINGS order with a keyword hit,
+    # defaulting to Commercial if no match
+    return PRACTICE_AREA_MATCHER.first_category(filename.lower(), "Commercial")
 
 
 def sanitize_filename(name):
@@ -88,96 +93,90 @@ def sanitize_filename(name):
 # ---------------------------------------------------------
 # DOWNLOAD AND EXTRACTION
 # ---------------------------------------------------------
-def download_cuad_zip():
-    """Download CUAD ZIP file, trying multiple sources."""
+def download_cuad_zip(refresh=False):
+    """
+    Download CUAD ZIP file from the fastest sources, resuming partial downloads.
+    With refresh, an existing ZIP is revalidated and only fetched again if it changed.
+    """
     os.makedirs(TEMP_PATH, exist_ok=True)
     zip_path = os.path.join(TEMP_PATH, "CUAD_v1.zip")
+    records = load_records(DOWNLOAD_RECORDS)
 
-    if os.path.exists(zip_path) and os.path.getsize(zip_path) > 1000000:
+    previous = records.get(zip_path) if verified(zip_path, records.get(zip_path)) else None
+    if previous and not refresh:
         print(f"CUAD ZIP already downloaded: {zip_path}")
         return zip_path
 
-    print("Downloading CUAD dataset...")
-    print("(This is ~200MB and may take a few minutes)\n")
-
-    for url in CUAD_SOURCES:
-        print(f"Trying: {url[:60]}...")
-        try:
-            headers = {'User-Agent': 'Mozilla/5.0 (legal-dataset-downloader)'}
-            response = requests.get(url, stream=True, headers=headers, timeout=30)
-            response.raise_for_status()
-
-            total_size = int(response.headers.get('content-length', 0))
-            downloaded = 0
-
-            with open(zip_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-                    downloaded += len(chunk)
-                    if total_size:
-                        pct = (downloaded / total_size) * 100
-                        print(f"\r  Downloaded: {downloaded / 1024 / 1024:.1f} MB ({pct:.1f}%)", end="")
-
-            print(f"\n  Saved to: {zip_path}")
-            return zip_path
-
-        except requests.exceptions.RequestException as e:
-            print(f"  Failed: {e}")
-            time.sleep(2)
-            continue
-
-    raise Exception("Could not download CUAD from any source")
-
-
-def extract_cuad_zip(zip_path):
-    """Extract the CUAD ZIP file."""
-    extract_path = os.path.join(TEMP_PATH, "CUAD_v1")
-
-    if os.path.exists(extract_path):
-        print(f"CUAD already extracted: {extract_path}")
-        return extract_path
-
-    print(f"Extracting ZIP file...")
-    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-        zip_ref.extractall(TEMP_PATH)
-
-    print(f"  Extracted to: {extract_path}")
-    return extract_path
-
-
-def find_files(extract_path, extensions=None):
-    """Find all files with given extensions in the extracted directory."""
+    if previous:
+        print("Checking CUAD ZIP for upstream changes...")
+    else:
+        print("Downloading CUAD dataset...")
+        print("(This is ~200MB and may take a few minutes)\n")
+
+    def show_progress(downloaded, total_size):
+        if total_size:
+            pct = (downloaded / total_size) * 100
+            print(f"\r  Downloaded: {downloaded / 1024 / 1024:.1f} MB ({pct:.1f}%)", end="")
+
+    print(f"Racing {len(CUAD_SOURCES)} sources...")
+    try:
+        headers = {'User-Agent': 'Mozilla/5.0 (legal-dataset-downloader)'}
+        records[zip_path] = download_from_mirrors(CUAD_SOURCES, zip_path, headers=headers,
+                                                  progress=show_progress, split=True, previous=previous)
+    except requests.exceptions.RequestException as e:
+        raise Exception(f"Could not download CUAD from any source: {e}")
+    save_records(DOWNLOAD_RECORDS, records)
+
+    if records[zip_path] is previous:
+        print(f"  Unchanged upstream: {zip_path}")
+    else:
+        print(f"\n  Saved to: {zip_path} (from {records[zip_path]['url'][:60]})")
+    return zip_path
+
+
+def find_members(zip_ref, extensions=None, prefix="CUAD_v1/"):
+    """
+    Find all members with given extensions under prefix, straight from the
+    ZIP central directory; nothing is extracted.
+    """
     if extensions is None:
         extensions = ['.pdf', '.docx', '.doc', '.txt']
 
-    files = []
-    for root, dirs, filenames in os.walk(extract_path):
-        for filename in filenames:
-            ext = os.path.splitext(filename)[1].lower()
-            if ext in extensions:
-                files.append(os.path.join(root, filename))
-    return sorted(files)
+    members = []
+    for info in zip_ref.infolist():
+        if info.is_dir() or not info.filename.startswith(prefix):
+            continue
+        ext = os.path.splitext(info.filename)[1].lower()
+        if ext in extensions:
+            members.append(info.filename)
+    return sorted(members)
 
 
-def save_matter(practice_area, matter_num, doc_paths, output_path):
-    """Copy all documents for a matter to its folder, preserving original format."""
+def save_matter(practice_area, matter_num, members, output_path, zip_ref, store):
+    """
+    Stream all documents for a matter out of the ZIP into the blob store and
+    link them into its folder, preserving original format.
+    """
     folder_name = f"{practice_area}_{matter_num}"
     save_path = os.path.join(output_path, folder_name)
     os.makedirs(save_path, exist_ok=True)
 
-    print(f"\n--- Saving {folder_name} ({len(doc_paths)} docs) ---")
+    print(f"\n--- Saving {folder_name} ({len(members)} docs) ---")
 
-    for i, src_path in enumerate(doc_paths):
-        filename = os.path.basename(src_path)
-        dest_path = os.path.join(save_path, filename)
+    # Names written by this call; a rerun relinks the same names instead of adding _i copies
+    written = set()
+    for i, member in enumerate(members):
+        filename = os.path.basename(member)
 
         # Handle duplicates
-        if os.path.exists(dest_path):
+        if filename in written:
             base, ext = os.path.splitext(filename)
             filename = f"{base}_{i}{ext}"
-            dest_path = os.path.join(save_path, filename)
+        written.add(filename)
+        dest_path = os.path.join(save_path, filename)
 
-        shutil.copy2(src_path, dest_path)
+        with zip_ref.open(member) as src:
+            store.save_stream(src, dest_path)
         print(f"    {filename}")
 
 
@@ -185,17 +184,35 @@ def save_matter(practice_area, matter_num, doc_paths, output_path):
 # MAIN PROCESSING
 # ---------------------------------------------------------
 def main():
+    parser = argparse.ArgumentParser(description="Download CUAD and organize its PDFs into matters.")
+    parser.add_argument("--refresh", action="store_true",
+                        help="revalidate the downloaded ZIP with a conditional GET")
+    parser.add_argument("--extract-text", action="store_true",
+                        help="also write each PDF's text beside it (cached; see extract_text.py)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="processes for --extract-text")
+    args = parser.parse_args()
+
     print("=" * 60)
     print("CUAD CONTRACT DATASET DOWNLOADER")
     print("(Preserves original PDF format)")
     print("=" * 60)
 
-    # Download and extract
-    zip_path = download_cuad_zip()
-    extract_path = extract_cuad_zip(zip_path)
+    # Download, then read the archive in place; only chosen PDFs are decompressed
+    zip_path = download_cuad_zip(args.refresh)
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        organize_matters(zip_ref)
+
+    if args.extract_text:
+        print("\nExtracting text from the matter PDFs...")
+        extracted, cached, failed = extract_all([OUTPUT_PATH], args.workers)
+        print(f"Extracted {extracted}, already current {cached}, failed {failed}")
+
 
+def organize_matters(zip_ref):
+    """Classify the archive's PDFs by name and stream each matter's PDFs to OUTPUT_PATH."""
     # Find PDF files (CUAD primarily has PDFs)
-    pdf_files = find_files(extract_path, extensions=['.pdf'])
+    pdf_files = find_members(zip_ref, extensions=['.pdf'])
     print(f"\nFound {len(pdf_files)} PDF files")
 
     if not pdf_files:
@@ -204,6 +221,7 @@ def main():
 
     # Initialize matter tracking
     os.makedirs(OUTPUT_PATH, exist_ok=True)
+    store = BlobStore()
     matter_counts = {area: 0 for area in PRACTICE_AREA_MAPPINGS.keys()}
     matter_docs = {area: {} for area in PRACTICE_AREA_MAPPINGS.keys()}
 
@@ -211,9 +229,9 @@ def main():
     print(f"\nOrganizing PDFs into practice area matters...")
     processed = 0
 
-    for pdf_path in pdf_files:
+    for member in pdf_files:
         processed += 1
-        filename = os.path.basename(pdf_path)
+        filename = os.path.basename(member)
 
         # Check if we have enough for all areas
         if all(c >= TARGET_MATTERS_PER_AREA for c in matter_counts.values()):
@@ -230,13 +248,13 @@ def main():
         if current_matter not in matter_docs[practice_area]:
             matter_docs[practice_area][current_matter] = []
 
-        matter_docs[practice_area][current_matter].append(pdf_path)
+        matter_docs[practice_area][current_matter].append(member)
         print(f"  [{practice_area}_{current_matter}] {filename[:50]}...")
 
         # Check if matter is complete
         if len(matter_docs[practice_area][current_matter]) >= DOCS_PER_MATTER:
             save_matter(practice_area, current_matter,
-                       matter_docs[practice_area][current_matter], OUTPUT_PATH)
+                       matter_docs[practice_area][current_matter], OUTPUT_PATH, zip_ref, store)
             matter_counts[practice_area] += 1
 
     # Save any remaining partial matters
@@ -244,7 +262,7 @@ def main():
     for practice_area in matter_docs:
         for matter_num, docs in matter_docs[practice_area].items():
             if docs and matter_num > matter_counts[practice_area]:
-                save_matter(practice_area, matter_num, docs, OUTPUT_PATH)
+                save_matter(practice_area, matter_num, docs, OUTPUT_PATH, zip_ref, store)
                 matter_counts[practice_area] = matter_num
 
     # Summary
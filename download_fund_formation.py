@@ -10,12 +10,14 @@ Sources:
 All files preserved in original format (PDF/HTML).
 """
 
+import argparse
 import os
 import re
 import time
 import requests
 from pathlib import Path
 from urllib.parse import urljoin, quote
+from resumable_download import HostScheduler, load_records, save_records, verified
 
 # ---------------------------------------------------------
 # CONFIGURATION
@@ -23,11 +25,22 @@ from urllib.parse import urljoin, quote
 OUTPUT_PATH = "./fund_formation_matters"
 TEMP_PATH = "./fund_temp"
 
+# Size and SHA-256 of every completed download, keyed by destination path
+DOWNLOAD_RECORDS = os.path.join(TEMP_PATH, "downloads.json")
+download_records = {}
+
 HEADERS = {
     'User-Agent': 'Legal Dataset Builder (educational/research purposes)',
     'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
 }
 
+# Politeness limit per host, in requests per second; other hosts get the scheduler default
+HOST_RATES = {
+    "legaldatalab.law.virginia.edu": 2,
+    "www.sec.gov": 5,
+    "ilpa.org": 2,
+}
+
 # UVA Legal Data Lab - Hedge Fund Documents
 UVA_BASE_URL = "https://legaldatalab.law.virginia.edu/hedge_funds/pdf"
 
@@ -120,87 +133,26 @@ ILPA_DOCUMENTS = {
 }
 
 
-def download_file(url, dest_path, description=""):
-    """Download a file with retry logic."""
-    max_retries = 3
-
-    for attempt in range(max_retries):
-        try:
-            # Handle URL encoding for spaces
-            if ' ' in url:
-                url = url.replace(' ', '%20')
-
-            response = requests.get(url, headers=HEADERS, timeout=30, stream=True)
-            response.raise_for_status()
-
-            with open(dest_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+def is_downloaded(dest_path):
+    """True if dest_path was fully downloaded and still matches its recorded SHA-256."""
+    return verified(dest_path, download_records.get(dest_path))
 
-            size_kb = os.path.getsize(dest_path) / 1024
-            print(f"    Downloaded: {description} ({size_kb:.1f} KB)")
-            return True
-
-        except requests.exceptions.RequestException as e:
-            if attempt < max_retries - 1:
-                print(f"    Retry {attempt + 1}/{max_retries}: {e}")
-                time.sleep(2)
-            else:
-                print(f"    Failed: {description} - {e}")
-                return False
-
-    return False
-
-
-def download_uva_documents():
-    """Download hedge fund documents from UVA Legal Data Lab."""
-    print("\n" + "=" * 60)
-    print("DOWNLOADING UVA LEGAL DATA LAB - HEDGE FUND DOCUMENTS")
-    print("=" * 60)
-
-    total_downloaded = 0
 
+def uva_jobs():
+    """Catalog jobs for hedge fund documents from UVA Legal Data Lab."""
+    jobs = []
     for doc_type, documents in UVA_DOCUMENTS.items():
-        folder_path = os.path.join(OUTPUT_PATH, doc_type)
-        os.makedirs(folder_path, exist_ok=True)
-
-        print(f"\n--- {doc_type} ({len(documents)} files) ---")
-
         for name, path in documents:
             url = f"{UVA_BASE_URL}/{path}"
             ext = os.path.splitext(path)[1]
-            dest_file = os.path.join(folder_path, f"{name}{ext}")
-
-            if os.path.exists(dest_file):
-                print(f"    Skipped (exists): {name}")
-                total_downloaded += 1
-                continue
-
-            if download_file(url, dest_file, name):
-                total_downloaded += 1
-
-            time.sleep(0.5)  # Be respectful to the server
-
-    return total_downloaded
-
-
-def download_sec_documents():
-    """Download fund formation documents from SEC EDGAR."""
-    print("\n" + "=" * 60)
-    print("DOWNLOADING SEC EDGAR - FUND FORMATION EXHIBITS")
-    print("=" * 60)
+            jobs.append(("UVA", doc_type, name, url, os.path.join(OUTPUT_PATH, doc_type, f"{name}{ext}")))
+    return jobs
 
-    total_downloaded = 0
 
+def sec_jobs():
+    """Catalog jobs for fund formation documents from SEC EDGAR."""
+    jobs = []
     for doc_type, documents in SEC_EDGAR_DOCUMENTS.items():
-        if not documents:
-            continue
-
-        folder_path = os.path.join(OUTPUT_PATH, doc_type)
-        os.makedirs(folder_path, exist_ok=True)
-
-        print(f"\n--- {doc_type} ({len(documents)} files) ---")
-
         for name, url in documents:
             # Determine extension from URL
             if url.endswith('.htm') or url.endswith('.html'):
@@ -209,51 +161,91 @@ def download_sec_documents():
                 ext = '.pdf'
             else:
                 ext = '.html'
+            jobs.append(("SEC", doc_type, name, url, os.path.join(OUTPUT_PATH, doc_type, f"{name}{ext}")))
+    return jobs
 
-            dest_file = os.path.join(folder_path, f"{name}{ext}")
-
-            if os.path.exists(dest_file):
-                print(f"    Skipped (exists): {name}")
-                total_downloaded += 1
-                continue
-
-            if download_file(url, dest_file, name):
-                total_downloaded += 1
-
-            time.sleep(1)  # Respect SEC rate limits
-
-    return total_downloaded
-
-
-def download_ilpa_documents():
-    """Download ILPA model LPA documents."""
-    print("\n" + "=" * 60)
-    print("DOWNLOADING ILPA - MODEL LPA TEMPLATES")
-    print("=" * 60)
-
-    total_downloaded = 0
 
+def ilpa_jobs():
+    """Catalog jobs for ILPA model LPA documents."""
+    jobs = []
     for doc_type, documents in ILPA_DOCUMENTS.items():
-        folder_path = os.path.join(OUTPUT_PATH, doc_type)
-        os.makedirs(folder_path, exist_ok=True)
-
-        print(f"\n--- {doc_type} ({len(documents)} files) ---")
-
         for name, url in documents:
             ext = os.path.splitext(url)[1]
-            dest_file = os.path.join(folder_path, f"{name}{ext}")
+            jobs.append(("ILPA", doc_type, name, url, os.path.join(OUTPUT_PATH, doc_type, f"{name}{ext}")))
+    return jobs
+
+
+SOURCE_TITLES = {
+    "UVA": "UVA LEGAL DATA LAB - HEDGE FUND DOCUMENTS",
+    "SEC": "SEC EDGAR - FUND FORMATION EXHIBITS",
+    "ILPA": "ILPA - MODEL LPA TEMPLATES",
+}
 
-            if os.path.exists(dest_file):
-                print(f"    Skipped (exists): {name}")
-                total_downloaded += 1
-                continue
 
-            if download_file(url, dest_file, name):
-                total_downloaded += 1
+def download_catalogs(jobs, refresh=False):
+    """
+    Download (source, doc_type, name, url, dest_file) catalog jobs.
+
+    Files that already match their download record are skipped, or with
+    refresh revalidated by a conditional GET, so only files that changed
+    upstream are downloaded again. The rest go to a HostScheduler, so UVA,
+    SEC and ILPA download in parallel while each host stays within
+    HOST_RATES. Results are reported in catalog order. Returns
+    {source: documents on disk}.
+    """
+    present = [is_downloaded(dest_file) for _, _, _, _, dest_file in jobs]
+    pending = [job for job, done in zip(jobs, present) if refresh or not done]
+    for _, _, _, _, dest_file in pending:
+        os.makedirs(os.path.dirname(dest_file), exist_ok=True)
+
+    def previous(dest_file, done):
+        return download_records[dest_file] if done else None
+
+    # Handle URL encoding for spaces
+    scheduler = HostScheduler(HEADERS, HOST_RATES)
+    results = scheduler.download_all([
+        (url.replace(' ', '%20'), dest_file, previous(dest_file, done))
+        for (_, _, _, url, dest_file), done in zip(jobs, present) if refresh or not done
+    ])
+
+    section_sizes = {}
+    for source, doc_type, _, _, _ in jobs:
+        section_sizes[source, doc_type] = section_sizes.get((source, doc_type), 0) + 1
+
+    counts = {source: 0 for source in SOURCE_TITLES}
+    section = (None, None)
+
+    for (source, doc_type, name, url, dest_file), done in zip(jobs, present):
+        if source != section[0]:
+            print("\n" + "=" * 60)
+            print(f"DOWNLOADING {SOURCE_TITLES[source]}")
+            print("=" * 60)
+        if (source, doc_type) != section:
+            section = (source, doc_type)
+            print(f"\n--- {doc_type} ({section_sizes[section]} files) ---")
+
+        if done and not refresh:
+            print(f"    Skipped (exists): {name}")
+            counts[source] += 1
+            continue
 
-            time.sleep(0.5)
+        result = next(results)
+        if isinstance(result, Exception):
+            print(f"    Failed: {name} - {result}")
+            # A file that failed to revalidate is still on disk
+            counts[source] += done
+            continue
+
+        changed = not done or result['sha256'] != download_records[dest_file]['sha256']
+        download_records[dest_file] = result
+        save_records(DOWNLOAD_RECORDS, download_records)
+        counts[source] += 1
+        if changed:
+            print(f"    Downloaded: {name} ({result['size'] / 1024:.1f} KB)")
+        else:
+            print(f"    Unchanged: {name}")
 
-    return total_downloaded
+    return counts
 
 
 def search_sec_for_side_letters():
@@ -305,17 +297,22 @@ def search_sec_for_side_letters():
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Download fund formation documents.")
+    parser.add_argument("--refresh", action="store_true",
+                        help="revalidate downloaded files with conditional GETs and fetch only changed ones")
+    args = parser.parse_args()
+
     print("=" * 60)
     print("FUND FORMATION DOCUMENTS DATASET BUILDER")
     print("(Original formats preserved - PDF, DOCX, HTML)")
     print("=" * 60)
 
     os.makedirs(OUTPUT_PATH, exist_ok=True)
+    download_records.update(load_records(DOWNLOAD_RECORDS))
 
-    # Download from each source
-    uva_count = download_uva_documents()
-    sec_count = download_sec_documents()
-    ilpa_count = download_ilpa_documents()
+    # Download from every source at once
+    counts = download_catalogs(uva_jobs() + sec_jobs() + ilpa_jobs(), args.refresh)
+    uva_count, sec_count, ilpa_count = counts["UVA"], counts["SEC"], counts["ILPA"]
 
     # Optional: Search for more side letters
     # search_sec_for_side_letters()
@@ -6,15 +6,20 @@ Searches a broader set of investment managers, PE firms, hedge funds,
 and BDCs for fund formation documents including side letters.
 """
 
+import hashlib
+import json
 import os
 import re
-import shutil
-import time
-from sec_edgar_downloader import Downloader
+from blob_store import BlobStore
+from edgar_fetch import EdgarFetcher
+from keyword_matcher import KeywordMatcher
 
 OUTPUT_PATH = "./fund_formation_matters"
 TEMP_PATH = "./sec_fund_filings_expanded"
 
+# Per-accession classification results, kept across runs so each filing is read once
+CLASSIFICATION_CACHE = os.path.join(TEMP_PATH, "fund_doc_classifications.json")
+
 # Expanded list of investment companies and fund managers
 INVESTMENT_COMPANIES = {
     # Major PE Firms
@@ -98,6 +103,9 @@ INVESTMENT_COMPANIES = {
     ],
 }
 
+# Most recent filings to fetch per ticker and filing type
+FILINGS_PER_TYPE = 5
+
 # Filing types that commonly contain fund formation documents
 FILING_TYPES = [
     "8-K",          # Material agreements, side letters, amendments
@@ -147,6 +155,14 @@ FUND_DOC_KEYWORDS = {
     ],
 }
 
+FUND_DOC_MATCHER = KeywordMatcher(FUND_DOC_KEYWORDS)
+
+# Filenames spell keywords without spaces or with hyphens
+FUND_FILENAME_MATCHER = KeywordMatcher({
+    doc_type: [variant for kw in kw_list for variant in (kw.replace(' ', ''), kw.replace(' ', '-'))]
+    for doc_type, kw_list in FUND_DOC_KEYWORDS.items()
+})
+
 
 def find_fund_docs_in_filing(filing_path, verbose=False):
     """
@@ -156,7 +172,8 @@ def find_fund_docs_in_filing(filing_path, verbose=False):
     fund_docs = []
 
     for root, dirs, files in os.walk(filing_path):
-        for filename in files:
+        dirs.sort()
+        for filename in sorted(files):
             filepath = os.path.join(root, filename)
 
             # Check document files
@@ -174,19 +191,17 @@ def find_fund_docs_in_filing(filing_path, verbose=False):
                 # Also check filename
                 filename_lower = filename.lower()
 
-                # Check for fund document keywords
-                for doc_type, kw_list in FUND_DOC_KEYWORDS.items():
-                    for kw in kw_list:
-                        if kw in content or kw.replace(' ', '') in filename_lower or kw.replace(' ', '-') in filename_lower:
-                            # Verify it's actually a document (not just a mention)
-                            if len(content) > 5000:  # Substantial document
-                                fund_docs.append((filepath, doc_type, filename))
-                                if verbose:
-                                    print(f"      Found {doc_type}: {filename[:50]}")
-                            break
-                    else:
-                        continue
-                    break  # Only classify as one type
+                # Check for fund document keywords in one pass over each
+                hit_types = FUND_DOC_MATCHER.scan(content).keys() | FUND_FILENAME_MATCHER.scan(filename_lower).keys()
+
+                # Only classify as one type, the first in FUND_DOC_KEYWORDS order
+                doc_type = next((t for t in FUND_DOC_KEYWORDS if t in hit_types), None)
+
+                # Verify it's actually a document (not just a mention)
+                if doc_type and len(content) > 5000:  # Substantial document
+                    fund_docs.append((filepath, doc_type, filename))
+                    if verbose:
+                        print(f"      Found {doc_type}: {filename[:50]}")
 
             except Exception as e:
                 continue
@@ -194,6 +209,67 @@ def find_fund_docs_in_filing(filing_path, verbose=False):
     return fund_docs
 
 
+def keywords_fingerprint():
+    """Hash of FUND_DOC_KEYWORDS; cached classifications are dropped when it changes."""
+    return hashlib.sha256(json.dumps(FUND_DOC_KEYWORDS, sort_keys=True).encode()).hexdigest()
+
+
+def load_classification_cache():
+    """Load cached classifications, keyed by accession folder relative to TEMP_PATH."""
+    try:
+        with open(CLASSIFICATION_CACHE, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+    if data.get('keywords') != keywords_fingerprint():
+        return {}
+    return data['filings']
+
+
+def save_classification_cache(cache):
+    """Write the classification cache atomically."""
+    os.makedirs(TEMP_PATH, exist_ok=True)
+    tmp_path = CLASSIFICATION_CACHE + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'keywords': keywords_fingerprint(), 'filings': cache}, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, CLASSIFICATION_CACHE)
+
+
+def filing_signature(filing_path):
+    """Names and sizes of every file in a filing folder - stat only, no reads."""
+    signature = []
+    for root, dirs, files in os.walk(filing_path):
+        for filename in files:
+            filepath = os.path.join(root, filename)
+            signature.append([os.path.relpath(filepath, filing_path), os.path.getsize(filepath)])
+    return sorted(signature)
+
+
+def classify_filing(filing_path, cache, verbose=False):
+    """
+    find_fund_docs_in_filing, remembered per accession.
+
+    A filing is only read again if its files change (or FUND_DOC_KEYWORDS
+    does); otherwise the cached (filepath, doc_type, filename) list is returned.
+    """
+    key = os.path.relpath(filing_path, TEMP_PATH)
+    signature = filing_signature(filing_path)
+
+    entry = cache.get(key)
+    if entry and entry['signature'] == signature:
+        return [(os.path.join(filing_path, relpath), doc_type, filename)
+                for relpath, doc_type, filename in entry['docs']]
+
+    fund_docs = find_fund_docs_in_filing(filing_path, verbose=verbose)
+    cache[key] = {
+        'signature': signature,
+        'docs': [[os.path.relpath(filepath, filing_path), doc_type, filename]
+                 for filepath, doc_type, filename in fund_docs],
+    }
+    return fund_docs
+
+
 def get_output_folder(doc_type):
     """Map document type to output folder."""
     mapping = {
@@ -213,8 +289,11 @@ def download_and_extract():
     print("EXPANDED SEC FUND FORMATION DOCUMENTS EXTRACTOR")
     print("=" * 70)
 
-    # Initialize downloader
-    dl = Downloader("LegalResearchDataset", "research@university.edu", TEMP_PATH)
+    # Initialize the shared, rate-limited EDGAR fetcher
+    fetcher = EdgarFetcher("LegalResearchDataset research@university.edu")
+
+    # Output files are links into the shared blob store, so repeated exhibits cost no extra disk
+    store = BlobStore()
 
     # Create output folders
     for folder in ['Side_Letters', 'LPAs', 'Subscription_Agreements',
@@ -227,6 +306,17 @@ def download_and_extract():
     processed_companies = 0
     failed_companies = []
 
+    # Download every ticker/filing type concurrently under the shared rate limit
+    jobs = [(ticker, filing_type, FILINGS_PER_TYPE)
+            for tickers in INVESTMENT_COMPANIES.values()
+            for ticker in tickers
+            for filing_type in FILING_TYPES]
+    print(f"\nDownloading {len(jobs)} ticker/filing type combinations...")
+    downloads = fetcher.download_filings(jobs, TEMP_PATH, download_details=True)
+
+    # Filings classified on earlier runs are not read again
+    cache = load_classification_cache()
+
     # Process each category
     for category, tickers in INVESTMENT_COMPANIES.items():
         print(f"\n{'=' * 70}")
@@ -241,8 +331,9 @@ def download_and_extract():
 
             for filing_type in FILING_TYPES:
                 try:
-                    # Download filings (limit to recent ones)
-                    dl.get(filing_type, ticker, limit=5, download_details=True)
+                    result = downloads[(ticker, filing_type, FILINGS_PER_TYPE)]
+                    if isinstance(result, Exception):
+                        raise result
 
                     # Look through downloaded filings
                     ticker_path = os.path.join(TEMP_PATH, "sec-edgar-filings", ticker, filing_type)
@@ -250,12 +341,12 @@ def download_and_extract():
                     if not os.path.exists(ticker_path):
                         continue
 
-                    for accession in os.listdir(ticker_path):
+                    for accession in sorted(os.listdir(ticker_path)):
                         filing_path = os.path.join(ticker_path, accession)
                         if not os.path.isdir(filing_path):
                             continue
 
-                        fund_docs = find_fund_docs_in_filing(filing_path, verbose=True)
+                        fund_docs = classify_filing(filing_path, cache, verbose=True)
 
                         for filepath, doc_type, filename in fund_docs:
                             out_folder = get_output_folder(doc_type)
@@ -265,7 +356,7 @@ def download_and_extract():
                             out_path = os.path.join(OUTPUT_PATH, out_folder, out_name)
 
                             if not os.path.exists(out_path):
-                                shutil.copy2(filepath, out_path)
+                                store.save_file(filepath, out_path)
                                 total_found[doc_type] += 1
                                 company_found += 1
 
@@ -277,8 +368,8 @@ def download_and_extract():
             if company_found > 0:
                 print(f"    => Found {company_found} fund documents")
 
-            # Brief pause to be respectful to SEC servers
-            time.sleep(0.5)
+            # Saved per company, so a crash partway through keeps what was classified
+            save_classification_cache(cache)
 
     # Summary
     print(f"\n{'=' * 70}")
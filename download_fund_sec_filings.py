@@ -2,16 +2,18 @@
 """
 Download fund-related SEC filings that contain LPAs, side letters, etc.
 
-Uses sec-edgar-downloader to get filings from:
+Uses the shared EDGAR fetch engine to get filings from:
 - Major PE/hedge fund firms
 - Investment companies
 - BDCs (Business Development Companies)
 """
 
+import argparse
 import os
 import re
-import shutil
-from sec_edgar_downloader import Downloader
+from blob_store import BlobStore
+from document_classifier import MIN_CONFIDENCE, MODEL_FILE, load_model
+from edgar_fetch import EdgarFetcher
 
 OUTPUT_PATH = "./fund_formation_matters"
 TEMP_PATH = "./sec_fund_filings"
@@ -42,6 +44,9 @@ INVESTMENT_COMPANIES = [
     "TPVG",         # TriplePoint Venture Growth
 ]
 
+# Most recent filings to fetch per ticker and filing type
+FILINGS_PER_TYPE = 3
+
 # Filing types that commonly contain fund formation documents
 FILING_TYPES = [
     "8-K",      # Material agreements, side letters
@@ -67,19 +72,39 @@ def clean_html_to_text(content):
     return content
 
 
-def find_fund_docs_in_filing(filing_path):
+FUND_DOC_KEYWORDS = {
+    'side_letter': ['side letter', 'side-letter', 'sideletter'],
+    'lpa': ['limited partnership agreement', 'lp agreement', 'partnership agreement'],
+    'subscription': ['subscription agreement', 'subscription document'],
+    'ppm': ['private placement', 'offering memorandum', 'confidential memorandum'],
+    'investment_mgmt': ['investment management agreement', 'advisory agreement'],
+}
+
+# document_classifier.py document types that are fund documents
+MODEL_FUND_DOC_TYPES = {
+    'Limited_Partnership_Agreement': 'lpa',
+    'Subscription_Agreement': 'subscription',
+    'Investment_Management_Agreement': 'investment_mgmt',
+    'Investment_Advisory_Agreement': 'investment_mgmt',
+}
+
+
+def model_fund_doc_type(content, model):
+    """The fund document type the model saved at `model` is confident of, else None."""
+    text = re.sub(r'<[^>]+>', ' ', clean_html_to_text(content))
+    doc_type, confidence = load_model(model).classify(text)['doc_type']
+    return MODEL_FUND_DOC_TYPES.get(doc_type) if confidence >= MIN_CONFIDENCE else None
+
+
+def find_fund_docs_in_filing(filing_path, model=None):
     """
     Look through a filing's files for fund-related documents.
     Returns list of (filepath, doc_type) tuples.
+
+    With `model`, the path of a saved document_classifier model, each whole
+    file is classified first; the keywords decide when the model is unsure.
     """
     fund_docs = []
-    keywords = {
-        'side_letter': ['side letter', 'side-letter', 'sideletter'],
-        'lpa': ['limited partnership agreement', 'lp agreement', 'partnership agreement'],
-        'subscription': ['subscription agreement', 'subscription document'],
-        'ppm': ['private placement', 'offering memorandum', 'confidential memorandum'],
-        'investment_mgmt': ['investment management agreement', 'advisory agreement'],
-    }
 
     for root, dirs, files in os.walk(filing_path):
         for filename in files:
@@ -91,10 +116,16 @@ def find_fund_docs_in_filing(filing_path):
 
             try:
                 with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-                    content = f.read(50000).lower()  # Read first 50KB
+                    content = f.read() if model else f.read(50000)
 
-                # Check for fund document keywords
-                for doc_type, kw_list in keywords.items():
+                doc_type = model_fund_doc_type(content, model) if model else None
+                if doc_type:
+                    fund_docs.append((filepath, doc_type, filename))
+                    continue
+
+                # Check the first 50KB for fund document keywords
+                content = content[:50000].lower()
+                for doc_type, kw_list in FUND_DOC_KEYWORDS.items():
                     for kw in kw_list:
                         if kw in content:
                             fund_docs.append((filepath, doc_type, filename))
@@ -106,14 +137,17 @@ def find_fund_docs_in_filing(filing_path):
     return fund_docs
 
 
-def download_and_extract_fund_docs():
+def download_and_extract_fund_docs(model=None):
     """Download SEC filings and extract fund-related documents."""
     print("=" * 60)
     print("SEC FUND FORMATION DOCUMENTS EXTRACTOR")
     print("=" * 60)
 
-    # Initialize downloader
-    dl = Downloader("LegalResearch", "research@university.edu", TEMP_PATH)
+    # Initialize the shared, rate-limited EDGAR fetcher
+    fetcher = EdgarFetcher("LegalResearch research@university.edu")
+
+    # Found documents are linked out of the blob store rather than copied
+    store = BlobStore()
 
     # Create output folders
     for doc_type in ['Side_Letters', 'LPAs', 'Subscription_Agreements', 'Investment_Mgmt_Agreements']:
@@ -127,13 +161,20 @@ def download_and_extract_fund_docs():
         'investment_mgmt': 0,
     }
 
+    # Download every ticker/filing type concurrently under the shared rate limit
+    jobs = [(ticker, filing_type, FILINGS_PER_TYPE)
+            for ticker in INVESTMENT_COMPANIES for filing_type in FILING_TYPES]
+    print(f"\nDownloading {len(jobs)} ticker/filing type combinations...")
+    downloads = fetcher.download_filings(jobs, TEMP_PATH, download_details=True)
+
     for ticker in INVESTMENT_COMPANIES:
         print(f"\n--- Processing {ticker} ---")
 
         for filing_type in FILING_TYPES:
             try:
-                print(f"  Downloading {filing_type} filings...")
-                dl.get(filing_type, ticker, limit=3, download_details=True)
+                result = downloads[(ticker, filing_type, FILINGS_PER_TYPE)]
+                if isinstance(result, Exception):
+                    raise result
 
                 # Look through downloaded filings
                 ticker_path = os.path.join(TEMP_PATH, "sec-edgar-filings", ticker, filing_type)
@@ -146,7 +187,7 @@ def download_and_extract_fund_docs():
                     if not os.path.isdir(filing_path):
                         continue
 
-                    fund_docs = find_fund_docs_in_filing(filing_path)
+                    fund_docs = find_fund_docs_in_filing(filing_path, model)
 
                     for filepath, doc_type, filename in fund_docs:
                         # Determine output folder
@@ -166,7 +207,7 @@ def download_and_extract_fund_docs():
                         out_path = os.path.join(OUTPUT_PATH, out_folder, out_name)
 
                         if not os.path.exists(out_path):
-                            shutil.copy2(filepath, out_path)
+                            store.save_file(filepath, out_path)
                             print(f"    Found {doc_type}: {filename[:40]}")
                             total_found[doc_type] += 1
 
@@ -182,5 +223,17 @@ def download_and_extract_fund_docs():
         print(f"  {doc_type}: {count} documents")
 
 
+def main():
+    parser = argparse.ArgumentParser(description="Download fund-related SEC filings and extract their fund documents.")
+    parser.add_argument("--classifier", nargs="?", const=MODEL_FILE, metavar="MODEL",
+                        help="classify whole documents with a trained document_classifier model "
+                             f"(default: {MODEL_FILE}), falling back to the keywords when it is unsure")
+    args = parser.parse_args()
+    if args.classifier and not os.path.exists(args.classifier):
+        parser.error(f"no model at {args.classifier}; train one with: python document_classifier.py --train")
+
+    download_and_extract_fund_docs(args.classifier)
+
+
 if __name__ == "__main__":
-    download_and_extract_fund_docs()
+    main()
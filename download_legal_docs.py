@@ -1,11 +1,38 @@
+import argparse
+import json
 import os
+import shutil
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
 from datasets import load_dataset
+from blob_store import BlobStore
+from document_classifier import MIN_CONFIDENCE, MODEL_FILE, classify_batch
+from near_duplicates import NearDuplicateIndex
 
 # ---------------------------------------------------------
 # CONFIGURATION
 # ---------------------------------------------------------
 output_path = "./legal_test_matters"
-os.makedirs(output_path, exist_ok=True)
+
+# Scan position and unfinished matters, so an interrupted run resumes mid-stream
+CHECKPOINT_FILE = os.path.join(output_path, ".scan_checkpoint.json")
+CHECKPOINT_EVERY = 5000  # Records between checkpoints
+
+BATCH_SIZE = 200  # Records classified per worker task
+
+# Unfinished matters' documents spill to disk past this many characters held in memory
+SPILL_PATH = os.path.join(output_path, ".partial")
+MATTER_MEMORY_BUDGET = 256 * 1024 * 1024
+
+# Saved documents are stored once by content and linked into the matter folders
+store = BlobStore()
+
+# MinHash signatures of every saved document; a near-duplicate of a document
+# already in another matter is not saved again
+NEAR_DUPLICATE_INDEX = os.path.join(output_path, ".near_duplicates.json")
+near_duplicates = None  # NearDuplicateIndex, loaded in main() unless disabled
 
 TARGET_MATTERS_PER_TYPE = 5  # Creates M_and_A_1, M_and_A_2, ... M_and_A_5
 MIN_DOC_LENGTH = 15000  # Skip short docs
@@ -35,14 +62,24 @@ PRACTICE_AREAS = {
     ]
 }
 
-# Track what we've collected
-matter_counts = {"M_and_A": 0, "Funds": 0, "LevFin": 0}
-
-# Track documents per matter (to add variety within each "fake matter")
-matter_docs = {
-    "M_and_A": {},   # {1: [doc1, doc2], 2: [doc1], ...}
-    "Funds": {},
-    "LevFin": {}
+# Funds heroes only count with BDC/partnership context in the header
+FUNDS_CONTEXT = ["business development company", "investment company act", "partnership", "fund", "limited partner"]
+
+# document_classifier.py labels, mapped to the practice areas and hero keywords above
+MODEL_PRACTICE_AREAS = {"MandA": "M_and_A", "IFG": "Funds", "LevFin": "LevFin"}
+MODEL_HERO_TYPES = {
+    "Merger_Agreement": "agreement and plan of merger",
+    "Asset_Purchase_Agreement": "asset purchase agreement",
+    "Stock_Purchase_Agreement": "stock purchase agreement",
+    "Investment_Advisory_Agreement": "investment advisory agreement",
+    "Investment_Management_Agreement": "investment management agreement",
+    "Limited_Partnership_Agreement": "limited partnership agreement",
+    "Subscription_Agreement": "subscription agreement",
+    "Administration_Agreement": "administration agreement",
+    "Custody_Agreement": "custody agreement",
+    "Credit_Agreement": "credit agreement",
+    "Term_Loan_Agreement": "term loan agreement",
+    "Security_Agreement": "security agreement",
 }
 
 DOCS_PER_MATTER = 10  # Try to get ~10 docs per fake matter
@@ -55,12 +92,16 @@ def classify_document(text):
     if len(text) < MIN_DOC_LENGTH:
         return None, None
 
-    header = text[:5000].lower()
+    return classify_header(text[:5000])
+
+def classify_header(header):
+    """Classify a long-enough document by its first 5000 characters."""
+    header = header.lower()
 
     # Check Funds first (need BDC/partnership context)
     for hero in PRACTICE_AREAS["Funds"]:
         if hero in header:
-            if any(kw in header for kw in ["business development company", "investment company act", "partnership", "fund", "limited partner"]):
+            if any(kw in header for kw in FUNDS_CONTEXT):
                 return "Funds", hero
 
     # Check LevFin
@@ -75,6 +116,70 @@ def classify_document(text):
 
     return None, None
 
+def classify_with_model(texts, model):
+    """
+    Classify long-enough documents, scored as one batch by the TF-IDF model
+    saved at `model`, using the keyword rules on a document's header when
+    the model is unsure or does not take it for a hero document.
+    """
+    results = []
+    for text, prediction in zip(texts, classify_batch(texts, model)):
+        practice_area, area_confidence = prediction["practice_area"]
+        doc_type, type_confidence = prediction["doc_type"]
+        hero_type = MODEL_HERO_TYPES.get(doc_type)
+        if hero_type and min(area_confidence, type_confidence) >= MIN_CONFIDENCE:
+            results.append((MODEL_PRACTICE_AREAS[practice_area], hero_type))
+        else:
+            results.append(classify_header(text[:5000]))
+    return results
+
+def classify_chunk(headers, model=None):
+    """
+    Classify a batch of headers (None for short documents); runs on a worker.
+    With a model the batch holds whole documents instead.
+    """
+    if model:
+        results = iter(classify_with_model([text for text in headers if text is not None], model))
+        return [next(results) if text is not None else (None, None) for text in headers]
+    return [classify_header(header) if header is not None else (None, None) for header in headers]
+
+def classify_stream(records, workers=1, model=None):
+    """
+    Yield (text, practice_area, hero_type) for every record, in stream order.
+
+    Records are classified in batches. With more than one worker the batches
+    go to a process pool while the stream keeps reading ahead; only headers
+    are sent to the workers (whole documents when classifying with a model),
+    and short documents (which never match) are yielded with text None
+    instead of being held.
+    """
+    records = iter(records)
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    pending = deque()
+
+    try:
+        while True:
+            batch = [doc['text'] if len(doc['text']) >= MIN_DOC_LENGTH else None
+                     for doc in islice(records, BATCH_SIZE)]
+            if batch:
+                headers = batch if model else [text[:5000] if text is not None else None for text in batch]
+                if pool:
+                    pending.append((batch, pool.submit(classify_chunk, headers, model).result))
+                else:
+                    pending.append((batch, partial(classify_chunk, headers, model)))
+
+            # Keep a couple of batches per worker in flight
+            while pending and (not batch or len(pending) >= 2 * workers):
+                texts, result = pending.popleft()
+                for text, (practice_area, hero_type) in zip(texts, result()):
+                    yield text, practice_area, hero_type
+
+            if not batch:
+                return
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+
 def get_smart_filename(text, hero_type, doc_index):
     """Generate a descriptive filename."""
     header = text[:2000].lower()
@@ -114,84 +219,312 @@ def get_smart_filename(text, hero_type, doc_index):
     return f"Document_{doc_index}.txt"
 
 def save_matter(practice_area, matter_num, docs):
-    """Save all documents for a matter to its folder."""
+    """
+    Save all documents for a matter to its folder as links into the blob
+    store; spilled ones are read back one at a time. Near-duplicates of
+    documents already saved in another matter are skipped.
+    """
     folder_name = f"{practice_area}_{matter_num}"
     save_path = os.path.join(output_path, folder_name)
     os.makedirs(save_path, exist_ok=True)
 
     print(f"\n--- Saving {folder_name} ({len(docs)} docs) ---")
 
+    # Names written by this call; files left by an interrupted run are overwritten
+    written = set()
     for i, (text, hero_type) in enumerate(docs):
+        if text is None:
+            text = read_spilled(practice_area, matter_num, i)
+
+        # Skip near-duplicates of documents saved in other matters; wordless
+        # documents have no signature and are never compared
+        signature = near_duplicates.signature(text) if near_duplicates is not None else None
+        if signature is not None:
+            leaked = [key for key, _ in near_duplicates.query(signature)
+                      if not key.startswith(folder_name + "/")]
+            if leaked:
+                print(f"    [near-duplicate of {leaked[0]}] skipped document {i}")
+                continue
+
         filename = get_smart_filename(text, hero_type, i)
-        filepath = os.path.join(save_path, filename)
 
         # Handle duplicate filenames
-        if os.path.exists(filepath):
+        if filename in written:
             base, ext = os.path.splitext(filename)
             filename = f"{base}_{i}{ext}"
-            filepath = os.path.join(save_path, filename)
+        written.add(filename)
+        filepath = os.path.join(save_path, filename)
 
-        with open(filepath, "w", encoding="utf-8") as f:
-            f.write(text)
+        store.save_text(text, filepath)
+        if signature is not None:
+            near_duplicates.add(f"{folder_name}/{filename}", signature)
 
         marker = "[HERO]" if "HERO" in filename else "[ancillary]"
         print(f"    {marker} {filename}")
 
+    if near_duplicates is not None:
+        near_duplicates.save(NEAR_DUPLICATE_INDEX)
+
+# ---------------------------------------------------------
+# SPILLED DOCUMENTS
+# ---------------------------------------------------------
+def spill_folder(practice_area, matter_num):
+    return os.path.join(SPILL_PATH, f"{practice_area}_{matter_num}")
+
+def read_spilled(practice_area, matter_num, index):
+    """Read back the text of a spilled document."""
+    with open(os.path.join(spill_folder(practice_area, matter_num), f"{index}.txt"), "r", encoding="utf-8") as f:
+        return f.read()
+
+def spill_docs(matter_docs, budget=0):
+    """
+    Write unfinished matters' documents to SPILL_PATH, largest first, until
+    at most `budget` characters of text are held in memory. A spilled
+    document is kept as (None, hero_type).
+    """
+    held = [
+        (len(docs[i][0]), practice_area, matter_num, i)
+        for practice_area, matters in matter_docs.items()
+        for matter_num, docs in matters.items()
+        for i in range(len(docs)) if docs[i][0] is not None
+    ]
+    total = sum(size for size, _, _, _ in held)
+
+    for size, practice_area, matter_num, i in sorted(held, reverse=True):
+        if total <= budget:
+            break
+        folder = spill_folder(practice_area, matter_num)
+        os.makedirs(folder, exist_ok=True)
+        text, hero_type = matter_docs[practice_area][matter_num][i]
+        with open(os.path.join(folder, f"{i}.txt"), "w", encoding="utf-8") as f:
+            f.write(text)
+        matter_docs[practice_area][matter_num][i] = (None, hero_type)
+        total -= size
+
+# ---------------------------------------------------------
+# CHECKPOINT
+# ---------------------------------------------------------
+def new_state():
+    """Scan state: records consumed, finished matters, and unfinished matters' docs."""
+    return {
+        "position": 0,
+        # Last stream state_dict snapshot at or before position (see resume_records)
+        "stream": None,
+        "matter_counts": {"M_and_A": 0, "Funds": 0, "LevFin": 0},
+        # Documents per unfinished matter (to add variety within each "fake matter");
+        # finished matters are saved and evicted
+        "matter_docs": {"M_and_A": {}, "Funds": {}, "LevFin": {}},  # {1: [(text or None if spilled, hero), ...]}
+    }
+
+def load_checkpoint():
+    """Load the scan state from the checkpoint, or start a new one."""
+    if not os.path.exists(CHECKPOINT_FILE):
+        return new_state()
+    with open(CHECKPOINT_FILE, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    # JSON turns matter numbers into strings and (text, hero) pairs into lists
+    state["matter_docs"] = {
+        practice_area: {int(num): [tuple(doc) for doc in docs] for num, docs in matters.items()}
+        for practice_area, matters in state["matter_docs"].items()
+    }
+    return state
+
+def save_checkpoint(state):
+    """
+    Write the scan state atomically.
+
+    Every held document is spilled first, so the checkpoint itself only
+    records positions and hero types and stays small.
+    """
+    spill_docs(state["matter_docs"])
+    tmp_file = CHECKPOINT_FILE + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_file, CHECKPOINT_FILE)
+
+# ---------------------------------------------------------
+# STREAM POSITION
+# ---------------------------------------------------------
+def resume_records(ds, state):
+    """
+    The records of ds from state["position"] on.
+
+    The Pile of Law stream is an IterableDataset split into compressed
+    shard files. Its state_dict() (datasets 2.18+) records the shard and
+    the example within it, and load_state_dict() starts the next iteration
+    there without downloading the earlier shards, so a resume only reads
+    the records since the last snapshot (see track_records) and those
+    before it in the same shard. Streams without it, including plain
+    iterables, are read from the first record and discarded up to the
+    position.
+    """
+    stream = state.get("stream")
+    skip = state["position"]
+    if skip and stream and hasattr(ds, "load_state_dict"):
+        ds.load_state_dict(stream["state"])
+        skip -= stream["position"]
+    return islice(ds, skip, None)
+
+def track_records(ds, records, position, snapshots):
+    """
+    Yield the records, appending (records read, ds.state_dict()) to
+    snapshots every CHECKPOINT_EVERY records, for checkpoints to resume from.
+    """
+    can_snapshot = hasattr(ds, "state_dict")
+    for record in records:
+        position += 1
+        if can_snapshot and position % CHECKPOINT_EVERY == 0:
+            snapshots.append({"position": position, "state": ds.state_dict()})
+        yield record
+
+def stream_snapshot(snapshots, position):
+    """
+    The latest snapshot at or before position, dropping older ones; the
+    classifier pool reads ahead of the scan, so later ones may exist.
+    """
+    while len(snapshots) > 1 and snapshots[1]["position"] <= position:
+        snapshots.pop(0)
+    if snapshots and snapshots[0]["position"] <= position:
+        return snapshots[0]
+    return None
+
+# ---------------------------------------------------------
+# SCAN
+# ---------------------------------------------------------
+def scan(ds, state, workers=1, memory_budget=MATTER_MEMORY_BUDGET, model=None):
+    """
+    Fill the matters from a stream of {'text': ...} records, resuming at
+    state["position"] (see resume_records for how far back that reads).
+
+    Any iterable of records works, so the scan can be run against a local
+    stand-in for the Pile of Law stream. The state is checkpointed every
+    CHECKPOINT_EVERY records and after every saved matter; an interrupted
+    run loses at most that many records of work. The checkpoint is removed
+    once the scan completes.
+
+    Finished matters are saved and dropped straight away, and unfinished
+    ones spill to disk past `memory_budget` characters, so memory stays
+    flat however many matters are targeted. With `model`, the path of a
+    saved document_classifier model, documents are classified by it first.
+    """
+    matter_counts = state["matter_counts"]
+    matter_docs = state["matter_docs"]
+
+    if state["position"]:
+        print(f"Resuming from record {state['position']}\n")
+
+    snapshots = []
+    if state.get("stream"):
+        snapshots.append(state["stream"])
+
+    def checkpoint():
+        state["stream"] = stream_snapshot(snapshots, state["position"])
+        save_checkpoint(state)
+
+    records = track_records(ds, resume_records(ds, state), state["position"], snapshots)
+    for text, practice_area, hero_type in classify_stream(records, workers, model):
+        state["position"] += 1
+        docs_processed = state["position"]
+
+        if docs_processed % 2000 == 0:
+            print(f"[Progress] {docs_processed} docs scanned | M&A: {matter_counts['M_and_A']}, Funds: {matter_counts['Funds']}, LevFin: {matter_counts['LevFin']}")
+
+        if practice_area and matter_counts[practice_area] < TARGET_MATTERS_PER_TYPE:
+            # Determine which matter number to add this to
+            current_matter = matter_counts[practice_area] + 1
+
+            # Initialize matter if needed
+            if current_matter not in matter_docs[practice_area]:
+                matter_docs[practice_area][current_matter] = []
+
+            # Add doc to current matter
+            matter_docs[practice_area][current_matter].append((text, hero_type))
+
+            snippet = text[:50].replace('\n', ' ')
+            print(f"[Found {practice_area}_{current_matter}] {hero_type}: {snippet}...")
+
+            # If we have enough docs for this matter, finalize it and move to next
+            if len(matter_docs[practice_area][current_matter]) >= DOCS_PER_MATTER:
+                save_matter(practice_area, current_matter, matter_docs[practice_area].pop(current_matter))
+                matter_counts[practice_area] += 1
+
+                # The old checkpoint may still point at this matter's spilled docs
+                checkpoint()
+                shutil.rmtree(spill_folder(practice_area, current_matter), ignore_errors=True)
+            else:
+                spill_docs(matter_docs, memory_budget)
+
+        # Check if done
+        if all(c >= TARGET_MATTERS_PER_TYPE for c in matter_counts.values()):
+            print("\n*** All Test Sets Collected! ***")
+            break
+
+        if docs_processed % CHECKPOINT_EVERY == 0:
+            checkpoint()
+
+    # Save any partially-filled matters at the end
+    print("\n--- Saving remaining partial matters ---")
+    for practice_area in matter_docs:
+        for matter_num, docs in matter_docs[practice_area].items():
+            if docs and matter_num > matter_counts[practice_area]:
+                save_matter(practice_area, matter_num, docs)
+                matter_counts[practice_area] = matter_num
+
+    if os.path.exists(CHECKPOINT_FILE):
+        os.remove(CHECKPOINT_FILE)
+    shutil.rmtree(SPILL_PATH, ignore_errors=True)
+
 # ---------------------------------------------------------
 # MAIN EXECUTION
 # ---------------------------------------------------------
-print("Downloading Pile of Law (EDGAR Subset)...")
-ds = load_dataset("pile-of-law/pile-of-law", "edgar", split="train", streaming=True, trust_remote_code=True)
-
-print(f"Scanning for documents... Target: {TARGET_MATTERS_PER_TYPE} matters per practice area\n")
-
-docs_processed = 0
-for doc in ds:
-    docs_processed += 1
-
-    if docs_processed % 2000 == 0:
-        print(f"[Progress] {docs_processed} docs scanned | M&A: {matter_counts['M_and_A']}, Funds: {matter_counts['Funds']}, LevFin: {matter_counts['LevFin']}")
-
-    practice_area, hero_type = classify_document(doc['text'])
-
-    if practice_area and matter_counts[practice_area] < TARGET_MATTERS_PER_TYPE:
-        # Determine which matter number to add this to
-        current_matter = matter_counts[practice_area] + 1
-
-        # Initialize matter if needed
-        if current_matter not in matter_docs[practice_area]:
-            matter_docs[practice_area][current_matter] = []
-
-        # Add doc to current matter
-        matter_docs[practice_area][current_matter].append((doc['text'], hero_type))
-
-        snippet = doc['text'][:50].replace('\n', ' ')
-        print(f"[Found {practice_area}_{current_matter}] {hero_type}: {snippet}...")
-
-        # If we have enough docs for this matter, finalize it and move to next
-        if len(matter_docs[practice_area][current_matter]) >= DOCS_PER_MATTER:
-            save_matter(practice_area, current_matter, matter_docs[practice_area][current_matter])
-            matter_counts[practice_area] += 1
-
-    # Check if done
-    if all(c >= TARGET_MATTERS_PER_TYPE for c in matter_counts.values()):
-        print("\n*** All Test Sets Collected! ***")
-        break
-
-# Save any partially-filled matters at the end
-print("\n--- Saving remaining partial matters ---")
-for practice_area in matter_docs:
-    for matter_num, docs in matter_docs[practice_area].items():
-        if docs and matter_num > matter_counts[practice_area]:
-            save_matter(practice_area, matter_num, docs)
-            matter_counts[practice_area] = matter_num
-
-# Summary
-print(f"\n{'='*50}")
-print("DATASET GENERATION COMPLETE")
-print(f"{'='*50}")
-print(f"Documents scanned: {docs_processed}")
-print(f"M&A Matters: {matter_counts['M_and_A']}")
-print(f"Funds Matters: {matter_counts['Funds']}")
-print(f"LevFin Matters: {matter_counts['LevFin']}")
-print(f"\nSaved to: {output_path}/")
+def main():
+    global near_duplicates
+
+    parser = argparse.ArgumentParser(description="Build test matters from the Pile of Law EDGAR subset.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of processes to classify documents with (default: 1)")
+    parser.add_argument("--restart", action="store_true",
+                        help="ignore the checkpoint and scan from the first record")
+    parser.add_argument("--memory-budget", type=int, default=MATTER_MEMORY_BUDGET // (1024 * 1024),
+                        help="MB of unfinished-matter text to hold before spilling to disk "
+                             f"(default: {MATTER_MEMORY_BUDGET // (1024 * 1024)})")
+    parser.add_argument("--keep-near-duplicates", action="store_true",
+                        help="save documents even if a near-identical one is already in another matter")
+    parser.add_argument("--classifier", nargs="?", const=MODEL_FILE, metavar="MODEL",
+                        help="classify whole documents with a trained document_classifier model "
+                             f"(default: {MODEL_FILE}), falling back to the keyword rules when it is unsure")
+    args = parser.parse_args()
+    if args.classifier and not os.path.exists(args.classifier):
+        parser.error(f"no model at {args.classifier}; train one with: python document_classifier.py --train")
+
+    os.makedirs(output_path, exist_ok=True)
+    if args.restart:
+        shutil.rmtree(SPILL_PATH, ignore_errors=True)
+        if os.path.exists(NEAR_DUPLICATE_INDEX):
+            os.remove(NEAR_DUPLICATE_INDEX)
+    if not args.keep_near_duplicates:
+        near_duplicates = NearDuplicateIndex.load(NEAR_DUPLICATE_INDEX)
+    state = new_state() if args.restart else load_checkpoint()
+
+    print("Downloading Pile of Law (EDGAR Subset)...")
+    ds = load_dataset("pile-of-law/pile-of-law", "edgar", split="train", streaming=True, trust_remote_code=True)
+
+    print(f"Scanning for documents... Target: {TARGET_MATTERS_PER_TYPE} matters per practice area\n")
+
+    scan(ds, state, args.workers, args.memory_budget * 1024 * 1024, args.classifier)
+
+    matter_counts = state["matter_counts"]
+
+    # Summary
+    print(f"\n{'='*50}")
+    print("DATASET GENERATION COMPLETE")
+    print(f"{'='*50}")
+    print(f"Documents scanned: {state['position']}")
+    print(f"M&A Matters: {matter_counts['M_and_A']}")
+    print(f"Funds Matters: {matter_counts['Funds']}")
+    print(f"LevFin Matters: {matter_counts['LevFin']}")
+    print(f"\nSaved to: {output_path}/")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 import os
 import re
-from sec_edgar_downloader import Downloader
 from pathlib import Path
+from edgar_fetch import EdgarFetcher
 
 # ---------------------------------------------------------
 # CONFIGURATION
@@ -21,8 +21,14 @@ targets = [
 download_dir = "./sec_filings_raw"
 output_dir = "./sec_filings_txt"
 
-# Initialize Downloader
-dl = Downloader(dl_identity, dl_email, download_dir)
+# Filing types to fetch per ticker: (form, limit)
+filing_types = [
+    ("8-K", 3),   # Material Agreements / Deals
+    ("10-K", 1),  # Annual Reports / Fund Structure
+]
+
+# Initialize the shared, rate-limited EDGAR fetcher
+fetcher = EdgarFetcher(f"{dl_identity} {dl_email}")
 
 def html_to_text(html_content):
     """Simple HTML to text conversion."""
@@ -86,49 +92,52 @@ def convert_filing_to_txt(filing_path, output_base):
 # ---------------------------------------------------------
 # MAIN EXECUTION
 # ---------------------------------------------------------
-print(f"--- Starting SEC EDGAR Download ---\n")
-os.makedirs(output_dir, exist_ok=True)
-
-for ticker in targets:
-    print(f"\nProcessing: {ticker}")
-    print("=" * 40)
-
-    # Download 8-K filings (Material Agreements / Deals)
-    print(f"  Fetching 8-K filings (deals/agreements)...")
-    try:
-        dl.get("8-K", ticker, limit=3)
-    except Exception as e:
-        print(f"    Error: {e}")
-
-    # Download 10-K filings (Annual Reports / Fund Structure)
-    print(f"  Fetching 10-K filings (annual reports)...")
-    try:
-        dl.get("10-K", ticker, limit=1)
-    except Exception as e:
-        print(f"    Error: {e}")
-
-print("\n\n--- Converting HTML to TXT ---\n")
-
-# Convert all downloaded filings to text
-raw_path = Path(download_dir)
-output_path = Path(output_dir)
-
-for ticker_dir in raw_path.glob("sec-edgar-filings/*"):
-    if ticker_dir.is_dir():
-        ticker = ticker_dir.name
-        print(f"\nConverting {ticker} filings...")
-
-        for form_dir in ticker_dir.iterdir():
-            if form_dir.is_dir():
-                form_type = form_dir.name
-
-                for filing_dir in form_dir.iterdir():
-                    if filing_dir.is_dir():
-                        accession = filing_dir.name
-                        output_base = output_path / ticker / form_type / accession
-                        print(f"  {form_type}/{accession}:")
-                        convert_filing_to_txt(filing_dir, output_base)
-
-print("\n\n--- COMPLETE ---")
-print(f"Raw HTML: {download_dir}/")
-print(f"Text files: {output_dir}/")
+def main():
+    print(f"--- Starting SEC EDGAR Download ---\n")
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Fetch every ticker/form concurrently under the shared rate limit; the
+    # primary documents are the .htm files converted to text below
+    jobs = [(ticker, form, limit) for ticker in targets for form, limit in filing_types]
+    results = fetcher.download_filings(jobs, download_dir, download_details=True)
+
+    for ticker in targets:
+        print(f"\nProcessing: {ticker}")
+        print("=" * 40)
+
+        for form, limit in filing_types:
+            result = results[(ticker, form, limit)]
+            if isinstance(result, Exception):
+                print(f"  {form}: Error: {result}")
+            else:
+                print(f"  {form}: {len(result)} filings")
+
+    print("\n\n--- Converting HTML to TXT ---\n")
+
+    # Convert all downloaded filings to text
+    raw_path = Path(download_dir)
+    output_path = Path(output_dir)
+
+    for ticker_dir in raw_path.glob("sec-edgar-filings/*"):
+        if ticker_dir.is_dir():
+            ticker = ticker_dir.name
+            print(f"\nConverting {ticker} filings...")
+
+            for form_dir in ticker_dir.iterdir():
+                if form_dir.is_dir():
+                    form_type = form_dir.name
+
+                    for filing_dir in form_dir.iterdir():
+                        if filing_dir.is_dir():
+                            accession = filing_dir.name
+                            output_base = output_path / ticker / form_type / accession
+                            print(f"  {form_type}/{accession}:")
+                            convert_filing_to_txt(filing_dir, output_base)
+
+    print("\n\n--- COMPLETE ---")
+    print(f"Raw HTML: {download_dir}/")
+    print(f"Text files: {output_dir}/")
+
+
+if __name__ == "__main__":
+    main()
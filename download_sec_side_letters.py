@@ -8,83 +8,80 @@ filed as exhibits (EX-10, EX-99) in SEC filings.
 
 import os
 import re
-import time
-import requests
 from pathlib import Path
+from edgar_fetch import SEARCH_DEFAULT_RESULTS, EdgarFetcher, unique_hits
 
 OUTPUT_PATH = "./fund_formation_matters"
 
-# SEC requires specific headers
-HEADERS = {
-    'User-Agent': 'Legal Research Dataset legal@university.edu',
-    'Accept-Encoding': 'gzip, deflate',
-    'Host': 'www.sec.gov',
-}
+# Search result pages are cached here by query, forms and date range, so
+# reruns only hit EDGAR once the window below is widened
+SEARCH_CACHE = "./sec_search_cache"
+SEARCH_START = '2015-01-01'
+SEARCH_END = '2025-12-31'
 
+# SEC requires a descriptive User-Agent; the fetcher adds the other headers
+USER_AGENT = 'Legal Research Dataset legal@university.edu'
 
-def search_edgar_fulltext(query, form_types=None, max_results=50):
-    """
-    Search SEC EDGAR using the full-text search API.
-    Returns list of (filing_url, document_url, title) tuples.
-    """
-    results = []
-
-    # SEC EDGAR Full Text Search API
-    search_url = "https://efts.sec.gov/LATEST/search-index"
-
-    params = {
-        'q': query,
-        'dateRange': 'custom',
-        'startdt': '2015-01-01',
-        'enddt': '2025-12-31',
-        'page': 1,
-        'from': 0,
-        'size': max_results,
-    }
+# Shared, rate-limited fetcher for searches and downloads
+fetcher = EdgarFetcher(USER_AGENT, search_cache=SEARCH_CACHE)
 
-    if form_types:
-        params['forms'] = ','.join(form_types)
 
+def search_edgar_fulltext(query, form_types=None, max_results=SEARCH_DEFAULT_RESULTS):
+    """
+    Search SEC EDGAR using the full-text search API, paging up to max_results.
+    Returns hit dicts with 'accession', 'document', 'url', 'company' and 'form'.
+    """
     try:
-        response = requests.get(search_url, params=params, headers=HEADERS, timeout=30)
-        if response.status_code == 200:
-            data = response.json()
-            hits = data.get('hits', {}).get('hits', [])
-
-            for hit in hits:
-                source = hit.get('_source', {})
-                file_url = source.get('file_url', '')
-                form_type = source.get('form', '')
-                company = source.get('display_names', [''])[0]
-
-                if file_url:
-                    results.append({
-                        'url': f"https://www.sec.gov{file_url}",
-                        'company': company,
-                        'form': form_type,
-                    })
-
+        return fetcher.full_text_search(query, forms=form_types, startdt=SEARCH_START,
+                                        enddt=SEARCH_END, max_results=max_results)
     except Exception as e:
         print(f"  Search error: {e}")
-
-    return results
+        return []
 
 
 def download_with_sec_headers(url, dest_path):
-    """Download from SEC with proper headers."""
+    """Download from SEC through the shared fetcher."""
     try:
-        response = requests.get(url, headers=HEADERS, timeout=30)
-        response.raise_for_status()
-
-        with open(dest_path, 'wb') as f:
-            f.write(response.content)
-
+        fetcher.download(url, dest_path)
         return True
     except Exception as e:
         print(f"    Failed: {e}")
         return False
 
 
+def search_queries(queries, form_types):
+    """
+    Run several full-text searches concurrently, printing results in query
+    order. Returns the hits with repeats of the same filing document removed.
+    """
+    searches = fetcher.full_text_searches(queries, forms=form_types, startdt=SEARCH_START,
+                                          enddt=SEARCH_END)
+    all_results = []
+    for query, results in zip(queries, searches):
+        print(f"\nSearching: {query}")
+        if isinstance(results, Exception):
+            print(f"  Search error: {results}")
+            results = []
+        all_results.extend(results)
+        print(f"  Found {len(results)} results")
+    return unique_hits(all_results)
+
+
+def download_results(results, prefix, folder_path):
+    """Download search results concurrently; returns how many succeeded."""
+    def download(item):
+        i, result = item
+        company = result['company'][:30].replace(' ', '_').replace(',', '')
+        company = re.sub(r'[^\w\-]', '', company)
+        filename = f"{prefix}_{company}_{i+1}.html"
+        dest_path = os.path.join(folder_path, filename)
+
+        print(f"  Downloading: {result['company'][:40]}...")
+        return download_with_sec_headers(result['url'], dest_path)
+
+    return sum(fetcher.map(download, list(enumerate(results))))
+
+
 def search_and_download_side_letters():
     """Search for and download side letter documents."""
     print("\n" + "=" * 60)
@@ -101,38 +98,12 @@ def search_and_download_side_letters():
         '"side letter agreement" investor',
     ]
 
-    all_results = []
-    for query in queries:
-        print(f"\nSearching: {query}")
-        results = search_edgar_fulltext(query, form_types=['8-K', '10-K', 'S-1', 'EX-10'])
-        all_results.extend(results)
-        print(f"  Found {len(results)} results")
-        time.sleep(1)
-
-    # Deduplicate by URL
-    seen_urls = set()
-    unique_results = []
-    for r in all_results:
-        if r['url'] not in seen_urls:
-            seen_urls.add(r['url'])
-            unique_results.append(r)
+    unique_results = search_queries(queries, ['8-K', '10-K', 'S-1', 'EX-10'])
 
     print(f"\nTotal unique results: {len(unique_results)}")
 
     # Download top results
-    downloaded = 0
-    for i, result in enumerate(unique_results[:20]):
-        company = result['company'][:30].replace(' ', '_').replace(',', '')
-        company = re.sub(r'[^\w\-]', '', company)
-        filename = f"Side_Letter_{company}_{i+1}.html"
-        dest_path = os.path.join(folder_path, filename)
-
-        print(f"  Downloading: {result['company'][:40]}...")
-        if download_with_sec_headers(result['url'], dest_path):
-            downloaded += 1
-        time.sleep(1)
-
-    return downloaded
+    return download_results(unique_results[:20], "Side_Letter", folder_path)
 
 
 def search_and_download_lpas():
@@ -150,38 +121,12 @@ def search_and_download_lpas():
         '"agreement of limited partnership" fund',
     ]
 
-    all_results = []
-    for query in queries:
-        print(f"\nSearching: {query}")
-        results = search_edgar_fulltext(query, form_types=['8-K', '10-K', 'S-1', 'EX-99'])
-        all_results.extend(results)
-        print(f"  Found {len(results)} results")
-        time.sleep(1)
-
-    # Deduplicate
-    seen_urls = set()
-    unique_results = []
-    for r in all_results:
-        if r['url'] not in seen_urls:
-            seen_urls.add(r['url'])
-            unique_results.append(r)
+    unique_results = search_queries(queries, ['8-K', '10-K', 'S-1', 'EX-99'])
 
     print(f"\nTotal unique results: {len(unique_results)}")
 
     # Download top results
-    downloaded = 0
-    for i, result in enumerate(unique_results[:20]):
-        company = result['company'][:30].replace(' ', '_').replace(',', '')
-        company = re.sub(r'[^\w\-]', '', company)
-        filename = f"LPA_{company}_{i+1}.html"
-        dest_path = os.path.join(folder_path, filename)
-
-        print(f"  Downloading: {result['company'][:40]}...")
-        if download_with_sec_headers(result['url'], dest_path):
-            downloaded += 1
-        time.sleep(1)
-
-    return downloaded
+    return download_results(unique_results[:20], "LPA", folder_path)
 
 
 def search_and_download_subscription_docs():
@@ -198,38 +143,12 @@ def search_and_download_subscription_docs():
         '"form of subscription" fund investor',
     ]
 
-    all_results = []
-    for query in queries:
-        print(f"\nSearching: {query}")
-        results = search_edgar_fulltext(query, form_types=['8-K', 'S-1', 'EX-10'])
-        all_results.extend(results)
-        print(f"  Found {len(results)} results")
-        time.sleep(1)
-
-    # Deduplicate
-    seen_urls = set()
-    unique_results = []
-    for r in all_results:
-        if r['url'] not in seen_urls:
-            seen_urls.add(r['url'])
-            unique_results.append(r)
+    unique_results = search_queries(queries, ['8-K', 'S-1', 'EX-10'])
 
     print(f"\nTotal unique results: {len(unique_results)}")
 
     # Download top results
-    downloaded = 0
-    for i, result in enumerate(unique_results[:15]):
-        company = result['company'][:30].replace(' ', '_').replace(',', '')
-        company = re.sub(r'[^\w\-]', '', company)
-        filename = f"Subscription_{company}_{i+1}.html"
-        dest_path = os.path.join(folder_path, filename)
-
-        print(f"  Downloading: {result['company'][:40]}...")
-        if download_with_sec_headers(result['url'], dest_path):
-            downloaded += 1
-        time.sleep(1)
-
-    return downloaded
+    return download_results(unique_results[:15], "Subscription", folder_path)
 
 
 def main():
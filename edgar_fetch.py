@@ -0,0 +1,417 @@
+"""
+Shared SEC EDGAR fetch engine.
+
+Every downloader script goes through one EdgarFetcher, which keeps:
+- a global token-bucket rate limit under SEC's 10 requests per second
+- a pooled keep-alive HTTP session
+- bounded thread concurrency
+- retries with exponential backoff that honor 429 and Retry-After
+
+It also downloads filings into the same sec-edgar-filings/<ticker>/<form>/
+<accession>/ layout sec-edgar-downloader used, so the processing scripts
+are unchanged, and pages through EDGAR full-text search, caching every
+response page on disk. Base URLs are constructor arguments, so everything
+can be pointed at a local stub HTTP server.
+"""
+
+import email.utils
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# SEC allows 10 requests per second per client across all connections
+SEC_RATE_LIMIT = 10
+MAX_WORKERS = 8
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 60
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+SEC_WWW_URL = "https://www.sec.gov"
+SEC_DATA_URL = "https://data.sec.gov"
+SEC_EFTS_URL = "https://efts.sec.gov"
+
+# Full-text search returns 100 hits per page and at most 10,000 per query
+SEARCH_PAGE_SIZE = 100
+SEARCH_MAX_RESULTS = 10000
+# Callers download only the top few dozen hits, so fetch one page by default
+SEARCH_DEFAULT_RESULTS = 50
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, bursts up to `capacity`.
+
+    The default capacity of one spaces requests evenly, so no one-second
+    window ever sees more than `rate` of them.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available and take it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now >= self.updated:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                else:
+                    # Paused until self.updated
+                    wait = self.updated - now
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Stop handing out tokens to every thread for `seconds`, then refill from empty."""
+        with self.lock:
+            self.tokens = 0
+            self.updated = max(self.updated, time.monotonic() + seconds)
+
+
+def retry_after(response):
+    """Seconds to wait from a Retry-After header, or None."""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def backoff(attempt):
+    """Exponential backoff with jitter for the given retry attempt."""
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+def parse_search_hit(hit, www_url=SEC_WWW_URL):
+    """
+    Turn a full-text search hit into {'accession', 'document', 'url',
+    'company', 'form', 'file_date'}, or None if it names no document.
+
+    Hit ids are '<accession>:<document>'; the URL comes from `file_url` when
+    the hit has one, else from the filer's CIK and the accession.
+    """
+    source = hit.get('_source', {})
+    accession, _, document = hit.get('_id', '').partition(':')
+    accession = source.get('adsh') or accession
+    file_url = source.get('file_url')
+
+    if file_url:
+        url = f"{www_url}{file_url}"
+        document = document or file_url.rsplit('/', 1)[-1]
+    elif accession and document and source.get('ciks'):
+        cik = int(source['ciks'][0])
+        url = f"{www_url}/Archives/edgar/data/{cik}/{accession.replace('-', '')}/{document}"
+    else:
+        return None
+
+    return {
+        'accession': accession,
+        'document': document,
+        'url': url,
+        'company': (source.get('display_names') or [''])[0],
+        'form': source.get('form', ''),
+        'file_date': source.get('file_date', ''),
+    }
+
+
+def unique_hits(hits):
+    """Drop repeated (accession, document) hits, keeping the first of each."""
+    seen = set()
+    unique = []
+    for hit in hits:
+        key = (hit['accession'], hit['document']) if hit['accession'] else hit['url']
+        if key not in seen:
+            seen.add(key)
+            unique.append(hit)
+    return unique
+
+
+class EdgarFetcher:
+    """Rate-limited, pooled, retrying HTTP client for SEC EDGAR."""
+
+    def __init__(self, user_agent, rate=SEC_RATE_LIMIT, max_workers=MAX_WORKERS,
+                 max_retries=MAX_RETRIES, timeout=30,
+                 www_url=SEC_WWW_URL, data_url=SEC_DATA_URL, efts_url=SEC_EFTS_URL,
+                 search_cache=None):
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.www_url = www_url.rstrip('/')
+        self.data_url = data_url.rstrip('/')
+        self.efts_url = efts_url.rstrip('/')
+        self.search_cache = search_cache
+        self.limiter = TokenBucket(rate)
+
+        self.session = requests.Session()
+        self.session.headers.update({
+            'User-Agent': user_agent,
+            'Accept-Encoding': 'gzip, deflate',
+        })
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._ciks = None
+        self._ciks_lock = threading.Lock()
+
+    # -----------------------------------------------------
+    # HTTP
+    # -----------------------------------------------------
+    def get(self, url, **kwargs):
+        """
+        GET a URL under the shared rate limit.
+
+        Connection errors and 429/5xx responses are retried with exponential
+        backoff; a 429 pauses every thread for the Retry-After delay. Raises
+        requests.HTTPError for any other error status.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            try:
+                response = self.session.get(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(backoff(attempt))
+                continue
+
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                response.raise_for_status()
+                return response
+
+            delay = retry_after(response)
+            if delay is None:
+                delay = backoff(attempt)
+            response.close()
+
+            if response.status_code == 429:
+                self.limiter.pause(delay)
+            else:
+                time.sleep(delay)
+
+    def download(self, url, dest_path):
+        """Download a URL to dest_path, writing to a temporary file first."""
+        response = self.get(url)
+        tmp_path = dest_path + '.part'
+        with open(tmp_path, 'wb') as f:
+            f.write(response.content)
+        os.replace(tmp_path, dest_path)
+        return len(response.content)
+
+    def map(self, func, items):
+        """Run func over items on the fetcher's thread pool; results keep input order."""
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            return list(pool.map(func, items))
+
+    # -----------------------------------------------------
+    # EDGAR filings
+    # -----------------------------------------------------
+    def cik(self, ticker):
+        """Look up a ticker's CIK in SEC's company_tickers.json (fetched once)."""
+        with self._ciks_lock:
+            if self._ciks is None:
+                data = self.get(f"{self.www_url}/files/company_tickers.json").json()
+                self._ciks = {row['ticker'].upper(): row['cik_str'] for row in data.values()}
+        cik = self._ciks.get(ticker.upper())
+        if cik is None:
+            raise ValueError(f"Ticker {ticker} is invalid or has no CIK")
+        return cik
+
+    def recent_filings(self, ticker, form, limit):
+        """Return up to `limit` of the ticker's latest filings of exactly this form."""
+        cik = self.cik(ticker)
+        data = self.get(f"{self.data_url}/submissions/CIK{cik:010d}.json").json()
+        recent = data['filings']['recent']
+
+        filings = []
+        for accession, filing_form, primary_document in zip(
+                recent['accessionNumber'], recent['form'], recent['primaryDocument']):
+            if filing_form == form:
+                filings.append({
+                    'cik': cik,
+                    'accession': accession,
+                    'primary_document': primary_document,
+                })
+                if len(filings) >= limit:
+                    break
+        return filings
+
+    def download_filing(self, ticker, form, filing, root, download_details=False):
+        """Save one filing as <root>/sec-edgar-filings/<ticker>/<form>/<accession>/."""
+        accession = filing['accession']
+        folder = os.path.join(root, "sec-edgar-filings", ticker, form, accession)
+        os.makedirs(folder, exist_ok=True)
+        base_url = f"{self.www_url}/Archives/edgar/data/{filing['cik']}/{accession.replace('-', '')}"
+
+        # Filings never change once accepted, so existing files are kept
+        submission_path = os.path.join(folder, "full-submission.txt")
+        if not os.path.exists(submission_path):
+            self.download(f"{base_url}/{accession}.txt", submission_path)
+
+        if download_details and filing['primary_document']:
+            ext = os.path.splitext(filing['primary_document'])[1] or '.html'
+            details_path = os.path.join(folder, f"primary-document{ext}")
+            if not os.path.exists(details_path):
+                self.download(f"{base_url}/{filing['primary_document']}", details_path)
+
+        return folder
+
+    def download_filings(self, jobs, root, download_details=False):
+        """
+        Download filings for many (ticker, form, limit) jobs concurrently.
+
+        Returns {job: [accession folders]} or {job: exception} for failed jobs.
+        """
+        def resolve(job):
+            ticker, form, limit = job
+            try:
+                return self.recent_filings(ticker, form, limit)
+            except Exception as e:
+                return e
+
+        listings = dict(zip(jobs, self.map(resolve, jobs)))
+
+        files = [
+            (job, filing)
+            for job, filings in listings.items() if not isinstance(filings, Exception)
+            for filing in filings
+        ]
+
+        def fetch(item):
+            (ticker, form, _), filing = item
+            try:
+                return self.download_filing(ticker, form, filing, root, download_details)
+            except Exception as e:
+                return e
+
+        results = {job: (filings if isinstance(filings, Exception) else [])
+                   for job, filings in listings.items()}
+        for (job, _), folder in zip(files, self.map(fetch, files)):
+            if isinstance(results[job], Exception):
+                continue
+            if isinstance(folder, Exception):
+                results[job] = folder
+            else:
+                results[job].append(folder)
+        return results
+
+    # -----------------------------------------------------
+    # Full-text search
+    # -----------------------------------------------------
+    def search_page(self, query, forms, startdt, enddt, offset):
+        """
+        One page of EDGAR full-text search results as JSON.
+
+        With a search_cache folder, pages are stored under a hash of the
+        query, forms, date range and offset, and served from disk after.
+        Without enddt the range is left open; give one for results that do
+        not go stale in the cache.
+        """
+        params = {
+            'q': query,
+            'dateRange': 'custom',
+            'startdt': startdt,
+            'from': offset,
+        }
+        if enddt:
+            params['enddt'] = enddt
+        if forms:
+            params['forms'] = ','.join(forms)
+
+        cache_file = None
+        if self.search_cache:
+            key = hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+            cache_file = os.path.join(self.search_cache, f"{key}.json")
+            if os.path.exists(cache_file):
+                with open(cache_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+
+        data = self.get(f"{self.efts_url}/LATEST/search-index", params=params).json()
+
+        if cache_file:
+            os.makedirs(self.search_cache, exist_ok=True)
+            tmp_file = cache_file + '.tmp'
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_file, cache_file)
+        return data
+
+    def full_text_search(self, query, forms=None, startdt='2001-01-01', enddt=None,
+                         max_results=SEARCH_DEFAULT_RESULTS):
+        """
+        Full-text search hits for a query, in rank order, up to max_results.
+
+        Returns parsed hits (see parse_search_hit), duplicates within the
+        query removed.
+        """
+        hits = self.full_text_searches([query], forms, startdt, enddt, max_results)[0]
+        if isinstance(hits, Exception):
+            raise hits
+        return hits
+
+    def full_text_searches(self, queries, forms=None, startdt='2001-01-01', enddt=None,
+                           max_results=SEARCH_DEFAULT_RESULTS):
+        """
+        Run several full-text searches; returns one list of hits per query,
+        or the exception for a query any of whose pages failed.
+
+        The first page of every query is fetched in one round, which gives
+        each query's total; the remaining pages of all queries go in a
+        second round, so no pool is ever nested inside another.
+        """
+        max_results = min(max_results, SEARCH_MAX_RESULTS)
+
+        def page(item):
+            query, offset = item
+            try:
+                return self.search_page(query, forms, startdt, enddt, offset)
+            except Exception as e:
+                return e
+
+        firsts = self.map(page, [(query, 0) for query in queries])
+        failed = {query: first for query, first in zip(queries, firsts) if isinstance(first, Exception)}
+
+        rest = []
+        for query, first in zip(queries, firsts):
+            if query in failed:
+                continue
+            total = min(first.get('hits', {}).get('total', {}).get('value', 0), max_results)
+            rest.extend((query, offset) for offset in range(SEARCH_PAGE_SIZE, total, SEARCH_PAGE_SIZE))
+        pages = {query: [first] for query, first in zip(queries, firsts)}
+        for (query, _), data in zip(rest, self.map(page, rest)):
+            if isinstance(data, Exception):
+                failed.setdefault(query, data)
+            pages[query].append(data)
+
+        results = []
+        for query in queries:
+            if query in failed:
+                results.append(failed[query])
+                continue
+            hits = [parse_search_hit(hit, self.www_url)
+                    for data in pages[query] for hit in data.get('hits', {}).get('hits', [])]
+            results.append(unique_hits([hit for hit in hits if hit])[:max_results])
+        return results
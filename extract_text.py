@@ -0,0 +1,241 @@
+"""
+Cached text extraction for the PDF and DOCX documents in the matter folders.
+
+Each binary document gets its text written beside it, in the same matter
+folder, as '<name>.pdf.txt' or '<name>.docx.txt', so everything that reads
+the .txt documents of a matter (corpus.py and the tools built on it) sees
+it. A hidden sidecar '.<name>.pdf.extract.json' records the SHA-256 of the
+source file, the extractor version and the character offset at which each
+page starts. A document is parsed again only when its hash or
+EXTRACTOR_VERSION changes, so repeated runs only hash the binaries.
+
+DOCX files are read with the standard library. PDFs need the pypdf package;
+without it extract_all() skips them, reporting how many, without hashing them.
+
+    python extract_text.py                       # legal_test_matters and cuad_matters
+    python extract_text.py cuad_matters --workers 8
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import zipfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import pypdf
+except ImportError:
+    pypdf = None
+
+EXTRACT_ROOTS = ["./legal_test_matters", "./cuad_matters"]
+EXTENSIONS = ('.pdf', '.docx')
+
+# Bump when extracted text or page offsets change
+EXTRACTOR_VERSION = 1
+
+PAGE_BREAK = "\f"  # Between pages in the extracted text
+
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+
+def text_path(path):
+    return path + ".txt"
+
+
+def sidecar_path(path):
+    folder, name = os.path.split(path)
+    return os.path.join(folder, f".{name}.extract.json")
+
+
+def file_sha256(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+# ---------------------------------------------------------
+# EXTRACTORS
+# ---------------------------------------------------------
+def join_pages(pages):
+    """Join page texts with PAGE_BREAK; returns (text, page start offsets)."""
+    offsets = []
+    position = 0
+    for page in pages:
+        offsets.append(position)
+        position += len(page) + len(PAGE_BREAK)
+    return PAGE_BREAK.join(pages), offsets
+
+
+def extract_pdf(path):
+    """Text of every page of a PDF, as (text, page start offsets)."""
+    if pypdf is None:
+        raise ImportError("pip install pypdf to extract text from PDFs")
+    reader = pypdf.PdfReader(path)
+    return join_pages([(page.extract_text() or '').strip() for page in reader.pages])
+
+
+def extract_docx(path):
+    """
+    Paragraph text of a DOCX body, tables included, as (text, page start
+    offsets). Pages are split at explicit and last-rendered page breaks.
+    """
+    with zipfile.ZipFile(path) as archive:
+        root = ET.fromstring(archive.read('word/document.xml'))
+
+    pages = [[]]
+    for paragraph in root.iter(W + 'p'):
+        if paragraph.find(f'{W}pPr/{W}pageBreakBefore') is not None and pages[-1]:
+            pages.append([])
+        line = []
+        for node in paragraph.iter():
+            if node.tag == W + 't':
+                line.append(node.text or '')
+            elif node.tag == W + 'tab':
+                line.append('\t')
+            elif node.tag in (W + 'br', W + 'cr'):
+                if node.get(W + 'type') == 'page':
+                    pages[-1].append(''.join(line))
+                    pages.append([])
+                    line = []
+                else:
+                    line.append('\n')
+            elif node.tag == W + 'lastRenderedPageBreak' and (line or pages[-1]):
+                pages[-1].append(''.join(line))
+                pages.append([])
+                line = []
+        pages[-1].append(''.join(line))
+
+    return join_pages(['\n'.join(lines).strip() for lines in pages])
+
+
+EXTRACTORS = {'.pdf': extract_pdf, '.docx': extract_docx}
+
+
+def extract(path):
+    """(text, page start offsets) of a PDF or DOCX file."""
+    return EXTRACTORS[os.path.splitext(path)[1].lower()](path)
+
+
+# ---------------------------------------------------------
+# CACHE
+# ---------------------------------------------------------
+def load_sidecar(path):
+    try:
+        with open(sidecar_path(path), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_current(path, digest):
+    """True if the cached text was extracted from this content by this extractor version."""
+    sidecar = load_sidecar(path)
+    return (sidecar is not None and sidecar.get('sha256') == digest
+            and sidecar.get('version') == EXTRACTOR_VERSION
+            and os.path.exists(text_path(path)))
+
+
+def save_extraction(path, digest, text, pages):
+    """Write the text beside the source and then its sidecar, each atomically."""
+    for dest, write in [
+        (text_path(path), lambda f: f.write(text)),
+        (sidecar_path(path), lambda f: json.dump(
+            {'sha256': digest, 'version': EXTRACTOR_VERSION, 'pages': pages}, f)),
+    ]:
+        tmp_path = dest + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            write(f)
+        os.replace(tmp_path, dest)
+
+
+def load_text(path, cache=True):
+    """
+    (text, page start offsets) of a PDF or DOCX file, from the cache when it
+    is current, else extracted now and, if `cache`, written beside it.
+    """
+    digest = file_sha256(path)
+    if is_current(path, digest):
+        with open(text_path(path), 'r', encoding='utf-8') as f:
+            return f.read(), load_sidecar(path)['pages']
+    text, pages = extract(path)
+    if cache:
+        save_extraction(path, digest, text, pages)
+    return text, pages
+
+
+def find_binaries(roots):
+    """Every PDF and DOCX under the roots, skipping hidden files and folders."""
+    files = []
+    for root in roots:
+        for folder, dirs, names in os.walk(root):
+            dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+            files.extend(os.path.join(folder, name) for name in sorted(names)
+                         if name.lower().endswith(EXTENSIONS) and not name.startswith('.'))
+    return files
+
+
+def extract_job(path):
+    """Worker: extract one file; returns (text, pages) or the error message."""
+    try:
+        return extract(path)
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+
+
+def extract_all(roots=EXTRACT_ROOTS, workers=1, force=False):
+    """
+    Extract every stale PDF and DOCX under roots on `workers` processes;
+    PDFs are skipped when pypdf is not installed. Returns (extracted,
+    cached, failed) counts.
+    """
+    paths = find_binaries(roots)
+    if pypdf is None:
+        documents = [path for path in paths if not path.lower().endswith('.pdf')]
+        if len(documents) < len(paths):
+            print(f"  Skipping {len(paths) - len(documents)} PDF(s): pip install pypdf to extract them")
+        paths = documents
+
+    stale = []
+    cached = 0
+    for path in paths:
+        digest = file_sha256(path)
+        if not force and is_current(path, digest):
+            cached += 1
+        else:
+            stale.append((path, digest))
+
+    extracted = failed = 0
+    if not stale:
+        return extracted, cached, failed
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for (path, digest), result in zip(stale, pool.map(extract_job, [path for path, _ in stale])):
+            if isinstance(result, str):
+                print(f"  Failed: {path}: {result}")
+                failed += 1
+                continue
+            text, pages = result
+            save_extraction(path, digest, text, pages)
+            print(f"  {path}: {len(pages)} page(s), {len(text)} chars")
+            extracted += 1
+    return extracted, cached, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract text from the PDF and DOCX documents in matter folders.")
+    parser.add_argument("folders", nargs="*", default=EXTRACT_ROOTS,
+                        help=f"folders to scan (default: {' '.join(EXTRACT_ROOTS)})")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="processes to extract with")
+    parser.add_argument("--force", action="store_true", help="re-extract even when the cached text is current")
+    args = parser.parse_args()
+
+    extracted, cached, failed = extract_all(args.folders, args.workers, args.force)
+    print(f"\nExtracted {extracted}, already current {cached}, failed {failed}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""
+Near-duplicate detection for the document folders.
+
+Each document is reduced to the set of its word 5-gram shingles and then
+to a MinHash signature, whose positions agree between two documents about
+as often as their shingle sets overlap (Jaccard similarity). Signatures
+are split into LSH bands: documents sharing any band are candidates, and
+only candidates are compared, so finding every near-duplicate takes
+roughly linear time instead of comparing all pairs.
+
+The signature uses one-permutation hashing: every shingle is hashed once
+and lands in one of NUM_PERM bins, keeping the minimum per bin, with empty
+bins filled from the next non-empty one. That costs one hash per shingle
+rather than NUM_PERM.
+
+Documents without a single word have no shingles and no signature; they
+are never indexed, since any two of them would look identical.
+
+The index can be saved and extended later; download_legal_docs uses one to
+keep near-identical documents out of more than one matter. Report the
+near-duplicate clusters in folders of text files:
+
+    python near_duplicates.py legal_test_matters sec_filings_clean
+    python near_duplicates.py --index near_duplicates.json sec_filings_clean
+"""
+
+import argparse
+import json
+import os
+import re
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+SHINGLE_WORDS = 5
+NUM_PERM = 128
+BANDS = 16  # 8 rows per band: pairs above ~0.7 similarity almost always share a band
+THRESHOLD = 0.8
+
+EMPTY = 1 << 64
+CRC_SEED = 0x9E3779B9
+WORD_RE = re.compile(r'\w+')
+
+
+def shingle_hashes(text, k=SHINGLE_WORDS):
+    """Return the set of 64-bit hashes of the text's lowercased word k-grams.
+
+    Texts shorter than k words give one shingle of all their words; texts
+    without words give an empty set.
+    """
+    words = WORD_RE.findall(text.lower())
+    if not words:
+        return set()
+    grams = (' '.join(words[i:i + k]).encode('utf-8') for i in range(max(len(words) - k + 1, 1)))
+    # Two differently seeded CRC-32s: stable across runs, unlike hash(), and
+    # about twice as fast as a cryptographic hash
+    return {zlib.crc32(gram) << 32 | zlib.crc32(gram, CRC_SEED) for gram in grams}
+
+
+def minhash(hashes, num_perm=NUM_PERM):
+    """One-permutation MinHash signature of a set of shingle hashes."""
+    bins = [EMPTY] * num_perm
+    for h in hashes:
+        b = h % num_perm
+        v = h // num_perm
+        if v < bins[b]:
+            bins[b] = v
+
+    # Fill each empty bin from the next non-empty one, offset by the distance
+    # so borrowed values only agree when they were borrowed the same way
+    filled = [i for i in range(num_perm) if bins[i] != EMPTY]
+    if not filled:
+        return bins
+    signature = list(bins)
+    for i in range(num_perm):
+        if bins[i] == EMPTY:
+            j = next((f for f in filled if f > i), filled[0] + num_perm)
+            signature[i] = bins[j % num_perm] + (j - i) * EMPTY
+    return signature
+
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(a == b for a, b in zip(sig_a, sig_b)) / len(sig_a)
+
+
+def text_signature(text, num_perm=NUM_PERM):
+    """MinHash signature of a document's text, or None if it has no words."""
+    hashes = shingle_hashes(text)
+    return minhash(hashes, num_perm) if hashes else None
+
+
+class NearDuplicateIndex:
+    """Incremental MinHash LSH index of {key: signature}.
+
+    stamps optionally records what each signature was computed from (the
+    command line keeps [mtime_ns, size] of each file) so it can be redone
+    when that changes.
+    """
+
+    def __init__(self, threshold=THRESHOLD, num_perm=NUM_PERM, bands=BANDS):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.signatures = {}
+        self.stamps = {}
+        self.buckets = [{} for _ in range(bands)]
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def __contains__(self, key):
+        return key in self.signatures
+
+    def signature(self, text):
+        return text_signature(text, self.num_perm)
+
+    def band_keys(self, signature):
+        rows = self.rows
+        return [tuple(signature[b * rows:(b + 1) * rows]) for b in range(self.bands)]
+
+    def add(self, key, signature, stamp=None):
+        """Index a signature under key, replacing any earlier one."""
+        if key in self.signatures:
+            self.remove(key)
+        self.signatures[key] = signature
+        if stamp is not None:
+            self.stamps[key] = stamp
+        for bucket, band in zip(self.buckets, self.band_keys(signature)):
+            bucket.setdefault(band, []).append(key)
+
+    def remove(self, key):
+        signature = self.signatures.pop(key)
+        self.stamps.pop(key, None)
+        for bucket, band in zip(self.buckets, self.band_keys(signature)):
+            keys = bucket[band]
+            keys.remove(key)
+            if not keys:
+                del bucket[band]
+
+    def candidates(self, signature):
+        """Keys sharing at least one band with the signature."""
+        found = set()
+        for bucket, band in zip(self.buckets, self.band_keys(signature)):
+            found.update(bucket.get(band, ()))
+        return found
+
+    def query(self, signature, threshold=None):
+        """Return [(key, similarity)] at or above the threshold, most similar first."""
+        threshold = self.threshold if threshold is None else threshold
+        matches = []
+        for key in self.candidates(signature):
+            score = similarity(signature, self.signatures[key])
+            if score >= threshold:
+                matches.append((key, score))
+        return sorted(matches, key=lambda match: (-match[1], match[0]))
+
+    def clusters(self):
+        """Group every indexed key with its near-duplicates; returns clusters of 2+ keys."""
+        parent = {key: key for key in self.signatures}
+
+        def root(key):
+            while parent[key] != key:
+                parent[key] = parent[parent[key]]
+                key = parent[key]
+            return key
+
+        for key, signature in self.signatures.items():
+            for other, _ in self.query(signature):
+                a, b = root(key), root(other)
+                if a != b:
+                    parent[max(a, b)] = min(a, b)
+
+        groups = {}
+        for key in sorted(self.signatures):
+            groups.setdefault(root(key), []).append(key)
+        return [keys for keys in groups.values() if len(keys) > 1]
+
+    def save(self, path):
+        """Write the signatures atomically; bands are rebuilt on load."""
+        data = {
+            'threshold': self.threshold,
+            'num_perm': self.num_perm,
+            'bands': self.bands,
+            'signatures': self.signatures,
+            'stamps': self.stamps,
+        }
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, threshold=None):
+        """Load a saved index, or return an empty one if path does not exist."""
+        if not os.path.exists(path):
+            return cls(THRESHOLD if threshold is None else threshold)
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        index = cls(data['threshold'] if threshold is None else threshold,
+                    data['num_perm'], data['bands'])
+        stamps = data.get('stamps', {})
+        for key, signature in data['signatures'].items():
+            index.add(key, signature, stamps.get(key))
+        return index
+
+
+# ---------------------------------------------------------
+# COMMAND LINE
+# ---------------------------------------------------------
+def file_stamp(path):
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def file_signature(path):
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        return text_signature(f.read())
+
+
+def find_text_files(folders):
+    """Every .txt file under the folders, skipping hidden files and folders."""
+    files = []
+    for folder in folders:
+        for root, dirs, names in os.walk(folder):
+            dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+            files.extend(os.path.join(root, name) for name in sorted(names)
+                         if name.endswith('.txt') and not name.startswith('.'))
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find near-duplicate text documents.")
+    parser.add_argument("folders", nargs="+", help="folders of .txt documents")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="estimated Jaccard similarity counted as a near-duplicate")
+    parser.add_argument("--index", help="saved index to update; only new or changed files are read")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="processes computing signatures")
+    args = parser.parse_args()
+
+    index = (NearDuplicateIndex.load(args.index, args.threshold) if args.index
+             else NearDuplicateIndex(args.threshold))
+    gone = [key for key in index.signatures if not os.path.exists(key)]
+    for key in gone:
+        index.remove(key)
+
+    stamps = {path: file_stamp(path) for path in find_text_files(args.folders)}
+    files = [path for path, stamp in stamps.items() if index.stamps.get(path) != stamp]
+    print(f"Indexing {len(files)} new or changed files ({len(stamps) - len(files)} unchanged, "
+          f"{len(gone)} removed)...")
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for path, signature in zip(files, pool.map(file_signature, files, chunksize=16)):
+            if signature is not None:
+                index.add(path, signature, stamps[path])
+            elif path in index:
+                index.remove(path)
+    if args.index:
+        index.save(args.index)
+
+    clusters = index.clusters()
+    for keys in sorted(clusters, key=len, reverse=True):
+        print(f"\n{len(keys)} near-duplicates:")
+        for key in keys:
+            print(f"  {key}")
+    print(f"\n{len(clusters)} clusters, {sum(len(keys) - 1 for keys in clusters)} "
+          f"redundant of {len(index)} documents")
+
+
+if __name__ == "__main__":
+    main()
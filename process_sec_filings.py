@@ -1,141 +1,915 @@
+import argparse
+import binascii
+import codecs
+import hashlib
+import json
+import mmap
 import os
 import re
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from itertools import product
 from pathlib import Path
 
 raw_dir = Path("./sec_filings_raw/sec-edgar-filings")
 output_dir = Path("./sec_filings_clean")
 
-def clean_sec_text(content):
-    """Clean SEC filing text - remove HTML tags and clean up."""
-    # Remove SGML/XML headers
-    content = re.sub(r'<SEC-HEADER>.*?</SEC-HEADER>', '', content, flags=re.DOTALL)
-    content = re.sub(r'<IMS-HEADER>.*?</IMS-HEADER>', '', content, flags=re.DOTALL)
-
-    # Remove XML declarations
-    content = re.sub(r'<\?xml[^>]*\?>', '', content)
-
-    # Remove script and style
-    content = re.sub(r'<script[^>]*>.*?</script>', '', content, flags=re.DOTALL | re.IGNORECASE)
-    content = re.sub(r'<style[^>]*>.*?</style>', '', content, flags=re.DOTALL | re.IGNORECASE)
-
-    # Replace common entities
-    content = content.replace('&nbsp;', ' ')
-    content = content.replace('&amp;', '&')
-    content = content.replace('&lt;', '<')
-    content = content.replace('&gt;', '>')
-    content = content.replace('&quot;', '"')
-    content = content.replace('&#39;', "'")
-    content = re.sub(r'&#\d+;', ' ', content)
-
-    # Add line breaks for block elements
-    content = re.sub(r'<br\s*/?>', '\n', content, flags=re.IGNORECASE)
-    content = re.sub(r'</p>', '\n\n', content, flags=re.IGNORECASE)
-    content = re.sub(r'</div>', '\n', content, flags=re.IGNORECASE)
-    content = re.sub(r'</tr>', '\n', content, flags=re.IGNORECASE)
-    content = re.sub(r'</td>', '\t', content, flags=re.IGNORECASE)
-    content = re.sub(r'</li>', '\n', content, flags=re.IGNORECASE)
-
-    # Remove all HTML tags
-    content = re.sub(r'<[^>]+>', '', content)
-
-    # Clean up excessive whitespace
-    content = re.sub(r'\n\s*\n\s*\n+', '\n\n', content)
-    content = re.sub(r'[ \t]+', ' ', content)
-    content = re.sub(r' +\n', '\n', content)
-
-    return content.strip()
-
-def extract_exhibits(content):
-    """Try to find and extract exhibit documents from the filing."""
-    exhibits = {}
-
-    # Look for DOCUMENT sections
-    doc_pattern = r'<DOCUMENT>(.*?)</DOCUMENT>'
-    documents = re.findall(doc_pattern, content, re.DOTALL)
-
-    for i, doc in enumerate(documents):
-        # Try to get document type
-        type_match = re.search(r'<TYPE>([^\n<]+)', doc)
-        filename_match = re.search(r'<FILENAME>([^\n<]+)', doc)
-
-        doc_type = type_match.group(1).strip() if type_match else f"doc_{i}"
-        filename = filename_match.group(1).strip() if filename_match else f"document_{i}.txt"
+FULL_SUBMISSION_NAME = "full_submission_cleaned.txt"
+
+# Records what each output folder was built from, so unchanged accessions are skipped
+MANIFEST_FILE = output_dir / "manifest.json"
+
+# Bump when clean_sec_text output changes
+CLEANER_VERSION = 1
+# Bump when extract_exhibits changes which documents are kept or how they are named
+EXTRACTOR_VERSION = 2
+
+# What happens to each <DOCUMENT>, looked up by <FILENAME> extension and then
+# by <TYPE>. Anything not listed is cleaned as text.
+#   'text'    clean it and keep it if it is substantial
+#   'binary'  uudecode it to a sidecar file with its original extension
+#   'skip'    drop it without cleaning
+DOCUMENT_POLICY = {
+    # Uuencoded binaries
+    '.pdf': 'binary',
+    '.jpg': 'skip',
+    '.jpeg': 'skip',
+    '.gif': 'skip',
+    '.png': 'skip',
+    '.zip': 'skip',
+    '.xls': 'skip',
+    '.xlsx': 'skip',
+    'GRAPHIC': 'skip',
+    'ZIP': 'skip',
+    'EXCEL': 'skip',
+    'PDF': 'binary',
+
+    # XBRL and viewer support files
+    '.json': 'skip',
+    '.css': 'skip',
+    '.js': 'skip',
+    '.xml': 'skip',
+    '.xsd': 'skip',
+    'JSON': 'skip',
+    'EX-101.INS': 'skip',
+    'EX-101.SCH': 'skip',
+    'EX-101.CAL': 'skip',
+    'EX-101.DEF': 'skip',
+    'EX-101.LAB': 'skip',
+    'EX-101.PRE': 'skip',
+}
+
+# With --workers, submissions at least this big are cleaned one <DOCUMENT> per task
+SPLIT_SUBMISSION_BYTES = 8 * 1024 * 1024
+
+# Submissions are cleaned in chunks of this many characters
+CHUNK_SIZE = 64 * 1024
+
+# Blocks dropped wherever they start, even inside a tag. DROP_START matches
+# the start of each kind and DROP_END, indexed by its group number, the
+# literal that ends it (None for blocks that are just the start tag).
+DROP_START = re.compile(
+    r'<(?:(SEC-HEADER>)|(IMS-HEADER>)|(\?xml[^>]*\?>)|((?i:script)[^>]*>)|((?i:style)[^>]*>))')
+DROP_END = [
+    None,
+    re.compile(r'</SEC-HEADER>'),
+    re.compile(r'</IMS-HEADER>'),
+    None,
+    re.compile(r'</script>', re.IGNORECASE),
+    re.compile(r'</style>', re.IGNORECASE),
+]
+
+# What each entity (or '&amp;' followed by another entity) decodes to;
+# numeric entities not listed here become a space
+ENTITY = re.compile(r'&(?:nbsp;|amp;(?:lt;|gt;|quot;|#39;|#\d+;)?|lt;|gt;|quot;|#39;|#\d+;)')
+ENTITY_TEXT = {
+    '&nbsp;': ' ',
+    '&amp;': '&',
+    '&lt;': '<',
+    '&gt;': '>',
+    '&quot;': '"',
+    '&#39;': "'",
+    '&amp;lt;': '<',
+    '&amp;gt;': '>',
+    '&amp;quot;': '"',
+    '&amp;#39;': "'",
+}
+# Anything an entity (or '&amp;' followed by another entity) can start with
+PARTIAL_ENTITY = re.compile(r'&(?:[a-z]{0,4}|amp;(?:[a-z]{0,4}|#\d*)|#\d*)')
+
+# The inside of a block tag, without its angle brackets, and what the tag
+# turns into. BLOCK_TAG_PREFIX matches anything the inside can start with.
+BLOCK_TAG_BODY = re.compile(r'(br)\s*/?|(/p|/div|/tr|/td|/li)', re.IGNORECASE)
+BLOCK_TAG_PREFIX = re.compile(r'(?:b(?:r\s*/?)?|/(?:p|d(?:iv?)?|t[rd]?|li?)?)?', re.IGNORECASE)
+BLOCK_TAGS = {
+    'br': '\n',
+    '/p': '\n\n',
+    '/div': '\n',
+    '/tr': '\n',
+    '/td': '\t',
+    '/li': '\n',
+}
+# Every spelling of a block tag but odd whitespace in a <br>, for a dict lookup
+BLOCK_TAG_SPELLINGS = {
+    ''.join(chars): replacement
+    for body, replacement in [*BLOCK_TAGS.items(), ('br/', '\n'), ('br /', '\n')]
+    for chars in product(*({c.lower(), c.upper()} for c in body))
+}
+# The first two characters inside every tag that may start a dropped block
+DROP_START_LEADS = {'sc', 'sC', 'Sc', 'SC', 'st', 'sT', 'St', 'ST', 'SE', 'IM', '?x'}
+
+# Entities outside a tag: the ones that open a tag, and the ones that
+# decode to text
+TAG_ENTITY = re.compile(r'&(?:amp;)?lt;')
+TEXT_ENTITY = re.compile(r'&(?:nbsp;|amp;(?!lt;)(?:gt;|quot;|#39;|#\d+;)?|gt;|quot;|#39;|#\d+;)')
+TAG_TOKEN = re.compile(r'[<>&]')
+
+# Whitespace runs the output may change: two or more characters, or a lone
+# tab (written as one branch so the regex engine can skip ahead to a space)
+WHITESPACE_RUN = re.compile(r'\s(?:\s+|(?<=\t))')
+SPACES = re.compile(r'[ \t]+')
+TRAILING_SPACES = re.compile(r' +\n')
+
+DOCUMENT_TYPE = re.compile(rb'<TYPE>([^\n<]+)')
+DOCUMENT_FILENAME = re.compile(rb'<FILENAME>([^\n<]+)')
+
+# One <DOCUMENT> of a submission: the byte range of its body and the raw
+# <TYPE> and <FILENAME> header values (None when missing)
+Document = namedtuple('Document', ['index', 'start', 'end', 'doc_type', 'filename'])
+
+
+def iter_chunks(source, chunk_size=CHUNK_SIZE):
+    """Yield text chunks from a string, a file object or an iterable of strings."""
+    if isinstance(source, str):
+        for i in range(0, len(source), chunk_size):
+            yield source[i:i + chunk_size]
+    elif hasattr(source, 'read'):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    else:
+        for chunk in source:
+            if chunk:
+                yield chunk
+
+
+def block_tag(body):
+    """What a tag with this inside turns into if it is a block tag, else None."""
+    m = BLOCK_TAG_BODY.fullmatch(body)
+    return BLOCK_TAGS[m.group(m.lastindex).lower()] if m else None
+
+
+def decode_entity(m):
+    """The text an ENTITY or TEXT_ENTITY match decodes to."""
+    return ENTITY_TEXT.get(m.group(), ' ')
+
+
+def decode_text(text):
+    """Decode the entities in text outside a tag, where none opens a tag."""
+    return TEXT_ENTITY.sub(decode_entity, text)
+
+
+class PartOffsets:
+    """Where each part of a text split on '<' starts, worked out lazily and in order."""
+
+    def __init__(self, parts):
+        self.parts = parts
+        self.k = 0
+        self.offset = 0
+
+    def start(self, k):
+        """Where parts[k] starts; k never goes back past an earlier call."""
+        if k > self.k:
+            self.offset += sum(map(len, self.parts[self.k:k])) + k - self.k
+            self.k = k
+        return self.offset
+
+    def find(self, k, pos, buf):
+        """
+        Find the part holding buf[pos], from parts[k] on; returns how many
+        parts on it is and the rest of its text from pos.
+        """
+        start = self.start(k)
+        parts = self.parts
+        while pos > start + len(parts[self.k]):
+            start = self.start(self.k + 1)
+        return self.k - k, buf[pos:start + len(parts[self.k])]
+
+
+def collapse_run(m):
+    """Collapse one whitespace run: blank lines to one, spaces and tabs to a space."""
+    run = m.group()
+    if run.count('\n') >= 3:
+        run = run[:run.find('\n')] + '\n\n' + run[run.rfind('\n') + 1:]
+    return TRAILING_SPACES.sub('\n', SPACES.sub(' ', run))
+
+
+def squeeze_space(space):
+    """Shorten unfinished whitespace without changing what collapse_run makes of it."""
+    space = SPACES.sub(' ', space)
+    if space.count('\n') > 3:
+        space = space[:space.find('\n')] + '\n\n\n' + space[space.rfind('\n') + 1:]
+    return space
+
+
+class SecTextCleaner:
+    """
+    Single-pass cleaner for SEC filing text, fed a chunk at a time.
+
+    One scan drops headers, scripts and styles, decodes entities, turns
+    block tags into line breaks and tabs and drops every other tag, giving
+    the same text as running those steps one after another over the whole
+    document. The only differences are on markup no filing contains: an
+    entity split by a dropped block is not rejoined, and a block of one kind
+    that starts inside a block of another kind is not looked for.
+
+    Whitespace is collapsed as text is returned. Text from the start of an
+    unfinished tag, entity or dropped block is held back until the next
+    chunk, and held text is only rescanned once at least as much new text
+    has arrived, so a long unterminated block costs linear time.
+    """
+
+    def __init__(self):
+        self._held = ''
+        self._pending = []
+        self._pending_size = 0
+        self._out = []
+        self._space = ''
+        self._started = False
+        # Set once a tag is left open at the end of the text: no '>' follows
+        # it, so from there on only block tags can still close
+        self._tags_close = True
+        # Dropped block kinds seen unterminated at the end of the text
+        self._unterminated = set()
+
+    def feed(self, chunk):
+        """Take the next chunk and return the cleaned text that is settled."""
+        self._pending.append(chunk)
+        self._pending_size += len(chunk)
+        if self._pending_size < len(self._held):
+            return ''
+        buf = self._held + ''.join(self._pending)
+        self._pending = []
+        self._pending_size = 0
+
+        # An entity cut short can only be the last one
+        end = len(buf)
+        at = buf.rfind('&')
+        if at != -1 and PARTIAL_ENTITY.fullmatch(buf, at):
+            end = at
+
+        self._held = buf[self._scan(buf, end, False):]
+        return self._flush(False)
+
+    def close(self):
+        """Clean whatever is held back and return the rest of the text."""
+        buf = self._held + ''.join(self._pending)
+        self._held = ''
+        self._pending = []
+        self._scan(buf, len(buf), True)
+        return self._flush(True)
+
+    def _flush(self, final):
+        """Return the text scanned so far, holding back trailing whitespace."""
+        text = self._space + ''.join(self._out)
+        self._out = []
+        body = text.rstrip()
+        self._space = '' if final else squeeze_space(text[len(body):])
+        if not self._started:
+            body = body.lstrip()
+            self._started = bool(body)
+        return WHITESPACE_RUN.sub(collapse_run, body)
+
+    def _scan(self, buf, end, eof):
+        """Clean buf[:end] into self._out and return where held text starts."""
+        append = self._out.append
+        spellings = BLOCK_TAG_SPELLINGS
+        leads = DROP_START_LEADS
+        # Split on '<' once; the text of a part runs to the next '<'. Where
+        # a part starts in buf is only worked out when a tag needs a closer look.
+        parts = buf[:end].split('<')
+        offsets = PartOffsets(parts)
+        remaining = iter(parts)
+        text = next(remaining)
+        k = 0
+        while True:
+            pos = None
+            if text is None:
+                # parts[k] starts with a tag the fast path below left alone
+                start = offsets.start(k)
+                pos = self._drop(buf, start - 1, end, eof)
+                if pos == -1:
+                    pos = self._open_tag(buf, start - 1, start, end, eof)
+                if pos is None:
+                    return start - 1
+            elif text:
+                if '&' in text:
+                    opener = TAG_ENTITY.search(text)
+                    if opener is not None:
+                        append(decode_text(text[:opener.start()]))
+                        at = offsets.start(k) + len(parts[k]) - len(text) + opener.start()
+                        pos = self._open_tag(buf, at, at + len(opener.group()), end, eof)
+                        if pos is None:
+                            return at
+                    else:
+                        append(decode_text(text))
+                else:
+                    append(text)
+            if pos is not None:
+                # Carry on with the text after the tag, in whatever part it is
+                skipped, text = offsets.find(k, pos, buf)
+                for _ in range(skipped):
+                    next(remaining)
+                k += skipped
+                continue
 
-        # Clean the document content
-        cleaned = clean_sec_text(doc)
+            # Most tags are closed before the next '<' and hold no entity
+            for k, part in enumerate(remaining, k + 1):
+                body, closed, text = part.partition('>')
+                if not closed or not body or '&' in body or body[:2] in leads:
+                    text = None
+                    break
+                replacement = spellings.get(body)
+                if replacement is None and body[0] in 'bB':
+                    replacement = block_tag(body)
+                if replacement:
+                    append(replacement)
+                if text:
+                    if '&' in text:
+                        if 'lt;' in text:
+                            break
+                        text = decode_text(text)
+                    append(text)
+            else:
+                return end
+
+    def _open_tag(self, buf, at, inside, end, eof):
+        """
+        Clean the tag opened at buf[at], whose '<' ends at inside, and
+        return where the text after it starts, or None if more is needed.
+        """
+        tag = self._tag(buf, inside, end, eof)
+        if tag is None:
+            return None
+        tag_end, replacement = tag
+        if tag_end == -1:
+            # Not a tag, just a '<'
+            self._out.append('<')
+            return inside
+        if replacement:
+            self._out.append(replacement)
+        return tag_end
+
+    def _drop(self, buf, at, end, eof):
+        """
+        Return the end of the dropped block starting at buf[at], -1 if none
+        starts there, or None if more text is needed to tell.
+        """
+        m = DROP_START.match(buf, at, end)
+        if m is None:
+            if not eof and buf.find('>', at, end) == -1:
+                return None
+            return -1
+        kind = m.lastindex
+        if DROP_END[kind] is None:
+            return m.end()
+        if kind in self._unterminated:
+            return -1
+        e = DROP_END[kind].search(buf, m.end(), end)
+        if e is not None:
+            return e.end()
+        if not eof:
+            return None
+        # Never closed, so no later block of this kind is either
+        self._unterminated.add(kind)
+        return -1
+
+    def _tag(self, buf, pos, end, eof):
+        """
+        Find the end of a tag whose '<' comes just before buf[pos].
+
+        Returns (end, replacement), (-1, None) if the '<' does not start a
+        tag, or None if more text is needed to tell. Like '<[^>]+>' after
+        the block tags are replaced, the tag ends at the first '>' that does
+        not close a block tag, which vanishes inside it.
+        """
+        body = ''  # Decoded text since the last '<', while it may be a block tag
+        outer = True  # No '<' since the opening one
+        empty = True
+        while True:
+            m = TAG_TOKEN.search(buf, pos, end)
+            if m is None:
+                if not eof:
+                    return None
+                self._tags_close = False
+                return -1, None
+            at = m.start()
+            if at > pos:
+                empty = False
+                if body is not None:
+                    body += buf[pos:at]
+                    if not BLOCK_TAG_PREFIX.fullmatch(body):
+                        body = None
+            char = buf[at]
+            pos = at + 1
+
+            if char == '&':
+                e = ENTITY.match(buf, at, end)
+                if e is not None:
+                    char = ENTITY_TEXT.get(e.group(), ' ')
+                    pos = e.end()
+                if char not in '<>':
+                    empty = False
+                    if body is not None:
+                        body += char
+                        if not BLOCK_TAG_PREFIX.fullmatch(body):
+                            body = None
+                    continue
+            elif char == '<':
+                drop_end = self._drop(buf, at, end, eof)
+                if drop_end is None:
+                    return None
+                if drop_end != -1:
+                    pos = drop_end
+                    continue
+
+            if char == '<':
+                if not self._tags_close:
+                    return -1, None
+                body = ''
+                outer = False
+                empty = False
+                continue
 
-        if len(cleaned) > 2000:  # Only keep substantial docs
-            safe_name = re.sub(r'[^\w\-.]', '_', filename)
-            exhibits[f"{doc_type}_{safe_name}"] = cleaned
+            # '>'
+            replacement = block_tag(body) if body is not None else None
+            if replacement is not None:
+                if outer:
+                    return pos, replacement
+                body = None
+                continue
+            if not self._tags_close or (outer and empty):
+                return -1, None
+            return pos, ''
 
-    return exhibits
 
-print("Processing SEC filings...\n")
+def iter_clean_sec_text(source, chunk_size=CHUNK_SIZE):
+    """
+    Clean SEC filing text as a stream of chunks.
 
-for ticker_dir in raw_dir.iterdir():
-    if not ticker_dir.is_dir():
-        continue
+    Takes a string, a file object or an iterable of strings and reads it
+    once; see SecTextCleaner.
+    """
+    cleaner = SecTextCleaner()
+    for chunk in iter_chunks(source, chunk_size):
+        text = cleaner.feed(chunk)
+        if text:
+            yield text
+    text = cleaner.close()
+    if text:
+        yield text
 
-    ticker = ticker_dir.name
-    print(f"\n{ticker}")
-    print("=" * 40)
 
-    for form_dir in ticker_dir.iterdir():
-        if not form_dir.is_dir():
+def clean_sec_text(content):
+    """Clean SEC filing text - remove HTML tags and clean up."""
+    return ''.join(iter_clean_sec_text(content))
+
+
+def write_clean_text(source, out_file):
+    """Stream cleaned text to out_file and return (bytes written, sha256)."""
+    size = 0
+    digest = hashlib.sha256()
+    with open(out_file, 'wb') as f:
+        for chunk in iter_clean_sec_text(source):
+            data = chunk.encode('utf-8')
+            f.write(data)
+            digest.update(data)
+            size += len(data)
+    return size, digest.hexdigest()
+
+def document_policy(doc_type, filename):
+    """Look up how a document is handled in DOCUMENT_POLICY."""
+    ext = os.path.splitext(filename)[1].lower()
+    return DOCUMENT_POLICY.get(ext) or DOCUMENT_POLICY.get(doc_type.upper(), 'text')
+
+
+def uudecode(doc):
+    """Decode the uuencoded body of a <DOCUMENT>, or return None if there is none."""
+    begin = re.search(r'^begin [0-7]+ .*$', doc, re.MULTILINE)
+    if not begin:
+        return None
+
+    data = bytearray()
+    for line in doc[begin.end():].splitlines():
+        if line.strip() == 'end':
+            break
+        if not line:
             continue
+        try:
+            data += binascii.a2b_uu(line)
+        except binascii.Error:
+            # Some encoders pad lines with junk; decode just the declared length
+            nbytes = (((ord(line[0]) - 32) & 63) * 4 + 5) // 3
+            data += binascii.a2b_uu(line[:nbytes])
+    return bytes(data)
+
+
+@contextmanager
+def open_submission(submission_file):
+    """Map a submission into memory read-only; yields b'' for an empty file."""
+    with open(submission_file, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b''
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
+
+
+def header_value(pattern, data, start, end, header_end):
+    """First match of a header pattern in a document, searching its header first."""
+    m = pattern.search(data, start, header_end) or pattern.search(data, start, end)
+    return m.group(1).decode('utf-8', errors='ignore').strip() if m else None
+
+
+def iter_documents(data):
+    """
+    Lazily split a submission into its <DOCUMENT> blocks.
+
+    data is any bytes-like object, normally an mmap of full-submission.txt.
+    Only offsets and the <TYPE>/<FILENAME> headers are read; bodies are not
+    copied until document_text or iter_document_text asks for them.
+    """
+    pos = 0
+    index = 0
+    while True:
+        open_at = data.find(b'<DOCUMENT>', pos)
+        if open_at == -1:
+            return
+        start = open_at + len(b'<DOCUMENT>')
+        end = data.find(b'</DOCUMENT>', start)
+        if end == -1:
+            return
+
+        # The header is everything before <TEXT>
+        header_end = data.find(b'<TEXT>', start, end)
+        if header_end == -1:
+            header_end = end
+
+        yield Document(
+            index,
+            start,
+            end,
+            header_value(DOCUMENT_TYPE, data, start, end, header_end),
+            header_value(DOCUMENT_FILENAME, data, start, end, header_end),
+        )
+        pos = end + len(b'</DOCUMENT>')
+        index += 1
+
+
+def iter_document_text(data, document, chunk_size=CHUNK_SIZE):
+    """Decode a document body a chunk at a time."""
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+    for pos in range(document.start, document.end, chunk_size):
+        text = decoder.decode(data[pos:min(pos + chunk_size, document.end)])
+        if text:
+            yield text
+    text = decoder.decode(b'', final=True)
+    if text:
+        yield text
+
+
+def document_text(data, document):
+    """Decode a whole document body."""
+    return data[document.start:document.end].decode('utf-8', errors='ignore')
+
+
+def clean_exhibit(data, document):
+    """
+    Handle one <DOCUMENT> according to DOCUMENT_POLICY.
+
+    Returns (exhibit name, text) for text documents, (exhibit name, bytes)
+    for decoded binaries, or None if the document is skipped or too short.
+    """
+    i = document.index
+    doc_type = document.doc_type or f"doc_{i}"
+    filename = document.filename or f"document_{i}.txt"
+    safe_name = re.sub(r'[^\w\-.]', '_', filename)
+
+    policy = document_policy(doc_type, filename)
+    if policy == 'skip':
+        return None
+    if policy == 'binary':
+        decoded = uudecode(document_text(data, document))
+        return (f"{doc_type}_{safe_name}", decoded) if decoded else None
+
+    # Clean the document content
+    cleaned = ''.join(iter_clean_sec_text(iter_document_text(data, document)))
+
+    if len(cleaned) > 2000:  # Only keep substantial docs
+        return f"{doc_type}_{safe_name}", cleaned
+    return None
+
+
+def iter_exhibits(data):
+    """Yield (exhibit name, content) for every kept document, one at a time."""
+    for document in iter_documents(data):
+        exhibit = clean_exhibit(data, document)
+        if exhibit:
+            yield exhibit
 
-        form_type = form_dir.name
 
-        for filing_dir in form_dir.iterdir():
-            if not filing_dir.is_dir():
-                continue
+def extract_exhibits(content):
+    """Try to find and extract exhibit documents from the filing."""
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return dict(iter_exhibits(content))
 
-            accession = filing_dir.name
-            submission_file = filing_dir / "full-submission.txt"
 
-            if not submission_file.exists():
+def find_filings():
+    """Return (ticker, form_type, accession, submission_file) for every raw filing, sorted."""
+    filings = []
+    for ticker_dir in sorted(raw_dir.iterdir()):
+        if not ticker_dir.is_dir():
+            continue
+        for form_dir in sorted(ticker_dir.iterdir()):
+            if not form_dir.is_dir():
                 continue
+            for filing_dir in sorted(form_dir.iterdir()):
+                submission_file = filing_dir / "full-submission.txt"
+                if filing_dir.is_dir() and submission_file.exists():
+                    filings.append((ticker_dir.name, form_dir.name, filing_dir.name, submission_file))
+    return filings
+
+
+def file_sha256(path):
+    """Hash a file without reading it into memory."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def output_unchanged(out_file, output, size):
+    """Check a manifest output record against a file on disk by size only."""
+    if output is None or output['size'] != size:
+        return False
+    try:
+        return out_file.stat().st_size == size
+    except FileNotFoundError:
+        return False
+
+
+def write_exhibits(out_path, exhibits, previous=None):
+    """
+    Write (name, content) exhibits as they arrive and return a
+    (file name, size, sha256) report.
+
+    Text exhibits get a .txt suffix; decoded binaries keep their own
+    extension. Files whose content matches the previous manifest outputs
+    are left alone.
+    """
+    previous = previous or {}
+    written = {}
+    for name, content in exhibits:
+        if isinstance(content, bytes):
+            # Truncate long filenames, keeping the extension
+            stem, ext = os.path.splitext(name)
+            safe_name = stem[:80 - len(ext)] + ext if len(name) > 80 else name
+            data = content
+        else:
+            # Truncate long filenames
+            safe_name = name[:80] + ".txt" if len(name) > 80 else name + ".txt"
+            data = content.encode('utf-8')
+        out_file = out_path / safe_name
+
+        sha256 = hashlib.sha256(data).hexdigest()
+        output = previous.get(safe_name)
+
+        # A name seen earlier in this run is always rewritten, so the last one wins
+        if (safe_name in written
+                or not (output_unchanged(out_file, output, len(data)) and output['sha256'] == sha256)):
+            with open(out_file, 'wb') as f:
+                f.write(data)
+
+        written[safe_name] = (len(data), sha256)
+    return [(name, size, sha256) for name, (size, sha256) in written.items()]
+
+
+def write_full_submission(submission_file, out_path):
+    """Save the cleaned full submission, streamed from disk, when it has no exhibits."""
+    with open(submission_file, 'r', encoding='utf-8', errors='ignore') as f:
+        size, sha256 = write_clean_text(f, out_path / FULL_SUBMISSION_NAME)
+    return [(FULL_SUBMISSION_NAME, size, sha256)]
+
+
+def process_filing(submission_file, out_path, previous=None):
+    """Clean one accession into out_path and return its (file name, size, sha256) report."""
+    # Create output directory
+    out_path.mkdir(parents=True, exist_ok=True)
+
+    # Extract exhibits straight from the mapped submission
+    with open_submission(submission_file) as data:
+        report = write_exhibits(out_path, iter_exhibits(data), previous)
+
+    if report:
+        return report
+    return write_full_submission(submission_file, out_path)
+
+
+def find_documents(submission_file):
+    """List the <DOCUMENT> blocks of a submission without reading their bodies."""
+    with open_submission(submission_file) as data:
+        return list(iter_documents(data))
+
+
+def clean_document(submission_file, document):
+    """Worker task: clean a single <DOCUMENT> of a submission."""
+    with open_submission(submission_file) as data:
+        return clean_exhibit(data, document)
+
+
+def submit_filing(pool, submission_file, out_path, previous=None):
+    """
+    Queue one accession on the pool and return a callable that waits for its report.
+
+    Large submissions are split so each <DOCUMENT> is cleaned by its own task;
+    the exhibits are then written here in document order, exactly as
+    process_filing would have written them.
+    """
+    if submission_file.stat().st_size < SPLIT_SUBMISSION_BYTES:
+        future = pool.submit(process_filing, submission_file, out_path, previous)
+        return future.result
+
+    futures = deque(
+        pool.submit(clean_document, submission_file, document)
+        for document in find_documents(submission_file)
+    )
+
+    def result():
+        out_path.mkdir(parents=True, exist_ok=True)
+        # Drop each result once it is written instead of holding the whole filing
+        exhibits = (futures.popleft().result() for _ in range(len(futures)))
+        report = write_exhibits(out_path, (exhibit for exhibit in exhibits if exhibit), previous)
+        if report:
+            return report
+        return write_full_submission(submission_file, out_path)
+
+    return result
+
+
+def load_manifest():
+    """Load the build manifest, keyed by '<ticker>/<form>_<accession>'."""
+    if not MANIFEST_FILE.exists():
+        return {}
+    with open(MANIFEST_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(manifest):
+    """Write the build manifest atomically."""
+    MANIFEST_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = MANIFEST_FILE.with_suffix('.tmp')
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_file, MANIFEST_FILE)
+
+
+def needs_rebuild(entry, submission_file, out_path):
+    """
+    Decide whether an accession has to be cleaned again.
+
+    A matching size and mtime is trusted without reading the submission;
+    otherwise it is hashed, so a touched but identical file is still skipped
+    (and its entry updated). Returns (rebuild, source sha256 or None).
+    """
+    stat = submission_file.stat()
+
+    if (entry is None
+            or entry['cleaner_version'] != CLEANER_VERSION
+            or entry['extractor_version'] != EXTRACTOR_VERSION
+            or not all(output_unchanged(out_path / name, output, output['size'])
+                       for name, output in entry['outputs'].items())):
+        return True, None
+
+    if entry['source_size'] == stat.st_size and entry['source_mtime_ns'] == stat.st_mtime_ns:
+        return False, None
+
+    source_sha256 = file_sha256(submission_file)
+    if source_sha256 != entry['source_sha256']:
+        return True, source_sha256
+
+    entry['source_size'] = stat.st_size
+    entry['source_mtime_ns'] = stat.st_mtime_ns
+    return False, source_sha256
+
+
+def manifest_entry(submission_file, source_sha256, report):
+    """Build the manifest entry for a freshly cleaned accession."""
+    stat = submission_file.stat()
+    return {
+        'source': str(submission_file.relative_to(raw_dir)),
+        'source_size': stat.st_size,
+        'source_mtime_ns': stat.st_mtime_ns,
+        'source_sha256': source_sha256 or file_sha256(submission_file),
+        'cleaner_version': CLEANER_VERSION,
+        'extractor_version': EXTRACTOR_VERSION,
+        'outputs': {name: {'size': size, 'sha256': sha256} for name, size, sha256 in report},
+    }
+
+
+def remove_stale_outputs(out_path, report):
+    """Delete files in an accession's output folder that were not produced again."""
+    produced = {name for name, _, _ in report}
+    for out_file in out_path.iterdir():
+        if out_file.is_file() and out_file.name not in produced:
+            out_file.unlink()
+
+
+def print_report(report):
+    """Print the files written for one accession."""
+    for name, size, _ in report:
+        size_kb = size / 1024
+        if name == FULL_SUBMISSION_NAME:
+            print(f"    + {name} ({size_kb:.1f} KB)")
+        else:
+            print(f"    + {name[:50]}... ({size_kb:.1f} KB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert SEC full submissions to clean text.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of processes to clean filings with (default: 1)")
+    parser.add_argument("--force", action="store_true",
+                        help="ignore the manifest and rebuild every accession")
+    args = parser.parse_args()
+
+    print("Processing SEC filings...\n")
+
+    manifest = {} if args.force else load_manifest()
+
+    # Only accessions that changed since the last run are queued
+    filings = []
+    skipped = 0
+    for ticker, form_type, accession, submission_file in find_filings():
+        key = f"{ticker}/{form_type}_{accession}"
+        rebuild, source_sha256 = needs_rebuild(manifest.get(key), submission_file, output_dir / key)
+        if rebuild:
+            filings.append((ticker, form_type, accession, submission_file, key, source_sha256))
+        else:
+            skipped += 1
+
+    def previous_outputs(key):
+        return manifest[key]['outputs'] if key in manifest else None
+
+    if args.workers > 1:
+        pool = ProcessPoolExecutor(max_workers=args.workers)
+        # Queue everything up front; reports are still printed in filing order
+        results = [
+            submit_filing(pool, submission_file, output_dir / key, previous_outputs(key))
+            for _, _, _, submission_file, key, _ in filings
+        ]
+    else:
+        pool = None
+        results = [
+            partial(process_filing, submission_file, output_dir / key, previous_outputs(key))
+            for _, _, _, submission_file, key, _ in filings
+        ]
+
+    try:
+        current_ticker = None
+        for (ticker, form_type, accession, submission_file, key, source_sha256), result in zip(filings, results):
+            if ticker != current_ticker:
+                current_ticker = ticker
+                print(f"\n{ticker}")
+                print("=" * 40)
 
             print(f"  {form_type}/{accession}:")
-
-            # Read the submission
-            with open(submission_file, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
-
-            # Create output directory
-            out_path = output_dir / ticker / f"{form_type}_{accession}"
-            out_path.mkdir(parents=True, exist_ok=True)
-
-            # Extract exhibits
-            exhibits = extract_exhibits(content)
-
-            if exhibits:
-                for name, text in exhibits.items():
-                    # Truncate long filenames
-                    safe_name = name[:80] + ".txt" if len(name) > 80 else name + ".txt"
-                    out_file = out_path / safe_name
-
-                    with open(out_file, 'w', encoding='utf-8') as f:
-                        f.write(text)
-
-                    size_kb = len(text) / 1024
-                    print(f"    + {safe_name[:50]}... ({size_kb:.1f} KB)")
-            else:
-                # Just save cleaned full submission
-                cleaned = clean_sec_text(content)
-                out_file = out_path / "full_submission_cleaned.txt"
-
-                with open(out_file, 'w', encoding='utf-8') as f:
-                    f.write(cleaned)
-
-                size_kb = len(cleaned) / 1024
-                print(f"    + full_submission_cleaned.txt ({size_kb:.1f} KB)")
-
-print(f"\n\n--- COMPLETE ---")
-print(f"Output: {output_dir}/")
-
-# Summary
-total_files = sum(1 for _ in output_dir.rglob("*.txt"))
-total_size = sum(f.stat().st_size for f in output_dir.rglob("*.txt"))
-print(f"Total files: {total_files}")
-print(f"Total size: {total_size / (1024*1024):.1f} MB")
+            report = result()
+            print_report(report)
+
+            remove_stale_outputs(output_dir / key, report)
+            manifest[key] = manifest_entry(submission_file, source_sha256, report)
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+        save_manifest(manifest)
+
+    print(f"\n\n--- COMPLETE ---")
+    print(f"Output: {output_dir}/")
+    print(f"Cleaned: {len(filings)} accessions, unchanged: {skipped}")
+
+    # Summary
+    outputs = [f for f in output_dir.rglob("*") if f.is_file() and f != MANIFEST_FILE]
+    total_files = len(outputs)
+    total_size = sum(f.stat().st_size for f in outputs)
+    print(f"Total files: {total_files}")
+    print(f"Total size: {total_size / (1024*1024):.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,594 @@
+"""
+Resumable, verified HTTP downloads for the non-EDGAR sources.
+
+download() streams into <dest>.part and, after a dropped connection or an
+interrupted run, picks up where the part ends with an HTTP Range request.
+A small <dest>.part.json sidecar remembers which URL the part came from and
+its ETag/Last-Modified, sent as If-Range, so a part is never stitched onto
+a different or changed file. The finished file must match the size the
+server announced before it is renamed into place.
+
+Each completed download returns a record (url, size, sha256, etag,
+last_modified). Callers keep the records in a JSON file and check files
+against them with verified(), instead of guessing completeness from the
+file size. Passing a file's record back as `previous` revalidates it with
+a conditional GET: a 304 costs one request and no body.
+
+download_from_mirrors() takes a list of equivalent URLs, probes them
+concurrently, uses the fastest, and can split a large file into byte
+ranges fetched at once from the mirrors serving the same size and
+validators. Every range is requested with If-Range, so segments of a
+file that changed are never stitched together. HostScheduler runs a list of
+downloads concurrently with a pooled session and politeness limit per host.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from edgar_fetch import RETRY_STATUSES, TokenBucket, backoff, retry_after
+
+CHUNK_SIZE = 1024 * 1024  # File write buffer and hashing block
+# Bytes per read from the socket: a read cut short by a dropped connection
+# loses what it had, so reads stay small and writes are buffered instead
+READ_SIZE = 64 * 1024
+MAX_RETRIES = 5
+
+
+class DownloadError(requests.RequestException):
+    """A download that could not be completed or failed verification."""
+
+
+class ChangedError(DownloadError):
+    """The file changed on the server while it was being downloaded in ranges."""
+
+
+def file_sha256(path):
+    """Hash a file without reading it into memory."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_records(path):
+    """Load download records, keyed by destination path."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_records(path, records):
+    """Write download records atomically."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(records, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def verified(dest_path, record):
+    """True if dest_path exists and matches its download record's size and SHA-256."""
+    if not record or not os.path.exists(dest_path):
+        return False
+    if os.path.getsize(dest_path) != record['size']:
+        return False
+    return file_sha256(dest_path) == record['sha256']
+
+
+def content_range(response):
+    """Parse 'Content-Range: bytes start-end/total' into (start, total or None)."""
+    match = re.match(r'bytes (\d+)-\d+/(\d+|\*)', response.headers.get('Content-Range', ''))
+    if not match:
+        return None, None
+    total = match.group(2)
+    return int(match.group(1)), (int(total) if total != '*' else None)
+
+
+def validators(response):
+    """The ETag and Last-Modified a response was served with."""
+    return {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+    }
+
+
+def if_range(info):
+    """If-Range value for a part or segments started from info's validators, or None."""
+    # If-Range needs a strong ETag; a weak one falls back to the date
+    etag = info.get('etag')
+    return etag if etag and not etag.startswith('W/') else info.get('last_modified')
+
+
+def conditional_headers(previous):
+    """If-None-Match / If-Modified-Since headers from a download record."""
+    headers = {}
+    if previous and previous.get('etag'):
+        headers['If-None-Match'] = previous['etag']
+    if previous and previous.get('last_modified'):
+        headers['If-Modified-Since'] = previous['last_modified']
+    return headers
+
+
+def unchanged(url, previous, headers=None, session=None, timeout=30):
+    """Ask the server with a conditional GET whether a recorded file is still current."""
+    request_headers = conditional_headers(previous)
+    if not request_headers:
+        return False
+    try:
+        with (session or requests).get(url, headers=dict(headers or {}, **request_headers),
+                                       stream=True, timeout=timeout) as response:
+            return response.status_code == 304
+    except requests.RequestException:
+        return False
+
+
+def load_part_info(part_path):
+    """The URL and validators a part was started from, or {}."""
+    try:
+        with open(part_path + '.json', 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def start_part(part_path, url, response):
+    """Begin a new part and remember where it came from."""
+    info = dict(validators(response), url=url)
+    with open(part_path + '.json', 'w', encoding='utf-8') as f:
+        json.dump(info, f)
+    return open(part_path, 'wb', buffering=CHUNK_SIZE)
+
+
+def download(url, dest_path, headers=None, session=None, timeout=30,
+             max_retries=MAX_RETRIES, progress=None, previous=None):
+    """
+    Download url to dest_path, resuming from dest_path + '.part'.
+
+    previous is the record of the file already at dest_path, if any; its
+    validators make the request conditional, and a 304 returns it as is.
+
+    Dropped connections, 429/5xx responses and short files are retried with
+    backoff, or after the Retry-After delay a 429/5xx asks for, each
+    retry resuming from the bytes already on disk; only attempts that get no
+    further than earlier ones count against max_retries. progress(done, total), if
+    given, is called after every chunk; total is None when unknown. Returns
+    the download record {'url', 'size', 'sha256', 'etag', 'last_modified'}. Raises DownloadError when
+    retries run out or the file does not match the announced size, and
+    requests.HTTPError for other error statuses.
+    """
+    session = session or requests
+    part_path = dest_path + '.part'
+    info_path = part_path + '.json'
+
+    # A part from another URL (a different mirror) can't be continued
+    if os.path.exists(part_path) and load_part_info(part_path).get('url') != url:
+        os.remove(part_path)
+
+    # Retries are only used up by attempts that get no further than any before
+    furthest = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    failures = 0
+    while True:
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        delay = None
+
+        # Sizes are only comparable on the raw bytes, so ask for no compression
+        request_headers = dict(headers or {}, **{'Accept-Encoding': 'identity'})
+        if offset:
+            request_headers['Range'] = f'bytes={offset}-'
+            validator = if_range(load_part_info(part_path))
+            if validator:
+                request_headers['If-Range'] = validator
+        else:
+            request_headers.update(conditional_headers(previous))
+
+        try:
+            with session.get(url, headers=request_headers, stream=True, timeout=timeout) as response:
+                if response.status_code == 304 and previous:
+                    return previous
+                if response.status_code == 416:
+                    # The part is not a prefix of the current file; start over
+                    os.remove(part_path)
+                    continue
+                if response.status_code in RETRY_STATUSES and failures < max_retries:
+                    delay = retry_after(response)
+                    raise DownloadError(f"HTTP {response.status_code}")
+                response.raise_for_status()
+
+                start, total = content_range(response)
+                if offset and response.status_code == 206 and start == offset:
+                    f = open(part_path, 'ab', buffering=CHUNK_SIZE)
+                else:
+                    # Full body: no part yet, or the server ignored/refused the range
+                    offset = 0
+                    length = response.headers.get('Content-Length')
+                    total = int(length) if length is not None else None
+                    f = start_part(part_path, url, response)
+
+                done = offset
+                with f:
+                    for chunk in response.iter_content(chunk_size=READ_SIZE):
+                        f.write(chunk)
+                        done += len(chunk)
+                        if progress:
+                            progress(done, total)
+
+        except (requests.ConnectionError, requests.Timeout,
+                requests.exceptions.ChunkedEncodingError, DownloadError) as e:
+            size = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            if size > furthest:
+                furthest = size
+                failures = 0
+            elif failures == max_retries:
+                raise DownloadError(f"{url}: gave up after {max_retries} retries ({e})")
+            else:
+                failures += 1
+            time.sleep(delay if delay is not None else backoff(failures))
+            continue
+
+        size = os.path.getsize(part_path)
+        if total is not None and size != total:
+            if size > total:
+                os.remove(part_path)
+            if failures == max_retries:
+                raise DownloadError(f"{url}: got {size} of {total} bytes")
+            failures += 1
+            time.sleep(backoff(failures))
+            continue
+
+        info = load_part_info(part_path)
+        record = {
+            'url': url,
+            'size': size,
+            'sha256': file_sha256(part_path),
+            'etag': info.get('etag'),
+            'last_modified': info.get('last_modified'),
+        }
+        os.replace(part_path, dest_path)
+        if os.path.exists(info_path):
+            os.remove(info_path)
+        return record
+
+
+# ---------------------------------------------------------
+# MIRRORS
+# ---------------------------------------------------------
+PROBE_BYTES = 256 * 1024
+SEGMENT_SIZE = 8 * 1024 * 1024
+SPLIT_MIN_BYTES = 4 * SEGMENT_SIZE
+CONNECTIONS_PER_MIRROR = 2
+
+
+def probe(url, headers=None, session=None, timeout=30):
+    """
+    Time the first PROBE_BYTES of a mirror.
+
+    Returns {'url', 'latency', 'throughput', 'size', 'ranges', 'etag',
+    'last_modified'}: seconds to the response headers, bytes per second
+    after them, the full file size (None if unknown), whether the mirror
+    honors Range, and its validators. None on failure.
+    """
+    session = session or requests
+    request_headers = dict(headers or {}, **{'Accept-Encoding': 'identity',
+                                             'Range': f'bytes=0-{PROBE_BYTES - 1}'})
+    started = time.monotonic()
+    try:
+        with session.get(url, headers=request_headers, stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            latency = time.monotonic() - started
+
+            _, size = content_range(response)
+            if response.status_code != 206:
+                length = response.headers.get('Content-Length')
+                size = int(length) if length is not None else None
+
+            received = 0
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                received += len(chunk)
+                if received >= PROBE_BYTES:
+                    break
+            elapsed = time.monotonic() - started - latency
+    except requests.RequestException:
+        return None
+
+    return dict(
+        validators(response),
+        url=url,
+        latency=latency,
+        throughput=received / max(elapsed, 1e-6),
+        size=size,
+        ranges=response.status_code == 206,
+    )
+
+
+def rank_mirrors(urls, headers=None, session=None, timeout=30):
+    """Probe mirrors concurrently; return the live ones, fastest estimated download first."""
+    with ThreadPoolExecutor(max_workers=len(urls) or 1) as pool:
+        probes = [p for p in pool.map(lambda url: probe(url, headers, session, timeout), urls) if p]
+
+    def estimated_seconds(p):
+        return p['latency'] + (p['size'] or PROBE_BYTES) / p['throughput']
+
+    return sorted(probes, key=estimated_seconds)
+
+
+def fetch_segment(url, seg_path, start, end, validator, headers, session, timeout, progress):
+    """
+    Fetch bytes start..end (inclusive) into seg_path, continuing a partial
+    segment. validator is sent as If-Range; a full response to it means the
+    file changed and raises ChangedError.
+    """
+    have = os.path.getsize(seg_path) if os.path.exists(seg_path) else 0
+    if have > end - start:
+        return
+
+    request_headers = dict(headers or {}, **{'Accept-Encoding': 'identity',
+                                             'Range': f'bytes={start + have}-{end}'})
+    if validator:
+        request_headers['If-Range'] = validator
+    with session.get(url, headers=request_headers, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        if response.status_code == 200 and validator:
+            raise ChangedError(f"{url} no longer matches {validator}")
+        if response.status_code != 206 or content_range(response)[0] != start + have:
+            raise DownloadError(f"{url} did not honor Range {start + have}-{end}")
+        with open(seg_path, 'ab', buffering=CHUNK_SIZE) as f:
+            for chunk in response.iter_content(chunk_size=READ_SIZE):
+                f.write(chunk)
+                progress(len(chunk))
+
+    if os.path.getsize(seg_path) != end - start + 1:
+        raise DownloadError(f"{url}: short segment {start}-{end}")
+
+
+def download_segments(mirrors, dest_path, size, headers, session, timeout, max_retries, progress):
+    """
+    Fetch dest_path in SEGMENT_SIZE byte ranges spread over several mirrors.
+
+    Each mirror gets CONNECTIONS_PER_MIRROR workers pulling segments from a
+    shared queue, so faster mirrors end up serving more of the file. A
+    failed segment goes back on the queue for any worker; a worker stops
+    after max_retries failures in a row. Segments are kept as
+    <dest>.part.<n> files, so an interrupted run resumes them too, as long
+    as the mirrors still serve the size and validators they were started
+    from. Every mirror must serve the first one's validators, which are
+    sent as If-Range; raises ChangedError if the file changes midway.
+    """
+    session = session or requests
+    part_path = dest_path + '.part'
+    layout_path = part_path + '.segments.json'
+    layout = {'size': size, 'segment_size': SEGMENT_SIZE,
+              'etag': mirrors[0]['etag'], 'last_modified': mirrors[0]['last_modified']}
+    if any(same_validators(m, layout) is False for m in mirrors):
+        raise DownloadError(f"{dest_path}: mirrors serve different versions")
+    validator = if_range(layout)
+
+    count = -(-size // SEGMENT_SIZE)
+    seg_paths = [f"{part_path}.{n}" for n in range(count)]
+
+    # Segments of a different layout or version of the file can't be reused
+    try:
+        with open(layout_path, 'r', encoding='utf-8') as f:
+            stale = json.load(f) != layout
+    except (OSError, ValueError):
+        stale = True
+    if stale:
+        directory = os.path.dirname(part_path) or '.'
+        prefix = os.path.basename(part_path) + '.'
+        for name in os.listdir(directory):
+            if name.startswith(prefix) and name[len(prefix):].isdigit():
+                os.remove(os.path.join(directory, name))
+        with open(layout_path, 'w', encoding='utf-8') as f:
+            json.dump(layout, f)
+
+    lock = threading.Lock()
+    queue = deque(range(count))
+    changed = []
+    done = [sum(os.path.getsize(p) for p in seg_paths if os.path.exists(p))]
+
+    def advance(nbytes):
+        with lock:
+            done[0] += nbytes
+            if progress:
+                progress(done[0], size)
+
+    def worker(url):
+        failures = 0
+        while failures <= max_retries:
+            with lock:
+                if not queue or changed:
+                    return
+                n = queue.popleft()
+            start = n * SEGMENT_SIZE
+            try:
+                fetch_segment(url, seg_paths[n], start, min(start + SEGMENT_SIZE, size) - 1,
+                              validator, headers, session, timeout, advance)
+                failures = 0
+            except ChangedError as e:
+                # No other segment is worth fetching
+                with lock:
+                    queue.append(n)
+                    changed.append(e)
+                return
+            except requests.RequestException:
+                with lock:
+                    queue.append(n)
+                failures += 1
+                time.sleep(backoff(failures))
+
+    workers = [m['url'] for m in mirrors for _ in range(CONNECTIONS_PER_MIRROR)]
+    with ThreadPoolExecutor(max_workers=len(workers)) as pool:
+        list(pool.map(worker, workers))
+
+    if changed:
+        raise changed[0]
+    if queue:
+        raise DownloadError(f"{dest_path}: every mirror failed on {len(queue)} segments")
+
+    with open(part_path, 'wb') as out:
+        for seg_path in seg_paths:
+            with open(seg_path, 'rb') as seg:
+                shutil.copyfileobj(seg, out, CHUNK_SIZE)
+
+    if os.path.getsize(part_path) != size:
+        os.remove(part_path)
+        raise DownloadError(f"{dest_path}: segments add up to the wrong size")
+
+    record = {
+        'url': mirrors[0]['url'],
+        'size': size,
+        'sha256': file_sha256(part_path),
+        'etag': mirrors[0]['etag'],
+        'last_modified': mirrors[0]['last_modified'],
+    }
+    os.replace(part_path, dest_path)
+    for path in seg_paths + [layout_path, part_path + '.json']:
+        if os.path.exists(path):
+            os.remove(path)
+    return record
+
+
+def same_validators(mirror, first):
+    """
+    Whether a probed mirror serves the same version as first: True or False
+    when they share an ETag or Last-Modified to compare, else None.
+    """
+    compared = [mirror[name] == first[name] for name in ('etag', 'last_modified')
+                if mirror[name] is not None or first[name] is not None]
+    return all(compared) if compared else None
+
+
+def download_from_mirrors(urls, dest_path, headers=None, session=None, timeout=30,
+                          max_retries=MAX_RETRIES, progress=None, split=False, previous=None):
+    """
+    Download one file available from several equivalent URLs.
+
+    The mirrors are probed concurrently and tried fastest first, falling
+    back to the next on failure. With split=True, a file of at least
+    SPLIT_MIN_BYTES is fetched in byte ranges from every mirror that honors
+    Range and reports the same size and validators (ETag, Last-Modified) as
+    the fastest one; mirrors serving another version are left out. Returns the
+    download record, like download(). A previous record is first
+    revalidated against the mirror it came from and returned if unchanged.
+    """
+    if previous and previous['url'] in urls and unchanged(previous['url'], previous, headers, session, timeout):
+        return previous
+
+    mirrors = rank_mirrors(urls, headers, session, timeout)
+
+    if split and mirrors and mirrors[0]['size'] and mirrors[0]['size'] >= SPLIT_MIN_BYTES:
+        size = mirrors[0]['size']
+        splittable = [m for m in mirrors
+                      if m['ranges'] and m['size'] == size and same_validators(m, mirrors[0]) is not False]
+        if len(splittable) > 1:
+            try:
+                return download_segments(splittable, dest_path, size, headers, session,
+                                         timeout, max_retries, progress)
+            except requests.RequestException:
+                pass
+
+    # Probes can fail transiently, so unreachable mirrors are still tried last
+    ordered = [m['url'] for m in mirrors] + [url for url in urls if url not in {m['url'] for m in mirrors}]
+    error = DownloadError("no mirrors given")
+    for url in ordered:
+        try:
+            return download(url, dest_path, headers, session, timeout, max_retries, progress)
+        except requests.RequestException as e:
+            error = e
+    raise error
+
+
+# ---------------------------------------------------------
+# PER-HOST SCHEDULING
+# ---------------------------------------------------------
+DEFAULT_HOST_RATE = 2
+CONNECTIONS_PER_HOST = 2
+
+
+class HostSession(requests.Session):
+    """A pooled session for one host; every request waits for the host's rate limit."""
+
+    def __init__(self, rate, connections):
+        super().__init__()
+        self.limiter = TokenBucket(rate)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=connections)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def request(self, *args, **kwargs):
+        self.limiter.acquire()
+        return super().request(*args, **kwargs)
+
+
+class HostScheduler:
+    """
+    Download many URLs concurrently across hosts.
+
+    Each host gets its own pooled HostSession, at most `connections` downloads
+    at a time, and its own requests-per-second limit from `rates` (by
+    hostname, else `default_rate`), so different hosts proceed in parallel
+    while each stays polite. Retries inside download() count against the
+    host's rate too.
+    """
+
+    def __init__(self, headers=None, rates=None, default_rate=DEFAULT_HOST_RATE,
+                 connections=CONNECTIONS_PER_HOST):
+        self.headers = headers or {}
+        self.rates = rates or {}
+        self.default_rate = default_rate
+        self.connections = connections
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def session(self, host):
+        """The shared session for a host, created on first use."""
+        with self.lock:
+            if host not in self.sessions:
+                session = HostSession(self.rates.get(host, self.default_rate), self.connections)
+                session.headers.update(self.headers)
+                self.sessions[host] = session
+            return self.sessions[host]
+
+    def download_all(self, jobs):
+        """
+        Download [(url, dest_path, previous record or None), ...]. Yields
+        each job's download record, or the exception it failed with, in job
+        order.
+        """
+        results = [Future() for _ in jobs]
+        queues = {}
+        for i, (url, _, _) in enumerate(jobs):
+            queues.setdefault(urlsplit(url).hostname, deque()).append(i)
+
+        def worker(host, queue):
+            session = self.session(host)
+            while True:
+                with self.lock:
+                    if not queue:
+                        return
+                    i = queue.popleft()
+                url, dest_path, previous = jobs[i]
+                try:
+                    results[i].set_result(download(url, dest_path, session=session, previous=previous))
+                except Exception as e:
+                    results[i].set_result(e)
+
+        workers = [(host, queue) for host, queue in queues.items()
+                   for _ in range(min(self.connections, len(queue)))]
+        with ThreadPoolExecutor(max_workers=len(workers) or 1) as pool:
+            for host, queue in workers:
+                pool.submit(worker, host, queue)
+            for result in results:
+                yield result.result()
@@ -0,0 +1,627 @@
+"""
+Similarity search over the documents, or the sections, of legal_test_matters
+and sec_filings_clean.
+
+Every indexed unit is reduced to its TF-IDF vector (words and word pairs
+hashed as in document_classifier.py) and to a SimHash of the features it
+shares with other units: SIMHASH_BITS random hyperplanes, so the Hamming
+distance between two fingerprints estimates the angle between the vectors.
+With NumPy and SciPy installed, a query multiplies the stored vectors,
+mapped as a CSR matrix and read MATRIX_BLOCK_ROWS rows at a time, by the
+query vectors, so the k results are the exact top k by cosine. Without
+them, a query scans the fingerprints BLOCK_ROWS rows at a time, keeps the
+CANDIDATES nearest and ranks those by the exact cosine of their stored
+vectors, so it reads 32 bytes per indexed unit plus one row per candidate
+(recall@10 of about 0.9 on the sample corpus):
+
+    python similarity_index.py --update
+    python similarity_index.py --like 'legal_test_matters/13001-00001_IFG_Funds/HERO_LPA.txt'
+    python similarity_index.py --file path/to/side_letter.txt -k 20
+    python similarity_index.py --sections --update
+    python similarity_index.py --sections --file path/to/side_letter.txt
+
+With --sections the units are the sections of each document, split at
+ARTICLE/Section headings, and keyed '<doc_id>#<start>-<end>' by character
+offsets. The index folder holds rows appended as documents are added and
+read through mmap:
+
+    fingerprints.bin  SIMHASH_BITS / 8 bytes per row
+    features.bin      the uint32 features of each row's whole vector, row after row
+    weights.bin       their float32 weights
+    offsets.bin       where each row ends in features.bin and weights.bin, as
+                      uint64 feature counts
+    df.bin            units containing each of the 2**FEATURE_BITS features, as uint32s
+    index.json        row keys, deleted rows and each document's size, mtime and rows
+
+features.bin, weights.bin and offsets.bin are the indices, data and row
+ends of a CSR matrix. Changed and removed documents leave deleted rows
+behind until more than half the rows are deleted and update() rewrites
+the files; their features are taken out of the document frequencies as
+soon as the rows are deleted.
+"""
+
+import argparse
+import hashlib
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+from array import array
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import repeat
+from operator import add, itemgetter, mul
+
+try:
+    import numpy as np
+    import scipy.sparse as sparse
+except ImportError:
+    np = None
+
+from corpus import CORPUS_ROOTS, find_documents
+from document_classifier import FEATURE_BITS, hashed_features
+
+INDEX_PATH = "./similarity_index"
+SECTIONS_INDEX_PATH = "./similarity_index_sections"
+META_FILE = "index.json"
+INDEX_VERSION = 4
+ROW_FILES = ('fingerprints.bin', 'features.bin', 'weights.bin', 'offsets.bin')
+
+SIMHASH_BITS = 256
+CANDIDATES = 200  # Nearest fingerprints re-ranked by exact cosine
+BLOCK_ROWS = 8192  # Fingerprints compared per block
+MATRIX_BLOCK_ROWS = 1024  # Stored vectors multiplied per block
+SLOT_CACHE = 1 << 16  # Features whose hyperplane digests are remembered
+
+FINGERPRINT_BYTES = SIMHASH_BITS // 8
+FINGERPRINT_ROW = struct.Struct(f'{FINGERPRINT_BYTES}s')
+OFFSET_ROW = struct.Struct('<Q')
+
+# simhash() adds each weight to one of 256 slots per digest byte; byte value
+# v lands in slot BYTE_SLOTS[byte] + v, and BIT_SLOTS[bit] picks the values
+# with that bit set
+BYTE_SLOTS = range(0, FINGERPRINT_BYTES * 256, 256)
+BIT_SLOTS = [itemgetter(*[value for value in range(256) if value >> bit & 1]) for bit in range(8)]
+
+# Section headings: 'Article IV' or 'Section 2.3' at the start of a line, or
+# 'ARTICLE IV' / 'SECTION 2.3' anywhere (many EDGAR texts are a single line)
+SECTION_RE = re.compile(r'(?:^[ \t]*(?:Article|Section)|(?:^|(?<=\s))(?:ARTICLE|SECTION))[ \t]+[0-9IVXLC]+\b',
+                        re.MULTILINE)
+MIN_SECTION_CHARS = 500
+MAX_SECTION_CHARS = 20000
+
+
+# ---------------------------------------------------------
+# VECTORS
+# ---------------------------------------------------------
+def split_sections(text):
+    """
+    [(start, end)] of a document's sections: split at headings, cut at a
+    paragraph or sentence break when longer than MAX_SECTION_CHARS, and
+    merged into the next when shorter than MIN_SECTION_CHARS.
+    """
+    starts = [0] + [match.start() for match in SECTION_RE.finditer(text) if match.start() > 0]
+    bounds = []
+    for start, end in zip(starts, starts[1:] + [len(text)]):
+        while end - start > MAX_SECTION_CHARS:
+            cut = text.rfind('\n\n', start + MIN_SECTION_CHARS, start + MAX_SECTION_CHARS)
+            if cut < 0:
+                cut = text.rfind('. ', start + MIN_SECTION_CHARS, start + MAX_SECTION_CHARS) + 2
+            cut = cut if cut > start + 1 else start + MAX_SECTION_CHARS
+            bounds.append((start, cut))
+            start = cut
+        bounds.append((start, end))
+
+    sections = []
+    for start, end in bounds:
+        if sections and sections[-1][1] - sections[-1][0] < MIN_SECTION_CHARS:
+            sections[-1] = (sections[-1][0], end)
+        else:
+            sections.append((start, end))
+    return [(start, end) for start, end in sections if text[start:end].strip()]
+
+
+def document_units(doc_id, path, sections):
+    """[(key, hashed features)] of a document, or of each of its sections."""
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        text = f.read()
+    if not sections:
+        return [(doc_id, hashed_features(text))]
+    return [(f"{doc_id}#{start}-{end}", hashed_features(text[start:end]))
+            for start, end in split_sections(text)]
+
+
+def tfidf_vector(features, df, units):
+    """TF-IDF weights of hashed features, L2-normalized, as {feature: weight}."""
+    weights = {feature: tf * (math.log((units + 1) / (df[feature] + 1)) + 1.0) for feature, tf in features.items()}
+    norm = math.sqrt(sum(weight * weight for weight in weights.values())) or 1.0
+    return {feature: weight / norm for feature, weight in weights.items()}
+
+
+@lru_cache(maxsize=SLOT_CACHE)
+def feature_slots(feature):
+    """The simhash() slots a feature's weight is added to: one per byte of its hyperplane digest."""
+    digest = hashlib.blake2b(feature.to_bytes(4, 'little'), digest_size=FINGERPRINT_BYTES).digest()
+    return tuple(map(add, BYTE_SLOTS, digest))
+
+
+def simhash(vector, df, min_df):
+    """
+    SimHash fingerprint, as an int, of the features of a {feature: weight}
+    vector in at least min_df units; one only the unit itself has would
+    pull it away from every other. A hyperplane's total is the weight of
+    the features whose digest bit is set, less the rest, so rather than
+    add every weight to SIMHASH_BITS totals this sums it into one slot per
+    digest byte, and each bit's total is read off the slots of its byte.
+    """
+    slots = [0.0] * (FINGERPRINT_BYTES * 256)
+    for feature, weight in vector.items():
+        if df[feature] >= min_df:
+            for slot in feature_slots(feature):
+                slots[slot] += weight
+    fingerprint = 0
+    for byte, first in enumerate(BYTE_SLOTS):
+        values = slots[first:first + 256]
+        total = sum(values)
+        for bit, ones in enumerate(BIT_SLOTS):
+            if 2 * sum(ones(values)) > total:
+                fingerprint |= 1 << (byte * 8 + bit)
+    return fingerprint
+
+
+def encode_row(vector):
+    """(features.bin, weights.bin) row of a {feature: weight} vector."""
+    features = array('I', vector.keys())
+    weights = array('f', vector.values())
+    if sys.byteorder == 'big':
+        features.byteswap()
+        weights.byteswap()
+    return features.tobytes(), weights.tobytes()
+
+
+def decode_row(row):
+    """(features, weights) arrays of a (features.bin, weights.bin) row."""
+    features = array('I')
+    weights = array('f')
+    features.frombytes(row[0])
+    weights.frombytes(row[1])
+    if sys.byteorder == 'big':
+        features.byteswap()
+        weights.byteswap()
+    return features, weights
+
+
+def row_cosine(vector, row):
+    """Dot product of a normalized {feature: weight} vector and a stored row."""
+    features, weights = decode_row(row)
+    return sum(map(mul, weights, map(vector.get, features, repeat(0.0))))
+
+
+def vector_matrix(vectors):
+    """CSR matrix of {feature: weight} vectors, one row each."""
+    indptr = [0]
+    indices = []
+    data = []
+    for vector in vectors:
+        indices.extend(vector)
+        data.extend(vector.values())
+        indptr.append(len(indices))
+    return sparse.csr_matrix((np.array(data, dtype=np.float64), np.array(indices, dtype=np.int32), indptr),
+                             shape=(len(vectors), 1 << FEATURE_BITS))
+
+
+# ---------------------------------------------------------
+# WORKERS
+# ---------------------------------------------------------
+worker_df = None
+worker_units = 0
+
+
+def set_worker_df(data, units):
+    """Pool initializer: the document frequencies vectors are weighted by."""
+    global worker_df, worker_units
+    worker_df = load_df(data)
+    worker_units = units
+
+
+def unit_feature_job(job):
+    """Worker: [(key, feature numbers)] of a document's units, for counting document frequencies."""
+    doc_id, path, sections = job
+    return [(key, list(features)) for key, features in document_units(doc_id, path, sections)]
+
+
+def unit_row_job(job):
+    """Worker: [(key, fingerprint bytes, (features, weights) row bytes)] of a document's units."""
+    doc_id, path, sections = job
+    rows = []
+    for key, features in document_units(doc_id, path, sections):
+        vector = tfidf_vector(features, worker_df, worker_units)
+        # Its own features are counted in df, so shared ones are in two units
+        fingerprint = simhash(vector, worker_df, 2)
+        rows.append((key, fingerprint.to_bytes(FINGERPRINT_BYTES, 'little'), encode_row(vector)))
+    return rows
+
+
+def load_df(data):
+    df = array('I')
+    df.frombytes(data)
+    if sys.byteorder == 'big':
+        df.byteswap()
+    return df
+
+
+def dump_df(df):
+    if sys.byteorder == 'big':
+        df = array('I', df)
+        df.byteswap()
+    return df.tobytes()
+
+
+# ---------------------------------------------------------
+# INDEX
+# ---------------------------------------------------------
+class SimilarityIndex:
+    """
+    On-disk nearest-neighbour index of the corpus. Row r's key is keys[r];
+    documents maps each document ID to [size, mtime, first row, rows].
+    """
+
+    def __init__(self, path=INDEX_PATH, sections=False):
+        self.path = path
+        self.sections = sections
+        self.keys = []
+        self.documents = {}
+        self.deleted = set()
+        self.units = 0  # Live units counted into df
+        self.df = array('I', bytes(4 << FEATURE_BITS))
+        self.maps = []
+        self.row_of = None
+
+        meta_file = os.path.join(path, META_FILE)
+        if os.path.exists(meta_file):
+            with open(meta_file, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta['version'] == INDEX_VERSION and meta['sections'] == sections:
+                self.keys = meta['keys']
+                self.documents = meta['documents']
+                self.deleted = set(meta['deleted'])
+                self.units = meta['units']
+                with open(self.file('df.bin'), 'rb') as f:
+                    self.df = load_df(f.read())
+        self._open()
+
+    def __len__(self):
+        return len(self.keys) - len(self.deleted)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def file(self, name):
+        return os.path.join(self.path, name)
+
+    def _open(self):
+        """Map the row files; rows past the ones index.json knows of are never read."""
+        self.close()
+        self.fingerprints, self.features, self.weights, self.offsets = (
+            map(self._map, ROW_FILES) if self.keys else (b'', b'', b'', b''))
+
+    def _map(self, name):
+        """Read-only mmap of an index file, or b'' for an empty one, which mmap refuses."""
+        with open(self.file(name), 'rb') as f:
+            if not os.fstat(f.fileno()).st_size:
+                return b''
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.maps.append(mapped)
+        return mapped
+
+    def close(self):
+        for mapped in self.maps:
+            mapped.close()
+        self.maps = []
+
+    def save(self):
+        """Write df.bin, then the row keys and document table atomically."""
+        for name, write, mode in [
+            ('df.bin', lambda f: f.write(dump_df(self.df)), 'wb'),
+            (META_FILE, lambda f: json.dump({
+                'version': INDEX_VERSION,
+                'sections': self.sections,
+                'units': self.units,
+                'keys': self.keys,
+                'deleted': sorted(self.deleted),
+                'documents': self.documents,
+            }, f), 'w'),
+        ]:
+            tmp_file = self.file(name) + '.tmp'
+            with open(tmp_file, mode) as f:
+                write(f)
+            os.replace(tmp_file, self.file(name))
+
+    # -----------------------------------------------------
+    # Updating
+    # -----------------------------------------------------
+    def update(self, roots=CORPUS_ROOTS, workers=1):
+        """
+        Bring the index up to date with the documents under roots: new and
+        changed files are added, the rows of changed and removed ones
+        deleted. New documents are read twice, first to count document
+        frequencies and then to weight their vectors by them. Returns
+        (added, changed, removed) counts.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        found = {}
+        pending = []
+        changed = 0
+        for doc_id, path in find_documents(roots):
+            st = os.stat(path)
+            found[doc_id] = path
+            known = self.documents.get(doc_id)
+            if known is None or known[:2] != [st.st_size, st.st_mtime_ns]:
+                changed += known is not None
+                pending.append((doc_id, path, st))
+
+        removed = [doc_id for doc_id in self.documents if doc_id not in found]
+        for doc_id in removed + [doc_id for doc_id, _, _ in pending]:
+            _, _, first, count = self.documents.pop(doc_id, [0, 0, 0, 0])
+            # The old version no longer counts towards document frequencies
+            for row in range(first, first + count):
+                for feature in decode_row(self.row_data(row))[0]:
+                    self.df[feature] -= 1
+            self.units -= count
+            self.deleted.update(range(first, first + count))
+        self.row_of = None
+
+        jobs = [(doc_id, path, self.sections) for doc_id, path, _ in pending]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # Document frequencies first, so new rows are weighted by them
+            counts = Counter()
+            for units in pool.map(unit_feature_job, jobs, chunksize=8):
+                for _, features in units:
+                    counts.update(features)
+                self.units += len(units)
+            for feature, count in counts.items():
+                self.df[feature] += count
+
+        end = self.row_end(len(self.keys) - 1)
+        self.close()
+        with ProcessPoolExecutor(max_workers=workers, initializer=set_worker_df,
+                                 initargs=(dump_df(self.df), self.units)) as pool, \
+                open(self.file('fingerprints.bin'), 'ab') as fingerprints, \
+                open(self.file('features.bin'), 'ab') as features, \
+                open(self.file('weights.bin'), 'ab') as weights, \
+                open(self.file('offsets.bin'), 'ab') as offsets:
+            # Drop rows an interrupted update wrote after the last save
+            fingerprints.truncate(len(self.keys) * FINGERPRINT_BYTES)
+            features.truncate(end * 4)
+            weights.truncate(end * 4)
+            offsets.truncate(len(self.keys) * OFFSET_ROW.size)
+            for (doc_id, _, st), rows in zip(pending, pool.map(unit_row_job, jobs, chunksize=8)):
+                self.documents[doc_id] = [st.st_size, st.st_mtime_ns, len(self.keys), len(rows)]
+                for key, fingerprint, (row_features, row_weights) in rows:
+                    self.keys.append(key)
+                    fingerprints.write(fingerprint)
+                    features.write(row_features)
+                    weights.write(row_weights)
+                    end += len(row_features) // 4
+                    offsets.write(OFFSET_ROW.pack(end))
+
+        self.save()
+        if len(self.deleted) * 2 > len(self.keys):
+            self.compact()
+        else:
+            self._open()
+        return len(pending) - changed, changed, len(removed)
+
+    def compact(self):
+        """Rewrite the row files without the deleted rows."""
+        self._open()
+        live = [row for row in range(len(self.keys)) if row not in self.deleted]
+        new_row = {row: i for i, row in enumerate(live)}
+        with open(self.file('fingerprints.bin.tmp'), 'wb') as fingerprints, \
+                open(self.file('features.bin.tmp'), 'wb') as features, \
+                open(self.file('weights.bin.tmp'), 'wb') as weights, \
+                open(self.file('offsets.bin.tmp'), 'wb') as offsets:
+            end = 0
+            for row in live:
+                fingerprints.write(self.fingerprints[row * FINGERPRINT_BYTES:(row + 1) * FINGERPRINT_BYTES])
+                row_features, row_weights = self.row_data(row)
+                features.write(row_features)
+                weights.write(row_weights)
+                end += len(row_features) // 4
+                offsets.write(OFFSET_ROW.pack(end))
+        self.close()
+        for name in ROW_FILES:
+            os.replace(self.file(name + '.tmp'), self.file(name))
+
+        self.keys = [self.keys[row] for row in live]
+        for entry in self.documents.values():
+            entry[2] = new_row[entry[2]] if entry[3] else 0
+        self.deleted = set()
+        self.row_of = None
+        self.save()
+        self._open()
+
+    # -----------------------------------------------------
+    # Querying
+    # -----------------------------------------------------
+    def row_end(self, row):
+        """Features stored up to the end of a row; 0 for row -1."""
+        return OFFSET_ROW.unpack_from(self.offsets, row * OFFSET_ROW.size)[0] if row >= 0 else 0
+
+    def row_data(self, row):
+        """(features.bin, weights.bin) bytes of a row."""
+        start, end = self.row_end(row - 1) * 4, self.row_end(row) * 4
+        return self.features[start:end], self.weights[start:end]
+
+    def vector(self, row):
+        """Stored {feature: weight} vector of a row."""
+        return dict(zip(*decode_row(self.row_data(row))))
+
+    def fingerprint(self, row):
+        return int.from_bytes(self.fingerprints[row * FINGERPRINT_BYTES:(row + 1) * FINGERPRINT_BYTES], 'little')
+
+    def text_vector(self, text):
+        """{feature: weight} vector of a text, weighted by the index's document frequencies."""
+        return tfidf_vector(hashed_features(text), self.df, self.units)
+
+    def nearest_fingerprints(self, fingerprints, candidates=CANDIDATES):
+        """
+        For each query fingerprint, the rows of the `candidates` nearest
+        live fingerprints. Each block of rows is decoded once and compared
+        with every query before the next block is read.
+        """
+        best = [[] for _ in fingerprints]
+        for start in range(0, len(self.keys), BLOCK_ROWS):
+            end = min(start + BLOCK_ROWS, len(self.keys))
+            block = self.fingerprints[start * FINGERPRINT_BYTES:end * FINGERPRINT_BYTES]
+            values = list(map(int.from_bytes, map(itemgetter(0), FINGERPRINT_ROW.iter_unpack(block)),
+                              repeat('little')))
+            for query, nearest in zip(fingerprints, best):
+                # Hamming distances, computed in C by map()
+                scored = zip(map(int.bit_count, map(query.__xor__, values)), range(start, end))
+                if self.deleted:
+                    scored = ((distance, row) for distance, row in scored if row not in self.deleted)
+                nearest[:] = heapq.nsmallest(candidates, nearest + heapq.nsmallest(candidates, scored))
+        return [[row for _, row in nearest] for nearest in best]
+
+    def matrix_rows(self, ends, start, end):
+        """Rows start to end as a CSR matrix over the mapped files; ends are offsets.bin as an array."""
+        first = self.row_end(start - 1)
+        indptr = np.concatenate(([first], ends[start:end])).astype(np.int64) - first
+        count = int(indptr[-1])
+        indices = np.frombuffer(self.features, dtype='<u4', count=count, offset=first * 4).astype(np.int32)
+        data = np.frombuffer(self.weights, dtype='<f4', count=count, offset=first * 4)
+        return sparse.csr_matrix((data, indices, indptr), shape=(end - start, 1 << FEATURE_BITS))
+
+    def nearest_vectors(self, vectors, k, exclude):
+        """
+        For each {feature: weight} vector, the k live rows outside `exclude`
+        with the highest cosine, as [(cosine, row)]: each block of stored
+        rows is multiplied by all the query vectors at once.
+        """
+        best = [[] for _ in vectors]
+        if not self.keys:
+            return best
+        columns = vector_matrix(vectors).T.tocsr()
+        ends = np.frombuffer(self.offsets, dtype='<u8', count=len(self.keys))
+        skipped = np.array(sorted(self.deleted.union(exclude)), dtype=np.int64)
+        for start in range(0, len(self.keys), MATRIX_BLOCK_ROWS):
+            end = min(start + MATRIX_BLOCK_ROWS, len(self.keys))
+            scores = (self.matrix_rows(ends, start, end) @ columns).toarray()
+            scores[skipped[(skipped >= start) & (skipped < end)] - start] = -np.inf
+            for scored, nearest in zip(scores.T, best):
+                top = np.argpartition(-scored, k)[:k] if len(scored) > k else range(len(scored))
+                nearest[:] = heapq.nlargest(k, nearest + [(float(scored[i]), start + int(i))
+                                                          for i in top if scored[i] > -np.inf])
+        return best
+
+    def query_vectors(self, vectors, k=10, exclude=(), fingerprints=None):
+        """
+        For each {feature: weight} vector, the k most similar units as
+        [(key, cosine)], best first; rows in `exclude` are left out. Without
+        SciPy the candidates are the rows nearest to the vectors'
+        fingerprints, computed from the vectors unless given.
+        """
+        if np is not None:
+            return [[(self.keys[row], score) for score, row in nearest]
+                    for nearest in self.nearest_vectors(vectors, k, exclude)]
+
+        if fingerprints is None:
+            # Any feature an indexed unit has is one the vector shares
+            fingerprints = [simhash(vector, self.df, 1) for vector in vectors]
+        results = []
+        for vector, rows in zip(vectors, self.nearest_fingerprints(fingerprints, CANDIDATES + len(exclude))):
+            scored = [(row_cosine(vector, self.row_data(row)), row) for row in rows if row not in exclude]
+            results.append([(self.keys[row], score) for score, row in heapq.nlargest(k, scored)])
+        return results
+
+    def query(self, text, k=10):
+        """The k units most similar to a text, as [(key, cosine)]."""
+        return self.query_vectors([self.text_vector(text)], k)[0]
+
+    def rows(self, key):
+        """Rows of an indexed key, or of every section of a document ID."""
+        if self.row_of is None:
+            self.row_of = {key: row for row, key in enumerate(self.keys) if row not in self.deleted}
+        if key in self.row_of:
+            return [self.row_of[key]]
+        if key in self.documents:
+            _, _, first, count = self.documents[key]
+            return list(range(first, first + count))
+        raise KeyError(key)
+
+    def similar(self, key, k=10):
+        """
+        The k units most similar to an indexed one, as [(key, cosine)];
+        for a document ID in a sections index, to each of its sections,
+        best per key.
+        """
+        rows = self.rows(key)
+        best = {}
+        for results in self.query_vectors([self.vector(row) for row in rows], k, exclude=set(rows),
+                                          fingerprints=list(map(self.fingerprint, rows))):
+            for found, score in results:
+                best[found] = max(score, best.get(found, score))
+        return heapq.nlargest(k, best.items(), key=itemgetter(1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the documents or sections most similar to a document.")
+    parser.add_argument("--like", metavar="KEY", help="an indexed document ID (or section key) to match")
+    parser.add_argument("--file", help="a text file to match")
+    parser.add_argument("-k", type=int, default=10, help="results to print (default: 10)")
+    parser.add_argument("--sections", action="store_true", help="index and search sections instead of documents")
+    parser.add_argument("--update", action="store_true",
+                        help="add new and changed documents first (done automatically the first time)")
+    parser.add_argument("--rebuild", action="store_true", help="discard the index and build it again")
+    parser.add_argument("--index", help=f"index folder (default: {INDEX_PATH}, or {SECTIONS_INDEX_PATH} with --sections)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="processes to vectorize documents with")
+    args = parser.parse_args()
+
+    path = args.index or (SECTIONS_INDEX_PATH if args.sections else INDEX_PATH)
+    if args.rebuild and os.path.exists(os.path.join(path, META_FILE)):
+        os.remove(os.path.join(path, META_FILE))
+
+    index = SimilarityIndex(path, args.sections)
+    if args.update or args.rebuild or not index.keys:
+        start = time.perf_counter()
+        added, changed, removed = index.update(workers=args.workers)
+        print(f"Indexed {added} new and {changed} changed documents, dropped {removed}; "
+              f"{len(index)} {'sections' if args.sections else 'documents'} "
+              f"({time.perf_counter() - start:.1f}s)")
+
+    queries = []
+    if args.like:
+        try:
+            index.rows(args.like)
+        except KeyError:
+            parser.error(f"{args.like} is not in the index")
+        queries.append((args.like, lambda: index.similar(args.like, args.k)))
+    if args.file:
+        with open(args.file, 'r', encoding='utf-8', errors='ignore') as f:
+            text = f.read()
+        queries.append((args.file, lambda: index.query(text, args.k)))
+
+    for name, run in queries:
+        start = time.perf_counter()
+        results = run()
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"\nMost similar to {name}:")
+        for key, score in results:
+            print(f"  {score:.3f}  {key}")
+        print(f"({elapsed:.1f} ms over {len(index)} rows)")
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# The scripts live at the repository root, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class StubServer:
+    """
+    Local HTTP server for the downloaders. `routes` maps a path (without
+    the query string) to (status, headers, body) or to a callable taking
+    the request handler and returning one; every request is logged in
+    `requests` as (path, headers). A route that sets a Content-Length
+    longer than its body has the connection dropped after the body.
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                stub.requests.append((self.path, dict(self.headers)))
+                route = stub.routes.get(path, (404, {}, b'not found'))
+                status, headers, body = route(self) if callable(route) else route
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                if 'Content-Length' not in headers:
+                    self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                if int(headers.get('Content-Length', len(body))) > len(body):
+                    self.close_connection = True
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def hits(self, path):
+        return sum(1 for requested, _ in self.requests if requested.split('?', 1)[0] == path)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub_server():
+    server = StubServer()
+    yield server
+    server.close()
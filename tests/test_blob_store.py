@@ -0,0 +1,43 @@
+import os
+import stat
+
+from blob_store import BlobStore
+
+
+def test_put_file_copies_into_the_store(tmp_path):
+    src = tmp_path / 'download.htm'
+    src.write_bytes(b'exhibit')
+    store = BlobStore(str(tmp_path / 'store'))
+
+    digest = store.put_file(str(src))
+    src.write_bytes(b'edited download')
+
+    with open(store.path(digest), 'rb') as f:
+        assert f.read() == b'exhibit'
+    assert os.stat(store.path(digest)).st_nlink == 1
+
+
+def test_blobs_and_links_are_read_only(tmp_path):
+    store = BlobStore(str(tmp_path / 'store'))
+    first, second = tmp_path / 'a.txt', tmp_path / 'b.txt'
+    assert store.save_text('clause', str(first))
+    assert store.save_text('clause', str(second))
+    assert not store.save_text('clause', str(first))
+
+    mode = os.stat(first).st_mode
+    assert not mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
+    assert os.path.samefile(first, second)
+
+
+def test_stats_counts_only_links_beyond_the_first(tmp_path):
+    store = BlobStore(str(tmp_path / 'store'))
+    src = tmp_path / 'download.txt'
+    src.write_bytes(b'x' * 100)
+    for name in ['a.txt', 'b.txt', 'c.txt']:
+        store.save_file(str(src), str(tmp_path / name))
+    store.save_text('only once', str(tmp_path / 'd.txt'))
+
+    blobs, stored, saved = store.stats()
+    assert (blobs, stored) == (2, 100 + len('only once'))
+    if os.stat(tmp_path / 'a.txt').st_nlink > 1:  # Hardlinks supported
+        assert saved == 200
@@ -0,0 +1,40 @@
+import os
+import zipfile
+
+from corpus import Corpus
+
+DOCX_XML = ('<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+            '<w:body><w:p><w:r><w:t>Side letter terms</w:t></w:r></w:p></w:body></w:document>')
+
+
+def make_corpus(tmp_path):
+    matter = tmp_path / 'legal_test_matters' / '12001-00001_IFG_Fund'
+    matter.mkdir(parents=True)
+    (matter / 'HERO_LPA.txt').write_text('Limited partnership agreement')
+    with zipfile.ZipFile(matter / 'Side_Letter.docx', 'w') as archive:
+        archive.writestr('word/document.xml', DOCX_XML)
+    # Not a real PDF: fails with or without pypdf installed
+    (matter / 'Subscription_Agreement.pdf').write_bytes(b'not a pdf')
+    return matter, Corpus([str(tmp_path / 'legal_test_matters')], manifest=None)
+
+
+def test_texts_skips_and_reports_unextractable_binaries(tmp_path):
+    matter, corpus = make_corpus(tmp_path)
+    errors = []
+    texts = {document.name: text for document, text in
+             corpus.texts(on_error=lambda document, e: errors.append(document.name))}
+
+    assert texts == {'HERO_LPA.txt': 'Limited partnership agreement',
+                     'Side_Letter.docx': 'Side letter terms'}
+    assert errors == ['Subscription_Agreement.pdf']
+
+
+def test_text_writes_into_the_matter_only_when_asked(tmp_path):
+    matter, corpus = make_corpus(tmp_path)
+    before = sorted(os.listdir(matter))
+    list(corpus.texts(practice_area='IFG', on_error=lambda document, e: None))
+    assert sorted(os.listdir(matter)) == before
+
+    docx = next(corpus.documents(doc_type='Side_Letter'))
+    assert docx.text(cache=True) == 'Side letter terms'
+    assert 'Side_Letter.docx.txt' in os.listdir(matter)
@@ -0,0 +1,37 @@
+import pytest
+
+from corpus_index import CorpusIndex
+
+
+@pytest.fixture
+def index(tmp_path):
+    matters = tmp_path / 'legal_test_matters'
+    ifg = matters / '12001-00001_IFG_Fund'
+    levfin = matters / '14001-00001_LevFin'
+    ifg.mkdir(parents=True)
+    levfin.mkdir(parents=True)
+    (ifg / 'Side_Letter.txt').write_text('The most favored nation clause applies at 10:30 am.')
+    (levfin / 'Credit_Agreement.txt').write_text('This credit agreement has a most favored lender clause.')
+    index = CorpusIndex(str(tmp_path / 'index'))
+    index.update(roots=[str(matters)])
+    return index
+
+
+def ids(results):
+    return [result['id'].rsplit('/', 1)[-1] for result in results]
+
+
+def test_phrase_and_field_queries(index):
+    assert ids(index.search('"most favored nation"')) == ['Side_Letter.txt']
+    assert ids(index.search('clause AND NOT area:IFG')) == ['Credit_Agreement.txt']
+    assert ids(index.search('clause Area:levfin')) == ['Credit_Agreement.txt']
+
+
+def test_colon_in_a_plain_word_is_not_a_field(index):
+    assert ids(index.search('at 10:30 am')) == ['Side_Letter.txt']
+    assert ids(index.search('note:clause')) == []
+
+
+def test_unparseable_query_raises_value_error(index):
+    with pytest.raises(ValueError):
+        index.search('(clause')
@@ -0,0 +1,103 @@
+import os
+import sys
+from functools import partial
+
+import pytest
+
+pq = pytest.importorskip('pyarrow.parquet')
+
+import corpus_parquet
+from corpus import Corpus
+from corpus_parquet import parse_condition
+
+
+def test_parse_condition_casts_to_column_type():
+    assert parse_condition('client_id=12001') == ('client_id', 12001)
+    assert parse_condition('hero=true') == ('hero', True)
+    assert parse_condition('hero=False') == ('hero', False)
+    assert parse_condition('form=10-K') == ('form', '10-K')
+    assert parse_condition('doc_type=a=b') == ('doc_type', 'a=b')
+
+
+@pytest.mark.parametrize('condition', ['client_id=abc', 'hero=maybe', 'nope=1', 'form'])
+def test_parse_condition_rejects_bad_conditions(condition):
+    with pytest.raises(ValueError):
+        parse_condition(condition)
+
+
+def make_trees(tmp_path):
+    """Two matters and a filing; returns ({doc_id: text}, roots)."""
+    files = {
+        'legal_test_matters/12001-00001_IFG_Fund/HERO_LPA.txt': 'Limited partnership agreement',
+        'legal_test_matters/12001-00001_IFG_Fund/Side_Letter.txt': 'Side letter terms',
+        'legal_test_matters/12001-00001_IFG_Fund/Subscription_Agreement.txt': 'Subscription',
+        'legal_test_matters/15001-00002_MandA/HERO_Merger_Agreement.txt': 'Merger agreement',
+        'sec_filings_clean/KKR/10-K_0000000001-24-000001/EX-10.1_credit_agreement.txt': 'Credit agreement',
+    }
+    for doc_id, text in files.items():
+        path = tmp_path / doc_id
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text, encoding='utf-8')
+    return files, [str(tmp_path / 'legal_test_matters'), str(tmp_path / 'sec_filings_clean')]
+
+
+@pytest.fixture
+def exported(tmp_path, monkeypatch):
+    monkeypatch.setattr(corpus_parquet, 'Corpus', partial(Corpus, manifest=None))
+    monkeypatch.setattr(corpus_parquet, 'BATCH_ROWS', 2)  # Several row groups per partition
+    files, roots = make_trees(tmp_path)
+    out = str(tmp_path / 'parquet')
+    counts = corpus_parquet.export(out, roots)
+    return files, out, counts
+
+
+def test_export_partitions_by_practice_area(exported):
+    files, out, counts = exported
+    assert counts == {'IFG': 3, 'MandA': 1, 'Unassigned': 1}
+    assert sorted(os.listdir(out)) == ['practice_area=IFG', 'practice_area=MandA', 'practice_area=Unassigned']
+
+    part = pq.ParquetFile(os.path.join(out, 'practice_area=IFG', 'part-0.parquet'))
+    assert 'practice_area' not in part.schema_arrow.names
+    assert part.metadata.num_row_groups == 2
+    assert part.metadata.num_rows == 3
+
+
+def test_read_round_trips_the_export(exported):
+    files, out, _ = exported
+    rows = {row['doc_id']: row for row in corpus_parquet.read(out).to_pylist()}
+    assert {doc_id: row['text'] for doc_id, row in rows.items()} == files
+
+    lpa = rows['legal_test_matters/12001-00001_IFG_Fund/HERO_LPA.txt']
+    assert (lpa['practice_area'], lpa['client_id'], lpa['hero'], lpa['length']) == ('IFG', 12001, True, 29)
+    filing = rows['sec_filings_clean/KKR/10-K_0000000001-24-000001/EX-10.1_credit_agreement.txt']
+    assert (filing['practice_area'], filing['ticker'], filing['form'], filing['accession']) == \
+        ('Unassigned', 'KKR', '10-K', '0000000001-24-000001')
+
+    table = corpus_parquet.read(out, ['doc_id', 'length'], practice_area='IFG', hero=False)
+    assert table.column_names == ['doc_id', 'length']
+    assert sorted(table.column('doc_id').to_pylist()) == [
+        'legal_test_matters/12001-00001_IFG_Fund/Side_Letter.txt',
+        'legal_test_matters/12001-00001_IFG_Fund/Subscription_Agreement.txt']
+
+
+def test_metadata_and_batches_leave_out_the_text(exported):
+    files, out, _ = exported
+    metadata = corpus_parquet.read_metadata(out, practice_area=['IFG', 'MandA'])
+    assert 'text' not in metadata.column_names
+    assert set(metadata.column_names) == set(corpus_parquet.COLUMNS) - {'text'}
+    assert metadata.num_rows == 4
+
+    batches = list(corpus_parquet.iter_batches(out, ['doc_id', 'text'], batch_size=1))
+    assert all(batch.num_rows <= 1 for batch in batches)
+    assert {doc_id: text for batch in batches
+            for doc_id, text in zip(batch.column('doc_id').to_pylist(), batch.column('text').to_pylist())} == files
+
+
+def test_where_conditions_are_cast_before_filtering(exported, monkeypatch, capsys):
+    _, out, _ = exported
+    monkeypatch.setattr(sys, 'argv', ['corpus_parquet.py', '--path', out, '--columns', 'doc_id,client_id',
+                                      '--where', 'client_id=12001', '--where', 'hero=true'])
+    corpus_parquet.main()
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == 'legal_test_matters/12001-00001_IFG_Fund/HERO_LPA.txt  12001'
+    assert lines[-1] == '1 rows'
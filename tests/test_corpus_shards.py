@@ -0,0 +1,103 @@
+import os
+import random
+
+import pytest
+
+import corpus_shards
+from corpus import document_fields
+from corpus_shards import CorpusShards, ShardReader, pack
+
+CODECS = [
+    'zlib',
+    pytest.param('zstd', marks=pytest.mark.skipif(corpus_shards.zstandard is None,
+                                                  reason="zstandard is not installed")),
+]
+
+
+def make_trees(tmp_path, seed=11):
+    """A few matters and filings; returns ({doc_id: text}, roots)."""
+    rng = random.Random(seed)
+    texts = {}
+    folders = ['legal_test_matters/12001-00001_IFG_Fund', 'legal_test_matters/15001-00002_MandA',
+               'sec_filings_clean/ACME/10-K_2023']
+    for folder in folders:
+        (tmp_path / folder).mkdir(parents=True)
+        for i in range(6):
+            name = f"EX-10.{i}_agreement.txt" if folder.startswith('sec') else f"Document_{i}.txt"
+            text = f"{folder} {i} " + ' '.join(f"clause{rng.randrange(500)}" for _ in range(rng.randrange(50, 3000)))
+            if i == 2:
+                text += ' Schedule § 3.1 café'
+            (tmp_path / folder / name).write_text(text, encoding='utf-8')
+            texts[f"{folder}/{name}"] = text
+    return texts, [str(tmp_path / 'legal_test_matters'), str(tmp_path / 'sec_filings_clean')]
+
+
+@pytest.fixture
+def small_blocks(monkeypatch):
+    monkeypatch.setattr(corpus_shards, 'BLOCK_SIZE', 8 * 1024)
+
+
+@pytest.mark.parametrize('codec', CODECS)
+def test_pack_and_read_round_trip(tmp_path, small_blocks, codec):
+    texts, roots = make_trees(tmp_path)
+    out = str(tmp_path / 'shards')
+    count, raw, packed = pack(roots, out, shard_size=40 * 1024, codec=codec)
+    assert count == len(texts)
+    assert raw == sum(len(text.encode('utf-8')) for text in texts.values())
+    assert 0 < packed < raw
+
+    names = sorted(os.listdir(out))
+    assert len(names) > 1
+    with ShardReader(os.path.join(out, names[0])) as shard:
+        assert shard.codec == codec
+        assert len(shard.blocks) > 1
+
+    with CorpusShards(out) as shards:
+        assert len(shards) == len(texts)
+        assert shards.ids() == sorted(texts)
+        assert dict(shards) == texts
+        assert list(shards) == sorted(texts.items())
+        for doc_id in reversed(sorted(texts)):  # Out of order, across blocks and shards
+            assert shards.read(doc_id) == texts[doc_id]
+            assert shards.fields(doc_id) == document_fields(doc_id)
+
+        selected = dict(shards.select(practice_area='MandA'))
+        assert selected == {doc_id: text for doc_id, text in texts.items() if '_MandA/' in doc_id}
+        assert dict(shards.select(ticker='ACME', form='10-K')) == \
+            {doc_id: text for doc_id, text in texts.items() if doc_id.startswith('sec_filings_clean/')}
+        assert list(shards.select(ticker='NONE')) == []
+
+
+def test_pack_replaces_the_old_shards(tmp_path, small_blocks):
+    texts, roots = make_trees(tmp_path)
+    out = str(tmp_path / 'shards')
+    pack(roots, out, shard_size=10 * 1024, codec='zlib')
+    many = len(os.listdir(out))
+    pack(roots, out, shard_size=1024 * 1024, codec='zlib')
+    assert os.listdir(out) == ['corpus-00000.shard'] and many > 1
+    assert sorted(os.listdir(tmp_path)) == ['legal_test_matters', 'sec_filings_clean', 'shards']
+    with CorpusShards(out) as shards:
+        assert dict(shards) == texts
+
+
+def test_failed_pack_keeps_the_old_shards(tmp_path, small_blocks, monkeypatch):
+    texts, roots = make_trees(tmp_path)
+    out = str(tmp_path / 'shards')
+    pack(roots, out, shard_size=10 * 1024, codec='zlib')
+    before = sorted(os.listdir(out))
+
+    write_shard = corpus_shards.write_shard
+    calls = []
+
+    def failing(path, documents, codec):
+        calls.append(path)
+        if len(calls) > 1:
+            raise OSError("disk full")
+        return write_shard(path, documents, codec)
+
+    monkeypatch.setattr(corpus_shards, 'write_shard', failing)
+    with pytest.raises(OSError):
+        pack(roots, out, shard_size=10 * 1024, codec='zlib')
+    assert sorted(os.listdir(out)) == before
+    with CorpusShards(out) as shards:
+        assert dict(shards) == texts
@@ -0,0 +1,100 @@
+import json
+import random
+
+import pytest
+
+import document_classifier
+from document_classifier import DocumentClassifier, classify_batch, hashed_features, term_feature
+
+pytestmark = pytest.mark.skipif(document_classifier.np is None, reason="needs numpy and scipy")
+
+WORDS = ['capital', 'call', 'notice', 'limited', 'partner', 'credit', 'facility', 'lender', 'borrower',
+         'merger', 'agreement', 'closing', 'unaudited', 'an', 'opportunity', 'fund', 'term', 'loan']
+
+
+def random_text(rng, words, length):
+    return ' '.join(rng.choice(words) for _ in range(length))
+
+
+def dict_features(monkeypatch, text, bits=document_classifier.FEATURE_BITS):
+    """hashed_features() without NumPy, as a list so the order is compared too."""
+    with monkeypatch.context() as m:
+        m.setattr(document_classifier, 'np', None)
+        return list(hashed_features(text, bits).items())
+
+
+@pytest.mark.parametrize('text', [
+    '',
+    'Word',
+    'Capital Call Notice, capital call notice!',
+    'an opportunity unaudited an opportunity',
+    # Non-ASCII letters end words, as in WORD_RE, and a lone surrogate does not stop hashing
+    'Café naïve ÉTÉ straße \ud800 fin',
+    'a ' + 'x' * 5000 + ' loan ' + 'y' * 300,
+])
+def test_array_features_match_dicts(monkeypatch, text):
+    assert list(hashed_features(text).items()) == dict_features(monkeypatch, text)
+    assert list(hashed_features(text, 8).items()) == dict_features(monkeypatch, text, 8)
+
+
+def test_pairs_hash_as_their_joined_words():
+    features = hashed_features('Capital call, notice', 20)
+    assert list(features) == [term_feature(term, 20) for term in ['capital', 'call', 'notice',
+                                                                  'capital call', 'call notice']]
+
+
+def test_array_features_match_dicts_on_random_texts(monkeypatch):
+    rng = random.Random(3)
+    vocabulary = [''.join(rng.choice('abcdefghij') for _ in range(rng.randrange(2, 12))) for _ in range(3000)]
+    for _ in range(20):
+        text = random_text(rng, vocabulary, rng.randrange(1, 20000))
+        # 12 bits, so many terms share a feature
+        assert list(hashed_features(text, 12).items()) == dict_features(monkeypatch, text, 12)
+
+
+def training_set(rng):
+    return [(random_text(rng, WORDS[i % 3 * 6:i % 3 * 6 + 6] + WORDS, 300),
+             {'practice_area': ['IFG', 'LevFin', 'MandA'][i % 3], 'doc_type': ['LPA', 'Credit'][i % 2]})
+            for i in range(30)]
+
+
+def test_array_training_matches_dicts(monkeypatch):
+    documents = training_set(random.Random(4))
+    model = DocumentClassifier.train(documents)
+    with monkeypatch.context() as m:
+        m.setattr(document_classifier, 'np', None)
+        expected = DocumentClassifier.train(documents)
+
+    assert model.idf == expected.idf
+    for head, (classes, biases, weights) in expected.heads.items():
+        assert model.heads[head][0] == classes
+        assert model.heads[head][1] == pytest.approx(biases)
+        for w, expected_w in zip(model.heads[head][2], weights):
+            assert w.keys() == expected_w.keys()
+            assert list(w.values()) == pytest.approx([expected_w[feature] for feature in w])
+
+
+def test_batch_matches_dicts(monkeypatch, tmp_path):
+    rng = random.Random(5)
+    DocumentClassifier.train(training_set(rng)).save(str(tmp_path / 'model.json'))
+    texts = [random_text(rng, WORDS, rng.randrange(0, 3000)) for _ in range(150)]
+
+    batched = classify_batch(texts, str(tmp_path / 'model.json'))
+    # The saved model, whose weights are rounded
+    model = DocumentClassifier.load(str(tmp_path / 'model.json'))
+    with monkeypatch.context() as m:
+        m.setattr(document_classifier, 'np', None)
+        expected = [model.classify(text) for text in texts]
+    assert [result['practice_area'][0] for result in batched] == [result['practice_area'][0] for result in expected]
+    assert [result['practice_area'][1] for result in batched] == pytest.approx(
+        [result['practice_area'][1] for result in expected])
+
+
+def test_models_of_other_features_are_refused(tmp_path):
+    path = tmp_path / 'model.json'
+    DocumentClassifier.train(training_set(random.Random(6))).save(str(path))
+    model = json.loads(path.read_text())
+    del model['version']
+    path.write_text(json.dumps(model))
+    with pytest.raises(ValueError, match='--train'):
+        DocumentClassifier.load(str(path))
@@ -0,0 +1,67 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+from blob_store import BlobStore
+from download_cuad_contracts import find_members, save_matter
+
+MEMBERS = {
+    'CUAD_v1/full_contract_pdf/Part_I/Affiliate_Agreements/SUPPLY_AGREEMENT.pdf': b'%PDF supply',
+    'CUAD_v1/full_contract_pdf/Part_II/License_Agreements/LICENSE.PDF': b'%PDF license',
+    'CUAD_v1/full_contract_txt/LICENSE.txt': b'license text',
+    'CUAD_v1/full_contract_pdf/Part_III/Other/LICENSE.PDF': b'%PDF other license',
+    'CUAD_v1/master_clauses.csv': b'clause,answer',
+    'CUAD_v1/CUAD_v1.json': b'{}',
+    '__MACOSX/CUAD_v1/full_contract_txt/._LICENSE.txt': b'resource fork',
+    'README.txt': b'readme',
+}
+
+
+class UnreadableZip(zipfile.ZipFile):
+    """A ZipFile that fails if any member is opened."""
+
+    def open(self, *args, **kwargs):
+        raise AssertionError("a member was read")
+
+
+@pytest.fixture
+def cuad_zip():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr(zipfile.ZipInfo('CUAD_v1/'), b'')
+        archive.writestr(zipfile.ZipInfo('CUAD_v1/full_contract_pdf.pdf/'), b'')  # A folder, not a PDF
+        for name, data in MEMBERS.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def test_members_come_from_the_central_directory(cuad_zip):
+    with UnreadableZip(io.BytesIO(cuad_zip)) as archive:
+        assert find_members(archive) == [
+            'CUAD_v1/full_contract_pdf/Part_I/Affiliate_Agreements/SUPPLY_AGREEMENT.pdf',
+            'CUAD_v1/full_contract_pdf/Part_II/License_Agreements/LICENSE.PDF',
+            'CUAD_v1/full_contract_pdf/Part_III/Other/LICENSE.PDF',
+            'CUAD_v1/full_contract_txt/LICENSE.txt',
+        ]
+        assert find_members(archive, ['.csv', '.json']) == ['CUAD_v1/CUAD_v1.json', 'CUAD_v1/master_clauses.csv']
+        assert find_members(archive, ['.txt'], prefix='') == [
+            'CUAD_v1/full_contract_txt/LICENSE.txt', 'README.txt',
+            '__MACOSX/CUAD_v1/full_contract_txt/._LICENSE.txt']
+
+
+def test_saved_matter_streams_only_its_members(cuad_zip, tmp_path):
+    store = BlobStore(str(tmp_path / 'store'))
+    with zipfile.ZipFile(io.BytesIO(cuad_zip)) as archive:
+        members = find_members(archive, ['.pdf'])
+        save_matter('IP', 1, members, str(tmp_path / 'matters'), archive, store)
+        # A rerun relinks the same names instead of adding copies
+        save_matter('IP', 1, members, str(tmp_path / 'matters'), archive, store)
+
+    folder = tmp_path / 'matters' / 'IP_1'
+    assert {name: (folder / name).read_bytes() for name in os.listdir(folder)} == {
+        'SUPPLY_AGREEMENT.pdf': b'%PDF supply',
+        'LICENSE.PDF': b'%PDF license',
+        'LICENSE_2.PDF': b'%PDF other license',
+    }
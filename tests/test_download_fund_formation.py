@@ -0,0 +1,89 @@
+import os
+import threading
+import time
+import types
+from functools import partial
+
+import pytest
+
+import download_fund_formation
+import edgar_fetch
+import resumable_download
+
+RATES = {'127.0.0.1': 4, 'localhost': 2}
+
+
+class ThreadClock:
+    """
+    A fake monotonic clock per thread: sleep() advances the calling
+    thread's time instead of waiting. With one connection per host, each
+    host's token bucket only ever runs on one thread.
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def monotonic(self):
+        return getattr(self.local, 'now', 0.0)
+
+    def sleep(self, seconds):
+        self.local.now = self.monotonic() + seconds
+
+
+@pytest.fixture
+def grants(monkeypatch, tmp_path):
+    """{rate: [fake times each request was let through]} for every host bucket."""
+    clock = ThreadClock()
+    monkeypatch.setattr(edgar_fetch, 'time', types.SimpleNamespace(
+        monotonic=clock.monotonic, sleep=clock.sleep, time=time.time))
+    times = {}
+
+    class RecordingBucket(edgar_fetch.TokenBucket):
+        def acquire(self):
+            super().acquire()
+            times.setdefault(self.rate, []).append(clock.monotonic())
+
+    monkeypatch.setattr(resumable_download, 'TokenBucket', RecordingBucket)
+    monkeypatch.setattr(download_fund_formation, 'HostScheduler',
+                        partial(resumable_download.HostScheduler, connections=1))
+    monkeypatch.setattr(download_fund_formation, 'HOST_RATES', RATES)
+    monkeypatch.setattr(download_fund_formation, 'DOWNLOAD_RECORDS', str(tmp_path / 'downloads.json'))
+    monkeypatch.setattr(download_fund_formation, 'download_records', {})
+    return times
+
+
+def catalog(server, tmp_path):
+    """Six UVA documents from one host name of the stub server and four SEC ones from the other."""
+    jobs = []
+    for source, host, count in [('UVA', '127.0.0.1', 6), ('SEC', 'localhost', 4)]:
+        for i in range(count):
+            path = f"/{source}/doc {i}.pdf"
+            server.routes[path.replace(' ', '%20')] = (200, {}, f"{source} document {i}".encode())
+            url = server.url.replace('127.0.0.1', host) + path
+            jobs.append((source, 'Agreements', f"{source}_{i}", url, str(tmp_path / source / f"doc_{i}.pdf")))
+    return jobs
+
+
+def test_each_host_keeps_its_own_rate(stub_server, tmp_path, grants):
+    jobs = catalog(stub_server, tmp_path)
+    start = time.perf_counter()
+    counts = download_fund_formation.download_catalogs(jobs)
+    assert time.perf_counter() - start < 2  # The fake clock did the waiting
+
+    assert counts == {'UVA': 6, 'SEC': 4, 'ILPA': 0}
+    for _, _, _, _, dest_file in jobs:
+        assert os.path.exists(dest_file)
+
+    # Requests to each host are spaced by its own rate, not slowed by the other host
+    assert sorted(grants) == [2, 4]
+    assert grants[4] == pytest.approx([i / 4 for i in range(6)])
+    assert grants[2] == pytest.approx([i / 2 for i in range(4)])
+
+
+def test_downloaded_files_are_skipped(stub_server, tmp_path, grants):
+    jobs = catalog(stub_server, tmp_path)
+    download_fund_formation.download_catalogs(jobs)
+    requests_made = len(stub_server.requests)
+
+    assert download_fund_formation.download_catalogs(jobs) == {'UVA': 6, 'SEC': 4, 'ILPA': 0}
+    assert len(stub_server.requests) == requests_made
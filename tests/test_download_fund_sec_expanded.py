@@ -0,0 +1,58 @@
+import os
+
+import pytest
+
+import download_fund_sec_expanded as expanded
+
+FILLER = ' terms and conditions' * 400
+
+
+@pytest.fixture
+def filing(tmp_path, monkeypatch):
+    """One accession with a side letter and a short notice; counts how often it is read."""
+    monkeypatch.setattr(expanded, 'TEMP_PATH', str(tmp_path))
+    monkeypatch.setattr(expanded, 'CLASSIFICATION_CACHE', str(tmp_path / 'classifications.json'))
+
+    folder = tmp_path / 'BX' / 'N-2' / '0000000002-24-000001'
+    folder.mkdir(parents=True)
+    (folder / 'ex99-k.htm').write_text('<p>Side letter with the investor.</p>' + FILLER)
+    (folder / 'notice.htm').write_text('<p>Notice of filing.</p>')
+
+    reads = []
+    find = expanded.find_fund_docs_in_filing
+    monkeypatch.setattr(expanded, 'find_fund_docs_in_filing',
+                        lambda path, verbose=False: reads.append(path) or find(path, verbose))
+    return str(folder), reads
+
+
+def test_unchanged_filing_is_served_from_the_cache(filing):
+    folder, reads = filing
+    expected = [(os.path.join(folder, 'ex99-k.htm'), 'side_letter', 'ex99-k.htm')]
+
+    cache = {}
+    assert expanded.classify_filing(folder, cache) == expected
+    assert expanded.classify_filing(folder, cache) == expected
+    assert len(reads) == 1
+
+    expanded.save_classification_cache(cache)
+    assert expanded.classify_filing(folder, expanded.load_classification_cache()) == expected
+    assert len(reads) == 1
+
+
+def test_changed_files_or_keywords_are_read_again(filing, monkeypatch):
+    folder, reads = filing
+    cache = {}
+    expanded.classify_filing(folder, cache)
+
+    with open(os.path.join(folder, 'notice.htm'), 'a') as f:
+        f.write('<p>Amended: partnership agreement attached.</p>' + FILLER)
+    assert [doc_type for _, doc_type, _ in expanded.classify_filing(folder, cache)] == ['side_letter', 'lpa']
+    assert len(reads) == 2
+
+    expanded.save_classification_cache(cache)
+    assert expanded.load_classification_cache() == cache
+    keywords = dict(expanded.FUND_DOC_KEYWORDS, side_letter=['side letter', 'investor letter'])
+    monkeypatch.setattr(expanded, 'FUND_DOC_KEYWORDS', keywords)
+    assert expanded.load_classification_cache() == {}
+    expanded.classify_filing(folder, expanded.load_classification_cache())
+    assert len(reads) == 3
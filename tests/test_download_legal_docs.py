@@ -0,0 +1,156 @@
+import os
+
+import pytest
+
+datasets = pytest.importorskip('datasets')
+
+import download_legal_docs
+from blob_store import BlobStore
+
+FILLER = 'x' * download_legal_docs.MIN_DOC_LENGTH
+
+
+def hero(keyword, n):
+    return {'text': f"{keyword} number {n}\n{FILLER}"}
+
+
+def stream(n=60):
+    """Every third record a credit agreement, every fifth a merger agreement, the rest short."""
+    records = []
+    for i in range(n):
+        if i % 3 == 0:
+            records.append(hero('credit agreement', i))
+        elif i % 5 == 0:
+            records.append(hero('agreement and plan of merger', i))
+        else:
+            records.append({'text': f"short {i}"})
+    return records
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    output = tmp_path / 'matters'
+    output.mkdir()
+    monkeypatch.setattr(download_legal_docs, 'output_path', str(output))
+    monkeypatch.setattr(download_legal_docs, 'CHECKPOINT_FILE', str(output / '.scan_checkpoint.json'))
+    monkeypatch.setattr(download_legal_docs, 'SPILL_PATH', str(output / '.partial'))
+    monkeypatch.setattr(download_legal_docs, 'store', BlobStore(str(tmp_path / 'store')))
+    monkeypatch.setattr(download_legal_docs, 'near_duplicates', None)
+    monkeypatch.setattr(download_legal_docs, 'CHECKPOINT_EVERY', 7)
+    monkeypatch.setattr(download_legal_docs, 'BATCH_SIZE', 4)
+    monkeypatch.setattr(download_legal_docs, 'DOCS_PER_MATTER', 3)
+    monkeypatch.setattr(download_legal_docs, 'TARGET_MATTERS_PER_TYPE', 2)
+    return output
+
+
+def saved(output):
+    """{matter/file: text} of everything saved, checkpoint and spill files aside."""
+    files = {}
+    for folder in sorted(os.listdir(output)):
+        if folder.startswith('.'):
+            continue
+        for name in sorted(os.listdir(output / folder)):
+            files[f"{folder}/{name}"] = (output / folder / name).read_text()
+    return files
+
+
+class Interrupted(Exception):
+    pass
+
+
+def interrupt_after(records, count):
+    for i, record in enumerate(records):
+        if i == count:
+            raise Interrupted
+        yield record
+
+
+def test_parallel_scan_matches_serial(workspace, tmp_path):
+    download_legal_docs.scan(stream(), download_legal_docs.new_state(), workers=1)
+    serial = saved(workspace)
+    assert any(name.startswith('LevFin_1/') for name in serial)
+
+    for folder in os.listdir(workspace):
+        if not folder.startswith('.'):
+            for name in os.listdir(workspace / folder):
+                os.remove(workspace / folder / name)
+    download_legal_docs.scan(stream(), download_legal_docs.new_state(), workers=2)
+    assert saved(workspace) == serial
+
+
+def test_interrupted_scan_resumes_from_the_checkpoint(workspace):
+    state = download_legal_docs.new_state()
+    download_legal_docs.scan(stream(), state)
+    expected = saved(workspace)
+    scanned = state['position']
+
+    for folder in os.listdir(workspace):
+        if not folder.startswith('.'):
+            for name in os.listdir(workspace / folder):
+                os.remove(workspace / folder / name)
+
+    with pytest.raises(Interrupted):
+        download_legal_docs.scan(interrupt_after(stream(), 25), download_legal_docs.new_state())
+    state = download_legal_docs.load_checkpoint()
+    assert 0 < state['position'] <= 25
+
+    download_legal_docs.scan(stream(), state)
+    assert saved(workspace) == expected
+    assert state['position'] == scanned
+    assert not os.path.exists(download_legal_docs.CHECKPOINT_FILE)
+
+
+def test_resume_starts_at_the_checkpointed_shard(workspace):
+    opened = []
+
+    def generate(shards):
+        for shard in shards:
+            opened.append(shard)
+            for i in range(10):
+                yield {'text': f"{shard}-{i}"}
+
+    def dataset():
+        return datasets.IterableDataset.from_generator(generate, gen_kwargs={'shards': [0, 1, 2, 3]})
+
+    if not hasattr(dataset(), 'state_dict'):
+        pytest.skip('datasets has no IterableDataset.state_dict')
+
+    ds = dataset()
+    snapshots = []
+    records = download_legal_docs.track_records(ds, download_legal_docs.resume_records(ds, {'position': 0}),
+                                                0, snapshots)
+    texts = [record['text'] for record in records]
+    assert len(texts) == 40 and [s['position'] for s in snapshots] == [7, 14, 21, 28, 35]
+
+    # Checkpoint at record 24: resume from the snapshot at 21, in shard 2
+    state = {'position': 24, 'stream': download_legal_docs.stream_snapshot(snapshots, 24)}
+    assert state['stream']['position'] == 21
+
+    opened.clear()
+    ds = dataset()
+    resumed = [record['text'] for record in download_legal_docs.resume_records(ds, state)]
+    assert resumed == texts[24:]
+    assert opened == [2, 3]
+
+
+def test_resume_without_state_dict_skips_records(workspace):
+    state = {'position': 5, 'stream': None}
+    assert list(download_legal_docs.resume_records(iter(range(8)), state)) == [5, 6, 7]
+
+
+def test_model_scores_each_chunk_as_one_batch(monkeypatch):
+    calls = []
+
+    def classify_batch(texts, model):
+        calls.append((list(texts), model))
+        return [{'practice_area': ('LevFin', 0.95), 'doc_type': ('Credit_Agreement', 0.9)},
+                {'practice_area': ('MandA', 0.55), 'doc_type': ('Merger_Agreement', 0.9)}]
+
+    monkeypatch.setattr(download_legal_docs, 'classify_batch', classify_batch)
+    first, second = hero('nothing to see', 1)['text'], hero('agreement and plan of merger', 2)['text']
+
+    results = download_legal_docs.classify_chunk([first, None, second], 'model.json')
+
+    assert calls == [([first, second], 'model.json')]
+    # Confident: the model's answer; unsure: the keyword rules on the header
+    assert results == [('LevFin', 'credit agreement'), (None, None), ('M_and_A', 'agreement and plan of merger')]
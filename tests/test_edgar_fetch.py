@@ -0,0 +1,170 @@
+import json
+import os
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+import download_sec_filings
+from edgar_fetch import SEARCH_PAGE_SIZE, EdgarFetcher, TokenBucket
+
+ACCESSION = '0000000001-24-000001'
+PRIMARY_DOCUMENT = 'kkr-8k.htm'
+FILING_PATH = f"/Archives/edgar/data/1/{ACCESSION.replace('-', '')}"
+PRIMARY_HTML = ('<html><body>' + '<p>Material definitive agreement.</p>' * 60 + '</body></html>').encode()
+
+
+def add_filing(server):
+    server.routes['/files/company_tickers.json'] = (
+        200, {}, json.dumps({'0': {'ticker': 'KKR', 'cik_str': 1}}).encode())
+    server.routes['/submissions/CIK0000000001.json'] = (200, {}, json.dumps({
+        'filings': {'recent': {
+            'accessionNumber': [ACCESSION, '0000000001-24-000002'],
+            'form': ['8-K', '10-Q'],
+            'primaryDocument': [PRIMARY_DOCUMENT, 'kkr-10q.htm'],
+        }},
+    }).encode())
+    server.routes[f"{FILING_PATH}/{ACCESSION}.txt"] = (200, {}, b'<SEC-DOCUMENT>submission')
+    server.routes[f"{FILING_PATH}/{PRIMARY_DOCUMENT}"] = (200, {}, PRIMARY_HTML)
+
+
+def make_fetcher(server, **kwargs):
+    kwargs.setdefault('rate', 1000)
+    return EdgarFetcher('Test test@example.com', www_url=server.url, data_url=server.url,
+                        efts_url=server.url, **kwargs)
+
+
+def test_token_bucket_spaces_requests():
+    bucket = TokenBucket(rate=50)
+    start = time.monotonic()
+    for _ in range(11):
+        bucket.acquire()
+    assert time.monotonic() - start >= 10 / 50 * 0.9
+
+
+def test_rate_limit_holds_across_threads(stub_server):
+    stub_server.routes['/ping'] = (200, {}, b'ok')
+    fetcher = make_fetcher(stub_server, rate=20, max_workers=8)
+    start = time.monotonic()
+    fetcher.map(lambda _: fetcher.get(f"{stub_server.url}/ping"), range(9))
+    assert time.monotonic() - start >= 8 / 20 * 0.9
+    assert stub_server.hits('/ping') == 9
+
+
+def test_retry_after_429(stub_server):
+    responses = iter([(429, {'Retry-After': '1'}, b''), (200, {}, b'ok')])
+    stub_server.routes['/busy'] = lambda handler: next(responses)
+    fetcher = make_fetcher(stub_server)
+    start = time.monotonic()
+    assert fetcher.get(f"{stub_server.url}/busy").text == 'ok'
+    assert time.monotonic() - start >= 0.9
+    assert stub_server.hits('/busy') == 2
+
+
+def test_error_status_is_raised_without_retry(stub_server):
+    fetcher = make_fetcher(stub_server)
+    with pytest.raises(Exception, match='404'):
+        fetcher.get(f"{stub_server.url}/missing")
+    assert stub_server.hits('/missing') == 1
+
+
+def test_download_filings_layout(stub_server, tmp_path):
+    add_filing(stub_server)
+    fetcher = make_fetcher(stub_server)
+    results = fetcher.download_filings([('KKR', '8-K', 3)], str(tmp_path), download_details=True)
+
+    folder = tmp_path / 'sec-edgar-filings' / 'KKR' / '8-K' / ACCESSION
+    assert results == {('KKR', '8-K', 3): [str(folder)]}
+    assert (folder / 'full-submission.txt').read_bytes() == b'<SEC-DOCUMENT>submission'
+    assert (folder / 'primary-document.htm').read_bytes() == PRIMARY_HTML
+
+
+def test_download_filings_invalid_ticker(stub_server, tmp_path):
+    add_filing(stub_server)
+    results = make_fetcher(stub_server).download_filings([('NOPE', '8-K', 1)], str(tmp_path))
+    assert isinstance(results[('NOPE', '8-K', 1)], ValueError)
+    assert not os.path.exists(tmp_path / 'sec-edgar-filings')
+
+
+def test_download_sec_filings_converts_primary_documents(stub_server, tmp_path, monkeypatch):
+    # The script converts primary-document.htm; without download_details
+    # nothing is saved for it to convert
+    add_filing(stub_server)
+    monkeypatch.setattr(download_sec_filings, 'fetcher', make_fetcher(stub_server))
+    monkeypatch.setattr(download_sec_filings, 'targets', ['KKR'])
+    monkeypatch.setattr(download_sec_filings, 'filing_types', [('8-K', 3)])
+    monkeypatch.setattr(download_sec_filings, 'download_dir', str(tmp_path / 'raw'))
+    monkeypatch.setattr(download_sec_filings, 'output_dir', str(tmp_path / 'txt'))
+
+    download_sec_filings.main()
+
+    converted = tmp_path / 'txt' / 'KKR' / '8-K' / ACCESSION / 'primary-document.txt'
+    assert 'Material definitive agreement.' in converted.read_text()
+
+
+def add_search(server, totals):
+    """Full-text search over {query: total hits}; hit i of a query is document <query>-<i>.htm."""
+    def route(handler):
+        params = parse_qs(urlsplit(handler.path).query)
+        query = params['q'][0]
+        if query not in totals:
+            return 500, {}, b'search failed'
+        offset = int(params['from'][0])
+        hits = [{'_id': f"0000000001-24-{i:06d}:{query}-{i}.htm",
+                 '_source': {'ciks': ['0000000001'], 'form': '8-K', 'display_names': ['KKR']}}
+                for i in range(offset, min(offset + SEARCH_PAGE_SIZE, totals[query]))]
+        return 200, {}, json.dumps({'hits': {'total': {'value': totals[query]}, 'hits': hits}}).encode()
+
+    server.routes['/LATEST/search-index'] = route
+
+
+def search_offsets(server):
+    return [(parse_qs(urlsplit(path).query)['q'][0], int(parse_qs(urlsplit(path).query)['from'][0]))
+            for path, _ in server.requests if path.startswith('/LATEST/search-index')]
+
+
+def test_search_pages_through_every_query(stub_server):
+    add_search(stub_server, {'side letter': 250, 'most favored nation': 30})
+    fetcher = make_fetcher(stub_server)
+    letters, mfn = fetcher.full_text_searches(['side letter', 'most favored nation'], max_results=1000)
+
+    assert [hit['document'] for hit in letters] == [f"side letter-{i}.htm" for i in range(250)]
+    assert len(mfn) == 30
+    assert letters[0]['url'] == (f"{stub_server.url}/Archives/edgar/data/1/000000000124000000/"
+                                 "side letter-0.htm")
+    assert sorted(search_offsets(stub_server)) == [('most favored nation', 0), ('side letter', 0),
+                                                   ('side letter', 100), ('side letter', 200)]
+
+
+def test_search_stops_at_max_results(stub_server):
+    add_search(stub_server, {'side letter': 5000})
+    hits = make_fetcher(stub_server).full_text_search('side letter', max_results=150)
+    assert len(hits) == 150
+    assert sorted(search_offsets(stub_server)) == [('side letter', 0), ('side letter', 100)]
+
+
+def test_failed_query_is_returned_as_its_exception(stub_server):
+    add_search(stub_server, {'side letter': 120})
+    letters, failed = make_fetcher(stub_server, max_retries=0).full_text_searches(
+        ['side letter', 'unknown'], max_results=1000)
+    assert len(letters) == 120
+    assert isinstance(failed, Exception)
+
+
+def test_search_pages_are_cached(stub_server, tmp_path):
+    add_search(stub_server, {'side letter': 150})
+    cache = str(tmp_path / 'cache')
+    first = make_fetcher(stub_server, search_cache=cache).full_text_search('side letter', max_results=500)
+    assert len(stub_server.requests) == 2
+    assert 'enddt=' not in stub_server.requests[0][0]
+
+    again = make_fetcher(stub_server, search_cache=cache).full_text_search('side letter', max_results=500)
+    assert again == first
+    assert len(stub_server.requests) == 2
+
+    # The date range is part of the key
+    make_fetcher(stub_server, search_cache=cache).full_text_search(
+        'side letter', enddt='2024-12-31', max_results=500)
+    assert len(stub_server.requests) == 4
+    assert 'enddt=2024-12-31' in stub_server.requests[-1][0]
+    assert len(os.listdir(cache)) == 4
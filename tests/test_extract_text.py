@@ -0,0 +1,85 @@
+import io
+import json
+import zipfile
+
+import pytest
+
+import extract_text
+from extract_text import PAGE_BREAK, extract_all, extract_docx, load_text, sidecar_path, text_path
+
+NS = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+
+
+def docx_bytes(*paragraphs):
+    """A minimal DOCX whose body holds the given <w:p> contents."""
+    body = ''.join(f"<w:p>{paragraph}</w:p>" for paragraph in paragraphs)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('word/document.xml', f"<w:document {NS}><w:body>{body}</w:body></w:document>")
+    return buffer.getvalue()
+
+
+def run(text):
+    return f"<w:r><w:t>{text}</w:t></w:r>"
+
+
+PAGED = docx_bytes(
+    run('Side letter'),
+    run('Terms') + '<w:r><w:br w:type="page"/></w:r>' + run('Fees'),
+    '<w:pPr><w:pageBreakBefore/></w:pPr>' + run('Schedule'),
+)
+
+
+def test_docx_pages_and_offsets(tmp_path):
+    path = tmp_path / 'Side_Letter.docx'
+    path.write_bytes(PAGED)
+    text, pages = extract_docx(str(path))
+    assert text == PAGE_BREAK.join(['Side letter\nTerms', 'Fees', 'Schedule'])
+    assert pages == [0, 18, 23]
+    assert [text[start:].split(PAGE_BREAK)[0] for start in pages] == ['Side letter\nTerms', 'Fees', 'Schedule']
+
+
+@pytest.fixture
+def no_pool(monkeypatch):
+    """Fail if extract_all starts a process pool."""
+    def pool(*args, **kwargs):
+        raise AssertionError("a process pool was started")
+    monkeypatch.setattr(extract_text, 'ProcessPoolExecutor', pool)
+
+
+def test_extraction_is_cached_until_the_file_or_version_changes(tmp_path, monkeypatch):
+    matter = tmp_path / 'matter'
+    matter.mkdir()
+    path = matter / 'Side_Letter.docx'
+    path.write_bytes(PAGED)
+
+    assert extract_all([str(tmp_path)]) == (1, 0, 0)
+    with open(sidecar_path(str(path)), encoding='utf-8') as f:
+        assert json.load(f)['pages'] == [0, 18, 23]
+
+    # Current: no pool is started and the cached text is served
+    with monkeypatch.context() as m:
+        m.setattr(extract_text, 'ProcessPoolExecutor', None)
+        assert extract_all([str(tmp_path)]) == (0, 1, 0)
+        m.setattr(extract_text, 'extract', None)
+        assert load_text(str(path)) == (PAGE_BREAK.join(['Side letter\nTerms', 'Fees', 'Schedule']), [0, 18, 23])
+
+    path.write_bytes(docx_bytes(run('Amended side letter')))
+    assert extract_all([str(tmp_path)]) == (1, 0, 0)
+    assert open(text_path(str(path)), encoding='utf-8').read() == 'Amended side letter'
+
+    monkeypatch.setattr(extract_text, 'EXTRACTOR_VERSION', extract_text.EXTRACTOR_VERSION + 1)
+    assert extract_all([str(tmp_path)]) == (1, 0, 0)
+    assert extract_all([str(tmp_path)]) == (0, 1, 0)
+
+
+def test_pdfs_are_skipped_without_pypdf(tmp_path, monkeypatch, no_pool, capsys):
+    monkeypatch.setattr(extract_text, 'pypdf', None)
+    hashed = []
+    file_sha256 = extract_text.file_sha256
+    monkeypatch.setattr(extract_text, 'file_sha256', lambda path: hashed.append(path) or file_sha256(path))
+    (tmp_path / 'Subscription_Agreement.pdf').write_bytes(b'%PDF-1.4')
+
+    assert extract_all([str(tmp_path)]) == (0, 0, 0)
+    assert hashed == []
+    assert 'Skipping 1 PDF(s)' in capsys.readouterr().out
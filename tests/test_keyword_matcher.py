@@ -0,0 +1,50 @@
+import random
+
+import pytest
+
+from keyword_matcher import KeywordMatcher, loop_classify
+
+CATEGORIES = {
+    'lpa': ['limited partnership agreement', 'lp agreement', 'partnership agreement'],
+    'side_letter': ['side letter', 'side-letter', 'sideletter'],
+    'short': ['a', 'aa', 'aaa', 'q'],
+    'shared': ['lp agreement', 'zz'],
+}
+
+
+def all_hits(categories, text):
+    """Every (position, keyword) occurrence, overlaps included, by brute force."""
+    keywords = {kw for keywords in categories.values() for kw in keywords}
+    return sorted((at, kw) for kw in keywords for at in range(len(text)) if text.startswith(kw, at))
+
+
+@pytest.mark.parametrize('text', [
+    '',
+    'no keywords here',
+    'aaaa',
+    'the limited partnership agreement and lp agreement',
+    'sideletter side-letter side letter zzz q',
+])
+def test_hits_match_brute_force(text):
+    matcher = KeywordMatcher(CATEGORIES)
+    assert list(matcher.iter_hits(text)) == all_hits(CATEGORIES, text)
+    assert list(matcher.scan(text)) == loop_classify(CATEGORIES, text)
+
+
+def test_hits_match_brute_force_on_random_texts():
+    rng = random.Random(11)
+    keywords = [''.join(rng.choice('abc ') for _ in range(rng.randrange(1, 6))) for _ in range(40)]
+    categories = {f"c{i}": keywords[i::7] for i in range(7)}
+    matcher = KeywordMatcher(categories)
+    for _ in range(50):
+        text = ''.join(rng.choice('abcd ') for _ in range(rng.randrange(0, 300)))
+        assert list(matcher.iter_hits(text)) == all_hits(categories, text)
+
+
+def test_matched_keeps_declaration_order():
+    matcher = KeywordMatcher(CATEGORIES)
+    assert matcher.matched('partnership agreement, lp agreement') == {
+        'lpa': ['lp agreement', 'partnership agreement'], 'short': ['a'], 'shared': ['lp agreement']}
+    assert matcher.first_category('a side letter') == 'side_letter'
+    assert matcher.first_category('nothing', 'default') == 'default'
+    assert KeywordMatcher({}).scan('text') == {}
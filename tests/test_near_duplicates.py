@@ -0,0 +1,146 @@
+import os
+import random
+import sys
+
+import pytest
+
+import near_duplicates
+from near_duplicates import (EMPTY, NUM_PERM, NearDuplicateIndex, minhash, shingle_hashes,
+                             similarity, text_signature)
+
+WORDS = [f"word{n}" for n in range(2000)]
+
+
+def variant(words, changed, rng):
+    """A copy of words with a fraction of them replaced."""
+    return [rng.choice(WORDS) if rng.random() < changed else word for word in words]
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b)
+
+
+def test_wordless_text_has_no_shingles():
+    assert shingle_hashes('') == set()
+    assert shingle_hashes(' -- ... \n') == set()
+    assert text_signature('!!!') is None
+    assert len(shingle_hashes('too short')) == 1
+
+
+def test_empty_bins_borrow_from_the_next_filled_one():
+    h = 12345 * NUM_PERM + 5
+    signature = minhash({h})
+    assert EMPTY not in signature
+    assert signature[5] == 12345
+    assert signature[6] == 12345 + (NUM_PERM - 1) * EMPTY
+    assert signature[4] == 12345 + EMPTY
+    assert signature[0] == 12345 + 5 * EMPTY
+
+    # A bin borrowed from different distances does not agree by accident
+    other = minhash({12345 * NUM_PERM + 9})
+    assert similarity(signature, other) == 0
+
+
+def test_estimates_follow_exact_jaccard():
+    rng = random.Random(3)
+    for changed in (0.0, 0.02, 0.05, 0.1, 0.3):
+        words = [rng.choice(WORDS) for _ in range(3000)]
+        a, b = ' '.join(words), ' '.join(variant(words, changed, rng))
+        exact = jaccard(shingle_hashes(a), shingle_hashes(b))
+        assert similarity(text_signature(a), text_signature(b)) == pytest.approx(exact, abs=0.1)
+
+
+@pytest.fixture
+def documents():
+    rng = random.Random(5)
+    base = [rng.choice(WORDS) for _ in range(2000)]
+    other = [rng.choice(WORDS) for _ in range(2000)]
+    return {
+        'a': ' '.join(base),
+        'a2': ' '.join(variant(base, 0.01, rng)),
+        'a3': ' '.join(variant(base, 0.01, rng)),
+        'b': ' '.join(other),
+        'b2': ' '.join(variant(other, 0.01, rng)),
+        'c': ' '.join(rng.choice(WORDS) for _ in range(2000)),
+    }
+
+
+def build(documents):
+    index = NearDuplicateIndex()
+    for key, text in documents.items():
+        index.add(key, index.signature(text))
+    return index
+
+
+def test_query_and_clusters(documents):
+    index = build(documents)
+    assert len(index) == 6
+    matches = index.query(index.signature(documents['a']))
+    assert matches[0] == ('a', 1.0)
+    assert sorted(key for key, _ in matches) == ['a', 'a2', 'a3']
+    assert matches == sorted(matches, key=lambda match: -match[1])
+    assert index.query(index.signature(documents['c'])) == [('c', 1.0)]
+    assert index.clusters() == [['a', 'a2', 'a3'], ['b', 'b2']]
+
+
+def test_removed_keys_leave_the_buckets(documents):
+    index = build(documents)
+    index.remove('b2')
+    assert 'b2' not in index
+    assert index.clusters() == [['a', 'a2', 'a3']]
+    assert all('b2' not in keys for bucket in index.buckets for keys in bucket.values())
+
+    # Re-adding a key replaces its signature rather than indexing it twice
+    index.add('a2', index.signature(documents['c']))
+    assert index.clusters() == [['a', 'a3'], ['a2', 'c']]
+    assert sum(keys.count('a2') for bucket in index.buckets for keys in bucket.values()) == index.bands
+
+
+def test_save_and_load_round_trip(tmp_path, documents):
+    index = build(documents)
+    index.stamps['a'] = [1, 2]
+    path = str(tmp_path / 'index.json')
+    index.save(path)
+
+    loaded = NearDuplicateIndex.load(path)
+    assert loaded.signatures == index.signatures
+    assert loaded.stamps == {'a': [1, 2]}
+    assert loaded.buckets == index.buckets
+    assert loaded.clusters() == index.clusters()
+    assert NearDuplicateIndex.load(path, threshold=0.5).threshold == 0.5
+    assert len(NearDuplicateIndex.load(str(tmp_path / 'missing.json'))) == 0
+
+
+def run_main(monkeypatch, *args):
+    monkeypatch.setattr(sys, 'argv', ['near_duplicates.py', '--workers', '1', *args])
+    near_duplicates.main()
+
+
+def test_index_follows_changed_and_removed_files(tmp_path, monkeypatch, documents):
+    folder = tmp_path / 'docs'
+    folder.mkdir()
+    for key, text in documents.items():
+        (folder / f"{key}.txt").write_text(text, encoding='utf-8')
+    (folder / 'blank.txt').write_text('  \n', encoding='utf-8')
+    path = str(tmp_path / 'index.json')
+
+    run_main(monkeypatch, '--index', path, str(folder))
+    index = NearDuplicateIndex.load(path)
+    assert sorted(index.signatures) == sorted(str(folder / f"{key}.txt") for key in documents)
+    assert index.clusters() == [[str(folder / 'a.txt'), str(folder / 'a2.txt'), str(folder / 'a3.txt')],
+                                [str(folder / 'b.txt'), str(folder / 'b2.txt')]]
+
+    # Rewrite one file, delete another and empty a third
+    changed = folder / 'c.txt'
+    changed.write_text(documents['b'], encoding='utf-8')
+    os.utime(changed, ns=(1, 1))
+    os.remove(folder / 'a3.txt')
+    (folder / 'b2.txt').write_text('', encoding='utf-8')
+
+    run_main(monkeypatch, '--index', path, str(folder))
+    index = NearDuplicateIndex.load(path)
+    assert str(folder / 'a3.txt') not in index
+    assert str(folder / 'b2.txt') not in index
+    assert index.stamps[str(changed)] == [1, os.path.getsize(changed)]
+    assert index.clusters() == [[str(folder / 'a.txt'), str(folder / 'a2.txt')],
+                                [str(folder / 'b.txt'), str(changed)]]
@@ -0,0 +1,406 @@
+import binascii
+import html
+import io
+import json
+import mmap
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+import process_sec_filings
+from corpus import is_text_filing_file
+from process_sec_filings import clean_sec_text, iter_clean_sec_text, write_clean_text
+
+CLEAN_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sec_filings_clean')
+
+EDGE_CASES = [
+    '',
+    '   \n\t ',
+    '<p>Material definitive agreement.</p>\n\n\n<p>Item 1.01</p>',
+    '<SEC-HEADER>ACCESSION NUMBER: 1</SEC-HEADER><IMS-HEADER>x</IMS-HEADER>Body',
+    '<?xml version="1.0"?><html>Text</html>',
+    '<script type="text/javascript">if (a < b) {}</script>x<STYLE>p {}</style>y',
+    '<script>never closed <p>kept</p>',
+    '<script>a</script><script>b',
+    'AT&amp;T &nbsp;&lt;b&gt;bold&lt;/b&gt; &quot;q&quot; &#39;s &#8217; &#x2019;',
+    '&amp;lt;p&amp;gt;escaped twice&amp;lt;/p&amp;gt; &amp;amp; &amp;nbsp; &amp;#160;',
+    '&lt;script&gt;not dropped&lt;/script&gt;',
+    'a < b and c > d',
+    '<>empty <<br>> <</p>> </<br>p>',
+    '<br>x<BR/>y<br />z<br  \n/>w<Br>v',
+    'cell</td><td>cell</TD>\n</tr><tr>row</li>item</div>end',
+    '<a href="x?a=1&amp;b=2" title="1 &gt; 0">link</a> after',
+    '<span title="a>b">text</span>',
+    '<div <script>ignored</script>class="x">kept</div>',
+    'unterminated <span class="x" and text',
+    'trailing &am',
+    'lines \n \n \n  \n\ttabs\t\t and  spaces \n',
+    'nbsp\xa0\xa0runs\r\n\r\n\r\n\r\nand em',
+]
+
+
+def reference_clean_sec_text(content):
+    """clean_sec_text as a cascade of whole-document passes, the output to match."""
+    content = re.sub(r'<SEC-HEADER>.*?</SEC-HEADER>', '', content, flags=re.DOTALL)
+    content = re.sub(r'<IMS-HEADER>.*?</IMS-HEADER>', '', content, flags=re.DOTALL)
+    content = re.sub(r'<\?xml[^>]*\?>', '', content)
+    content = re.sub(r'<script[^>]*>.*?</script>', '', content, flags=re.DOTALL | re.IGNORECASE)
+    content = re.sub(r'<style[^>]*>.*?</style>', '', content, flags=re.DOTALL | re.IGNORECASE)
+
+    content = content.replace('&nbsp;', ' ')
+    content = content.replace('&amp;', '&')
+    content = content.replace('&lt;', '<')
+    content = content.replace('&gt;', '>')
+    content = content.replace('&quot;', '"')
+    content = content.replace('&#39;', "'")
+    content = re.sub(r'&#\d+;', ' ', content)
+
+    content = re.sub(r'<br\s*/?>', '\n', content, flags=re.IGNORECASE)
+    content = re.sub(r'</p>', '\n\n', content, flags=re.IGNORECASE)
+    content = re.sub(r'</div>', '\n', content, flags=re.IGNORECASE)
+    content = re.sub(r'</tr>', '\n', content, flags=re.IGNORECASE)
+    content = re.sub(r'</td>', '\t', content, flags=re.IGNORECASE)
+    content = re.sub(r'</li>', '\n', content, flags=re.IGNORECASE)
+    content = re.sub(r'<[^>]+>', '', content)
+
+    content = re.sub(r'\n\s*\n\s*\n+', '\n\n', content)
+    content = re.sub(r'[ \t]+', ' ', content)
+    content = re.sub(r' +\n', '\n', content)
+    return content.strip()
+
+
+def as_filing(text):
+    """Mark text up the way an HTML filing would carry it."""
+    body = (html.escape(text, quote=False)
+            .replace('  ', '&#160; ')
+            .replace('\t', '</td><td style="padding:0 4pt">')
+            .replace('\n\n', '</p>\n<p style="margin-top:6pt">')
+            .replace('\n', '<br/>\n'))
+    return ('<SEC-HEADER>\nACCESSION NUMBER: 0000000000-24-000001\n</SEC-HEADER>\n'
+            '<html><head><style>p {margin:0}</style><script>if (a < b) {}</script></head>'
+            f'<body><div><p style="margin-top:6pt">{body}</p></div></body></html>\n')
+
+
+def corpus_texts():
+    """(path, text) for every cleaned text document in sec_filings_clean."""
+    for folder, _, names in sorted(os.walk(CLEAN_DIR)):
+        for name in sorted(names):
+            if name.endswith('.txt') and is_text_filing_file(name):
+                path = os.path.join(folder, name)
+                with open(path, encoding='utf-8') as f:
+                    yield path, f.read()
+
+
+@pytest.mark.parametrize('content', EDGE_CASES)
+def test_edge_cases_match_reference(content):
+    expected = reference_clean_sec_text(content)
+    assert clean_sec_text(content) == expected
+    for chunk_size in (1, 7, 1000):
+        assert ''.join(iter_clean_sec_text(content, chunk_size)) == expected
+
+
+def test_corpus_matches_reference():
+    mismatched = []
+    for path, text in corpus_texts():
+        for content in (text, as_filing(text)):
+            if ''.join(iter_clean_sec_text(content, 4099)) != reference_clean_sec_text(content):
+                mismatched.append(os.path.relpath(path, CLEAN_DIR))
+    assert mismatched == []
+
+
+def test_long_unterminated_block_is_streamed():
+    content = '<p>kept</p><script>' + 'var a = 1 < 2;\n' * 20000 + '<p>also kept</p>'
+    expected = reference_clean_sec_text(content)
+    assert ''.join(iter_clean_sec_text(content, 64)) == expected
+
+
+def test_reads_files_and_iterables(tmp_path):
+    content = as_filing('Item 1.01\tEntry into a Material Definitive Agreement\n\nAT&T <Parent>')
+    expected = reference_clean_sec_text(content)
+    assert ''.join(iter_clean_sec_text(io.StringIO(content), 5)) == expected
+    assert ''.join(iter_clean_sec_text(iter([content[:40], '', content[40:]]))) == expected
+
+    size, _ = write_clean_text(io.StringIO(content), tmp_path / 'out.txt')
+    assert (tmp_path / 'out.txt').read_text(encoding='utf-8') == expected
+    assert size == len(expected.encode('utf-8'))
+
+
+# ---------------------------------------------------------
+# Filings
+# ---------------------------------------------------------
+PDF_BYTES = b'%PDF-1.4\n' + bytes(range(256)) * 3 + b'\n%%EOF\n'
+
+
+def uuencode(data, name):
+    lines = [f"begin 644 {name}"]
+    lines += [binascii.b2a_uu(data[i:i + 45]).decode('ascii').rstrip('\n') for i in range(0, len(data), 45)]
+    return '\n'.join(lines + ['`', 'end'])
+
+
+def agreement(title, paragraphs=40):
+    """An HTML exhibit long enough to be kept."""
+    body = ''.join(f"<p>{title} section {i}: the parties agree to the terms set out herein.</p>\n"
+                   for i in range(paragraphs))
+    return f"<html><body>{body}</body></html>"
+
+
+def submission(*documents):
+    """A full-submission.txt holding (type, filename, body) documents; filename may be None."""
+    parts = ['<SEC-DOCUMENT>0000000001-24-000001.txt\n<SEC-HEADER>\nACCESSION NUMBER: 0000000001-24-000001\n'
+             '</SEC-HEADER>\n']
+    for sequence, (doc_type, filename, body) in enumerate(documents, 1):
+        name = f"<FILENAME>{filename}\n" if filename else ''
+        parts.append(f"<DOCUMENT>\n<TYPE>{doc_type}\n<SEQUENCE>{sequence}\n{name}<TEXT>\n{body}\n</TEXT>\n</DOCUMENT>\n")
+    parts.append('</SEC-DOCUMENT>\n')
+    return ''.join(parts)
+
+
+FILINGS = {
+    ('KKR', '8-K', '0000000001-24-000001'): submission(
+        ('8-K', 'kkr-8k.htm', agreement('Current report')),
+        ('EX-10.1', 'ex10-1.htm', agreement('Credit agreement')),
+        ('GRAPHIC', 'logo.jpg', uuencode(b'\xff\xd8' * 100, 'logo.jpg')),
+        ('PDF', 'ex10-1.pdf', uuencode(PDF_BYTES, 'ex10-1.pdf')),
+    ),
+    ('KKR', '10-K', '0000000001-24-000002'): submission(
+        ('10-K', 'kkr-10k.htm', '<p>Annual report, see exhibits.</p>'),
+    ),
+    ('BX', '8-K', '0000000002-24-000001'): submission(
+        ('EX-10.1', 'ex10.htm', agreement('First amendment')),
+        ('EX-10.1', 'ex10.htm', agreement('Second amendment')),  # Same name: the last one wins
+        ('EX-99.1', None, agreement('Press release')),
+        ('EX-101.INS', 'bx-20240101.xml', agreement('XBRL instance')),
+    ),
+}
+
+
+@pytest.fixture
+def sec_dirs(tmp_path, monkeypatch):
+    """Point the processor at empty raw and clean folders; returns (raw, clean)."""
+    raw, clean = tmp_path / 'raw', tmp_path / 'clean'
+    raw.mkdir()
+    monkeypatch.setattr(process_sec_filings, 'raw_dir', raw)
+    use_output(monkeypatch, clean)
+    return raw, clean
+
+
+def use_output(monkeypatch, clean):
+    monkeypatch.setattr(process_sec_filings, 'output_dir', clean)
+    monkeypatch.setattr(process_sec_filings, 'MANIFEST_FILE', clean / 'manifest.json')
+
+
+def add_filings(raw, filings=FILINGS):
+    for (ticker, form, accession), content in filings.items():
+        folder = raw / ticker / form / accession
+        folder.mkdir(parents=True, exist_ok=True)
+        (folder / 'full-submission.txt').write_text(content, encoding='utf-8')
+
+
+def run_main(monkeypatch, *args):
+    monkeypatch.setattr(sys, 'argv', ['process_sec_filings.py', *args])
+    process_sec_filings.main()
+
+
+def tree(folder):
+    """{relative path: bytes} of every output file, the manifest left out."""
+    return {str(path.relative_to(folder)): path.read_bytes()
+            for path in sorted(folder.rglob('*')) if path.is_file() and path.name != 'manifest.json'}
+
+
+def load_manifest(clean):
+    with open(clean / 'manifest.json', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_workers_match_serial_output(sec_dirs, tmp_path, monkeypatch):
+    raw, clean = sec_dirs
+    add_filings(raw)
+    # Small enough that the larger submissions are split one document per task
+    monkeypatch.setattr(process_sec_filings, 'SPLIT_SUBMISSION_BYTES', 8 * 1024)
+    assert sum(path.stat().st_size >= 8 * 1024 for path in raw.rglob('full-submission.txt')) == 2
+
+    run_main(monkeypatch)
+    serial = tree(clean)
+    assert sorted(serial) == [
+        'BX/8-K_0000000002-24-000001/EX-10.1_ex10.htm.txt',
+        'BX/8-K_0000000002-24-000001/EX-99.1_document_2.txt.txt',
+        'KKR/10-K_0000000001-24-000002/full_submission_cleaned.txt',
+        'KKR/8-K_0000000001-24-000001/8-K_kkr-8k.htm.txt',
+        'KKR/8-K_0000000001-24-000001/EX-10.1_ex10-1.htm.txt',
+        'KKR/8-K_0000000001-24-000001/PDF_ex10-1.pdf',
+    ]
+    assert b'Second amendment' in serial['BX/8-K_0000000002-24-000001/EX-10.1_ex10.htm.txt']
+
+    parallel = tmp_path / 'parallel'
+    use_output(monkeypatch, parallel)
+    run_main(monkeypatch, '--workers', '3')
+    assert tree(parallel) == serial
+    assert load_manifest(parallel) == load_manifest(clean)
+
+
+def cleaned_counts(capsys):
+    line = next(line for line in capsys.readouterr().out.splitlines() if line.startswith('Cleaned:'))
+    return tuple(int(n) for n in re.findall(r'\d+', line))
+
+
+def test_manifest_skips_unchanged_accessions(sec_dirs, monkeypatch, capsys):
+    raw, clean = sec_dirs
+    add_filings(raw)
+    run_main(monkeypatch)
+    assert cleaned_counts(capsys) == (3, 0)
+    outputs = tree(clean)
+
+    # Output files are not touched again while nothing changed
+    for path in clean.rglob('*.txt'):
+        os.utime(path, ns=(1, 1))
+    run_main(monkeypatch)
+    assert cleaned_counts(capsys) == (0, 3)
+    assert all(path.stat().st_mtime_ns == 1 for path in clean.rglob('*.txt'))
+
+    # A touched but identical submission is hashed, skipped and its mtime recorded
+    key = 'KKR/10-K_0000000001-24-000002'
+    source = raw / 'KKR' / '10-K' / '0000000001-24-000002' / 'full-submission.txt'
+    os.utime(source, ns=(5_000_000_000, 5_000_000_000))
+    run_main(monkeypatch)
+    assert cleaned_counts(capsys) == (0, 3)
+    assert load_manifest(clean)[key]['source_mtime_ns'] == 5_000_000_000
+
+    # A missing output or a new extractor version rebuilds the accession
+    os.remove(clean / key / 'full_submission_cleaned.txt')
+    run_main(monkeypatch)
+    assert cleaned_counts(capsys) == (1, 2)
+    assert tree(clean) == outputs
+
+    monkeypatch.setattr(process_sec_filings, 'EXTRACTOR_VERSION', process_sec_filings.EXTRACTOR_VERSION + 1)
+    run_main(monkeypatch)
+    assert cleaned_counts(capsys) == (3, 0)
+    run_main(monkeypatch, '--force')
+    assert cleaned_counts(capsys) == (3, 0)
+
+
+def test_changed_submission_drops_stale_outputs(sec_dirs, monkeypatch, capsys):
+    raw, clean = sec_dirs
+    add_filings(raw)
+    run_main(monkeypatch)
+    assert cleaned_counts(capsys) == (3, 0)
+    folder = clean / 'KKR' / '8-K_0000000001-24-000001'
+    assert (folder / 'PDF_ex10-1.pdf').exists()
+    os.utime(folder / 'EX-10.1_ex10-1.htm.txt', ns=(1, 1))
+
+    add_filings(raw, {('KKR', '8-K', '0000000001-24-000001'): submission(
+        ('8-K', 'kkr-8k.htm', agreement('Amended current report')),
+        ('EX-10.1', 'ex10-1.htm', agreement('Credit agreement')),
+    )})
+    run_main(monkeypatch)
+    assert cleaned_counts(capsys)[0] == 1
+    assert sorted(os.listdir(folder)) == ['8-K_kkr-8k.htm.txt', 'EX-10.1_ex10-1.htm.txt']
+    assert b'Amended current report' in (folder / '8-K_kkr-8k.htm.txt').read_bytes()
+    # The unchanged exhibit was left in place rather than rewritten
+    assert (folder / 'EX-10.1_ex10-1.htm.txt').stat().st_mtime_ns == 1
+    assert set(load_manifest(clean)['KKR/8-K_0000000001-24-000001']['outputs']) == set(os.listdir(folder))
+
+
+def test_remove_stale_outputs_keeps_only_the_report(tmp_path):
+    (tmp_path / 'kept.txt').write_text('kept')
+    (tmp_path / 'stale.txt').write_text('stale')
+    (tmp_path / 'subfolder').mkdir()
+    process_sec_filings.remove_stale_outputs(tmp_path, [('kept.txt', 4, 'sha')])
+    assert sorted(os.listdir(tmp_path)) == ['kept.txt', 'subfolder']
+
+
+@pytest.mark.parametrize('doc_type, filename, policy', [
+    ('EX-10.1', 'ex10-1.htm', 'text'),
+    ('EX-10.1', 'ex10-1.PDF', 'binary'),
+    ('PDF', 'document.txt', 'binary'),
+    ('GRAPHIC', 'chart.gif', 'skip'),
+    ('graphic', 'chart.txt', 'skip'),
+    ('EX-101.INS', 'kkr-20240101.htm', 'skip'),
+    ('EX-99.1', 'data.xlsx', 'skip'),
+    ('10-K', '', 'text'),
+])
+def test_document_policy(doc_type, filename, policy):
+    assert process_sec_filings.document_policy(doc_type, filename) == policy
+
+
+def test_documents_are_routed_by_policy():
+    content = submission(
+        ('EX-10.1', 'ex10-1.htm', agreement('Credit agreement')),
+        ('EX-10.2', 'ex10-2.htm', '<p>Too short to keep.</p>'),
+        ('GRAPHIC', 'logo.jpg', uuencode(b'\xff\xd8' * 100, 'logo.jpg')),
+        ('EX-101.SCH', 'kkr.xsd', agreement('Schema')),
+        ('PDF', 'ex10-1.pdf', uuencode(PDF_BYTES, 'ex10-1.pdf')),
+        ('PDF', 'empty.pdf', 'no uuencoded body'),
+    )
+    exhibits = process_sec_filings.extract_exhibits(content)
+    assert sorted(exhibits) == ['EX-10.1_ex10-1.htm', 'PDF_ex10-1.pdf']
+    assert exhibits['PDF_ex10-1.pdf'] == PDF_BYTES
+    assert 'Credit agreement section 39' in exhibits['EX-10.1_ex10-1.htm']
+
+
+def test_uudecode_tolerates_padded_lines():
+    lines = uuencode(PDF_BYTES, 'x.pdf').splitlines()
+    padded = [line + 'junk' if len(line) == 61 else line for line in lines]
+    assert process_sec_filings.uudecode('\n'.join(padded)) == PDF_BYTES
+
+
+def test_decoded_binaries_keep_their_extension(tmp_path):
+    submission_file = tmp_path / 'full-submission.txt'
+    submission_file.write_text(submission(
+        ('PDF', 'ex10-1.pdf', uuencode(PDF_BYTES, 'ex10-1.pdf')),
+        ('EX-10.1', 'ex10-1.htm', agreement('Credit agreement')),
+    ), encoding='utf-8')
+    out = tmp_path / 'out'
+    report = process_sec_filings.process_filing(submission_file, out)
+    assert [name for name, _, _ in report] == ['PDF_ex10-1.pdf', 'EX-10.1_ex10-1.htm.txt']
+    assert (out / 'PDF_ex10-1.pdf').read_bytes() == PDF_BYTES
+
+
+@pytest.fixture
+def large_submission(tmp_path):
+    """A submission past SPLIT_SUBMISSION_BYTES, mostly one skipped graphic; returns (path, bodies)."""
+    filler_lines = process_sec_filings.SPLIT_SUBMISSION_BYTES // 61 + 1000
+    bodies = [
+        agreement('Café credit agreement'),
+        uuencode(b'', 'chart.gif').replace('`', ('M' + 'A' * 60 + '\n') * filler_lines + '`'),
+        agreement('Guaranty'),
+        '<p>Short cover note.</p>',
+    ]
+    path = tmp_path / 'full-submission.txt'
+    path.write_text(submission(('EX-10.1', 'ex10-1.htm', bodies[0]), ('GRAPHIC', 'chart.gif', bodies[1]),
+                               ('EX-10.2', None, bodies[2]), ('COVER', 'cover.htm', bodies[3])),
+                    encoding='utf-8')
+    assert path.stat().st_size > process_sec_filings.SPLIT_SUBMISSION_BYTES
+    return path, bodies
+
+
+def test_documents_are_split_lazily_from_the_map(large_submission):
+    path, bodies = large_submission
+    with process_sec_filings.open_submission(path) as data:
+        assert isinstance(data, mmap.mmap)
+        documents = list(process_sec_filings.iter_documents(data))
+        assert [(d.index, d.doc_type, d.filename) for d in documents] == [
+            (0, 'EX-10.1', 'ex10-1.htm'), (1, 'GRAPHIC', 'chart.gif'), (2, 'EX-10.2', None), (3, 'COVER', 'cover.htm')]
+        for document, body in zip(documents, bodies):
+            text = process_sec_filings.document_text(data, document)
+            assert f"<TEXT>\n{body}\n</TEXT>" in text
+            if document.index != 1:
+                # Chunks split inside the multi-byte é still decode to the same text
+                assert ''.join(process_sec_filings.iter_document_text(data, document, 7)) == text
+
+    empty = path.with_name('empty.txt')
+    empty.write_bytes(b'')
+    with process_sec_filings.open_submission(empty) as data:
+        assert list(process_sec_filings.iter_documents(data)) == []
+
+
+def test_large_submissions_are_cleaned_per_document(large_submission, tmp_path):
+    path, _ = large_submission
+    serial = process_sec_filings.process_filing(path, tmp_path / 'serial')
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        result = process_sec_filings.submit_filing(pool, path, tmp_path / 'split')
+        assert result() == serial
+    assert [name for name, _, _ in serial] == ['EX-10.1_ex10-1.htm.txt', 'EX-10.2_document_2.txt.txt']
+    assert tree(tmp_path / 'split') == tree(tmp_path / 'serial')
@@ -0,0 +1,280 @@
+import hashlib
+import os
+import re
+
+import pytest
+
+import resumable_download
+from resumable_download import (ChangedError, DownloadError, download, download_from_mirrors,
+                                download_segments, rank_mirrors, verified)
+
+DATA = bytes(range(256)) * 4096  # 1 MB
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(resumable_download, 'backoff', lambda attempt: 0)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Record download()'s waits instead of sleeping, with backoff(attempt) = attempt."""
+    waits = []
+    monkeypatch.setattr(resumable_download, 'backoff', lambda attempt: attempt)
+    monkeypatch.setattr(resumable_download.time, 'sleep', waits.append)
+    return waits
+
+
+def ranged_file(data, etag='"v1"', drop_after=None, drops=0, first_drop=0):
+    """
+    A route serving data with Range/If-Range support that drops the
+    connection after `drop_after` bytes for `drops` responses, starting
+    with response number `first_drop`. Every response is counted in
+    route.served.
+    """
+    def route(handler):
+        start, end = 0, len(data) - 1
+        match = re.match(r'bytes=(\d+)-(\d*)', handler.headers.get('Range', ''))
+        if match and handler.headers.get('If-Range') in (None, etag):
+            start = int(match.group(1))
+            end = min(int(match.group(2) or end), end)
+        body = data[start:end + 1]
+        headers = {'ETag': etag, 'Accept-Ranges': 'bytes', 'Content-Length': str(len(body))}
+        status = 200
+        if match and body != data:
+            status = 206
+            headers['Content-Range'] = f"bytes {start}-{end}/{len(data)}"
+        if first_drop <= route.served < first_drop + drops:
+            body = body[:drop_after]
+        route.served += 1
+        return status, headers, body
+
+    route.served = 0
+    return route
+
+
+def ranges(server):
+    return [headers.get('Range') for _, headers in server.requests]
+
+
+def test_resumes_after_dropped_connections(stub_server, tmp_path):
+    stub_server.routes['/cuad.zip'] = ranged_file(DATA, drop_after=300 * 1024, drops=3)
+    dest = str(tmp_path / 'cuad.zip')
+
+    record = download(f"{stub_server.url}/cuad.zip", dest)
+
+    with open(dest, 'rb') as f:
+        assert f.read() == DATA
+    assert record['size'] == len(DATA)
+    assert record['sha256'] == hashlib.sha256(DATA).hexdigest()
+    assert record['etag'] == '"v1"'
+    # Every retry resumed further along, from what reached the disk
+    offsets = [int(re.match(r'bytes=(\d+)-', r).group(1)) for r in ranges(stub_server)[1:]]
+    assert ranges(stub_server)[0] is None and len(offsets) == 3
+    assert offsets == sorted(offsets) and offsets[0] > 0
+    assert not os.path.exists(dest + '.part') and not os.path.exists(dest + '.part.json')
+
+
+def test_truncated_download_is_never_treated_as_done(stub_server, tmp_path, sleeps):
+    dest = str(tmp_path / 'cuad.zip')
+
+    # A server that never sends more than 200 KB and ignores Range
+    stub_server.routes['/stuck.zip'] = lambda handler: (200, {'Content-Length': str(len(DATA))}, DATA[:200000])
+    with pytest.raises(DownloadError):
+        download(f"{stub_server.url}/stuck.zip", dest, max_retries=2)
+    assert not os.path.exists(dest)
+    assert 0 < os.path.getsize(dest + '.part') <= 200000
+    assert stub_server.hits('/stuck.zip') == 4 and sleeps == [0, 1, 2]
+
+
+def test_short_ranges_back_off(stub_server, tmp_path, sleeps):
+    def route(handler):
+        match = re.match(r'bytes=(\d+)-', handler.headers.get('Range', ''))
+        if not match:
+            # Dropped after 200 KB
+            return 200, {'ETag': '"v1"', 'Content-Length': str(len(DATA))}, DATA[:200000]
+        # Complete responses that end 1000 bytes on, short of the file
+        start = int(match.group(1))
+        return 206, {'Content-Range': f"bytes {start}-{start + 999}/{len(DATA)}"}, DATA[start:start + 1000]
+
+    stub_server.routes['/short.zip'] = route
+    dest = str(tmp_path / 'short.zip')
+    with pytest.raises(DownloadError, match='of 1048576 bytes'):
+        download(f"{stub_server.url}/short.zip", dest, max_retries=2)
+    # Every retry after a short file backed off first
+    assert stub_server.hits('/short.zip') == 4 and sleeps == [0, 1, 2]
+
+
+def test_retry_after_is_honored(stub_server, tmp_path, sleeps):
+    serve = ranged_file(DATA)
+    statuses = [(503, {'Retry-After': '7'}, b''), (429, {}, b'')]
+    stub_server.routes['/cuad.zip'] = lambda handler: statuses.pop(0) if statuses else serve(handler)
+    dest = str(tmp_path / 'cuad.zip')
+
+    record = download(f"{stub_server.url}/cuad.zip", dest)
+
+    assert record['size'] == len(DATA)
+    # The server's delay, then backoff when it gives none
+    assert sleeps == [7.0, 2]
+
+
+def test_changed_file_restarts_the_part(stub_server, tmp_path):
+    dest = str(tmp_path / 'lpa.pdf')
+    stub_server.routes['/lpa.pdf'] = lambda handler: (
+        200, {'ETag': '"v1"', 'Content-Length': str(len(DATA))}, DATA[:200000])
+    with pytest.raises(DownloadError):
+        download(f"{stub_server.url}/lpa.pdf", dest, max_retries=0)
+
+    # The file changed on the server; If-Range makes it send the whole new file
+    changed = DATA[::-1]
+    stub_server.routes['/lpa.pdf'] = ranged_file(changed, etag='"v2"')
+    record = download(f"{stub_server.url}/lpa.pdf", dest)
+
+    with open(dest, 'rb') as f:
+        assert f.read() == changed
+    assert record['etag'] == '"v2"'
+    assert stub_server.requests[-1][1]['If-Range'] == '"v1"'
+
+
+def test_verified_checks_size_and_hash(stub_server, tmp_path):
+    stub_server.routes['/cuad.zip'] = ranged_file(DATA)
+    dest = str(tmp_path / 'cuad.zip')
+    record = download(f"{stub_server.url}/cuad.zip", dest)
+    assert verified(dest, record)
+
+    with open(dest, 'r+b') as f:
+        f.write(b'\xff')
+    assert not verified(dest, record)
+    assert not verified(str(tmp_path / 'missing.zip'), record)
+
+
+def test_unchanged_file_is_revalidated_with_one_request(stub_server, tmp_path):
+    stub_server.routes['/cuad.zip'] = ranged_file(DATA)
+    dest = str(tmp_path / 'cuad.zip')
+    record = download(f"{stub_server.url}/cuad.zip", dest)
+
+    stub_server.routes['/cuad.zip'] = lambda handler: (
+        (304, {}, b'') if handler.headers.get('If-None-Match') == '"v1"' else (200, {}, DATA))
+    assert download(f"{stub_server.url}/cuad.zip", dest, previous=record) == record
+    assert stub_server.hits('/cuad.zip') == 2
+
+
+@pytest.fixture
+def small_segments(monkeypatch):
+    """Split DATA into 8 segments, from mirrors probed with its first 64 KB."""
+    monkeypatch.setattr(resumable_download, 'PROBE_BYTES', 64 * 1024)
+    monkeypatch.setattr(resumable_download, 'SEGMENT_SIZE', 128 * 1024)
+    monkeypatch.setattr(resumable_download, 'SPLIT_MIN_BYTES', 512 * 1024)
+
+
+def segment_requests(server, path=None):
+    """Headers of every segment request (not the probes), for one path or all."""
+    return [headers for requested, headers in server.requests
+            if requested == (path or requested) and 'Range' in headers and
+            headers['Range'] != f"bytes=0-{resumable_download.PROBE_BYTES - 1}"]
+
+
+def test_rank_mirrors_drops_dead_ones(stub_server, small_segments):
+    stub_server.routes['/a/cuad.zip'] = ranged_file(DATA)
+    mirrors = rank_mirrors([f"{stub_server.url}/a/cuad.zip", f"{stub_server.url}/dead/cuad.zip"])
+    assert [(m['url'], m['size'], m['ranges'], m['etag']) for m in mirrors] == [
+        (f"{stub_server.url}/a/cuad.zip", len(DATA), True, '"v1"')]
+
+
+def test_split_survives_a_mirror_failing_partway(stub_server, tmp_path, small_segments):
+    # /b answers its probe, then drops every segment after 1000 bytes
+    stub_server.routes['/a/cuad.zip'] = ranged_file(DATA)
+    stub_server.routes['/b/cuad.zip'] = ranged_file(DATA, drop_after=1000, drops=1000, first_drop=1)
+    dest = str(tmp_path / 'cuad.zip')
+
+    record = download_from_mirrors([f"{stub_server.url}/a/cuad.zip", f"{stub_server.url}/b/cuad.zip"],
+                                   dest, split=True, max_retries=1)
+
+    with open(dest, 'rb') as f:
+        assert f.read() == DATA
+    assert record['sha256'] == hashlib.sha256(DATA).hexdigest() and record['etag'] == '"v1"'
+    assert segment_requests(stub_server, '/b/cuad.zip')
+    assert all(headers.get('If-Range') == '"v1"' for headers in segment_requests(stub_server))
+    assert not [name for name in os.listdir(tmp_path) if name != 'cuad.zip']
+
+
+def test_split_only_uses_mirrors_with_the_same_validators(stub_server, tmp_path, small_segments):
+    stub_server.routes['/a/cuad.zip'] = ranged_file(DATA)
+    stub_server.routes['/b/cuad.zip'] = ranged_file(DATA[::-1], etag='"other"')
+    dest = str(tmp_path / 'cuad.zip')
+
+    download_from_mirrors([f"{stub_server.url}/a/cuad.zip", f"{stub_server.url}/b/cuad.zip"], dest, split=True)
+
+    with open(dest, 'rb') as f:
+        content = f.read()
+    assert content in (DATA, DATA[::-1])
+    # One mirror, so no split at all
+    assert not segment_requests(stub_server)
+
+    mirrors = rank_mirrors([f"{stub_server.url}/a/cuad.zip", f"{stub_server.url}/b/cuad.zip"])
+    with pytest.raises(DownloadError):
+        download_segments(mirrors, dest, len(DATA), None, None, 30, 0, None)
+
+
+def interrupted_split(stub_server, tmp_path):
+    """Fetch the first half of DATA's segments and fail on the rest; returns (mirrors, dest)."""
+    half = len(DATA) // 2
+    for path in ('/a/cuad.zip', '/b/cuad.zip'):
+        serve = ranged_file(DATA)
+        stub_server.routes[path] = lambda handler, serve=serve: (
+            (503, {}, b'') if int(re.match(r'bytes=(\d+)', handler.headers['Range']).group(1)) >= half
+            else serve(handler))
+    mirrors = rank_mirrors([f"{stub_server.url}/a/cuad.zip", f"{stub_server.url}/b/cuad.zip"])
+    dest = str(tmp_path / 'cuad.zip')
+    with pytest.raises(DownloadError):
+        download_segments(mirrors, dest, len(DATA), None, None, 30, 0, None)
+    assert sorted(name for name in os.listdir(tmp_path) if name[-1].isdigit()) == [
+        f"cuad.zip.part.{n}" for n in range(4)]
+    return mirrors, dest
+
+
+def test_interrupted_split_resumes_its_segments(stub_server, tmp_path, small_segments):
+    mirrors, dest = interrupted_split(stub_server, tmp_path)
+    stub_server.requests.clear()
+    stub_server.routes['/a/cuad.zip'] = stub_server.routes['/b/cuad.zip'] = ranged_file(DATA)
+
+    record = download_segments(mirrors, dest, len(DATA), None, None, 30, 0, None)
+
+    with open(dest, 'rb') as f:
+        assert f.read() == DATA
+    assert record['size'] == len(DATA)
+    # Only the missing half was fetched
+    starts = sorted(int(re.match(r'bytes=(\d+)', headers['Range']).group(1)) for _, headers in stub_server.requests)
+    assert starts == [n * 128 * 1024 for n in range(4, 8)]
+
+
+def test_changed_file_discards_its_segments(stub_server, tmp_path, small_segments):
+    _, dest = interrupted_split(stub_server, tmp_path)
+    # Same size, new contents
+    changed = DATA[::-1]
+    stub_server.routes['/a/cuad.zip'] = stub_server.routes['/b/cuad.zip'] = ranged_file(changed, etag='"v2"')
+
+    record = download_from_mirrors([f"{stub_server.url}/a/cuad.zip", f"{stub_server.url}/b/cuad.zip"],
+                                   dest, split=True)
+
+    with open(dest, 'rb') as f:
+        assert f.read() == changed
+    assert record['etag'] == '"v2"'
+    # Split again from the start, not stitched onto the old half
+    assert sorted(headers['Range'] for headers in segment_requests(stub_server)
+                  if headers.get('If-Range') == '"v2"')[0] == f"bytes=0-{128 * 1024 - 1}"
+
+
+def test_file_changing_midway_stops_the_split(stub_server, tmp_path, small_segments):
+    old, new = ranged_file(DATA), ranged_file(DATA[::-1], etag='"v2"')
+    stub_server.routes['/a/cuad.zip'] = stub_server.routes['/b/cuad.zip'] = old
+    mirrors = rank_mirrors([f"{stub_server.url}/a/cuad.zip", f"{stub_server.url}/b/cuad.zip"])
+    # The file changes between the probes and the segments
+    stub_server.routes['/a/cuad.zip'] = stub_server.routes['/b/cuad.zip'] = new
+    dest = str(tmp_path / 'cuad.zip')
+
+    with pytest.raises(ChangedError):
+        download_segments(mirrors, dest, len(DATA), None, None, 30, 3, None)
+    assert not os.path.exists(dest)
+    # Each worker stopped at its first full response
+    assert len(segment_requests(stub_server)) <= len(mirrors) * resumable_download.CONNECTIONS_PER_MIRROR
@@ -0,0 +1,125 @@
+import random
+import sys
+
+import pytest
+
+import similarity_index
+from document_classifier import hashed_features
+from similarity_index import SimilarityIndex, simhash, tfidf_vector
+
+WORDS = [f"term{letter}{n}" for letter in 'abcdefghij' for n in 'abcdefghijklmnopqrstuvwxyz']
+
+
+def write_corpus(root, documents=40, seed=7):
+    """Documents drawn from a few overlapping topics, so neighbours are not ties."""
+    rng = random.Random(seed)
+    root.mkdir()
+    texts = {}
+    for i in range(documents):
+        topic = WORDS[i % 4 * 40:i % 4 * 40 + 100]
+        text = ' '.join(rng.choice(topic if rng.random() < 0.8 else WORDS) for _ in range(rng.randrange(200, 2000)))
+        (root / f"doc{i:02}.txt").write_text(text, encoding='utf-8')
+        texts[f"{root.name}/doc{i:02}.txt"] = text
+    return texts
+
+
+def exact_neighbours(index, texts, key, k):
+    """The k nearest keys by the cosine of untruncated TF-IDF vectors."""
+    vectors = {doc_id: tfidf_vector(hashed_features(text), index.df, index.units) for doc_id, text in texts.items()}
+    query = vectors[key]
+    scores = {doc_id: sum(weight * query.get(feature, 0.0) for feature, weight in vector.items())
+              for doc_id, vector in vectors.items() if doc_id != key}
+    return sorted(scores, key=scores.get, reverse=True)[:k]
+
+
+def test_stored_vectors_are_whole(tmp_path):
+    texts = write_corpus(tmp_path / 'docs')
+    with SimilarityIndex(str(tmp_path / 'index')) as index:
+        index.update([str(tmp_path / 'docs')])
+        for doc_id, text in texts.items():
+            [row] = index.rows(doc_id)
+            expected = tfidf_vector(hashed_features(text), index.df, index.units)
+            assert index.vector(row) == pytest.approx(expected)
+            assert index.fingerprint(row) == simhash(expected, index.df, 2)
+
+
+@pytest.fixture(params=['matrix', 'fingerprints'])
+def search(request, monkeypatch):
+    """Run a test with the SciPy matrix search, and again with the fingerprint search."""
+    if request.param == 'matrix' and similarity_index.np is None:
+        pytest.skip("needs numpy and scipy")
+    if request.param == 'fingerprints':
+        monkeypatch.setattr(similarity_index, 'np', None)
+    return request.param
+
+
+def test_similar_ranks_by_exact_cosine(tmp_path, search):
+    texts = write_corpus(tmp_path / 'docs')
+    with SimilarityIndex(str(tmp_path / 'index')) as index:
+        index.update([str(tmp_path / 'docs')])
+        for key in list(texts)[:5]:
+            # Every row is a fingerprint candidate here, so both searches are exact
+            assert [found for found, _ in index.similar(key, 5)] == exact_neighbours(index, texts, key, 5)
+        [(best, score)] = index.query(texts['docs/doc03.txt'], 1)
+        assert best == 'docs/doc03.txt' and score == pytest.approx(1.0)
+
+
+def test_matrix_search_is_exact_past_the_candidates(tmp_path, monkeypatch):
+    if similarity_index.np is None:
+        pytest.skip("needs numpy and scipy")
+    texts = write_corpus(tmp_path / 'docs')
+    monkeypatch.setattr(similarity_index, 'MATRIX_BLOCK_ROWS', 7)
+    monkeypatch.setattr(similarity_index, 'CANDIDATES', 1)
+    with SimilarityIndex(str(tmp_path / 'index')) as index:
+        index.update([str(tmp_path / 'docs')])
+        (tmp_path / 'docs' / 'doc05.txt').unlink()
+        index.update([str(tmp_path / 'docs')])
+        vectors = {key: index.vector(index.rows(key)[0]) for key in index.documents}
+        assert 'docs/doc05.txt' not in vectors
+        for key in ['docs/doc00.txt', 'docs/doc13.txt', 'docs/doc39.txt']:
+            # Ranked by the stored vectors, weighted by the document frequencies they were added with
+            scores = {found: sum(weight * vectors[key].get(feature, 0.0) for feature, weight in vector.items())
+                      for found, vector in vectors.items() if found != key}
+            assert [found for found, _ in index.similar(key, 8)] == sorted(scores, key=scores.get, reverse=True)[:8]
+
+
+def test_document_frequencies_drop_deleted_rows(tmp_path):
+    texts = write_corpus(tmp_path / 'docs')
+    with SimilarityIndex(str(tmp_path / 'index')) as index:
+        index.update([str(tmp_path / 'docs')])
+        (tmp_path / 'docs' / 'doc01.txt').unlink()
+        (tmp_path / 'docs' / 'doc02.txt').write_text(texts['docs/doc03.txt'], encoding='utf-8')
+        assert index.update([str(tmp_path / 'docs')]) == (0, 1, 1)
+        df, units = index.df, index.units
+    with SimilarityIndex(str(tmp_path / 'fresh')) as fresh:
+        fresh.update([str(tmp_path / 'docs')])
+        assert units == fresh.units == 39
+        assert df == fresh.df
+
+
+def test_compaction_keeps_rows(tmp_path):
+    texts = write_corpus(tmp_path / 'docs')
+    with SimilarityIndex(str(tmp_path / 'index')) as index:
+        index.update([str(tmp_path / 'docs')])
+        before = {doc_id: index.vector(index.rows(doc_id)[0]) for doc_id in texts}
+    for i in range(30):
+        (tmp_path / 'docs' / f"doc{i:02}.txt").unlink()
+
+    with SimilarityIndex(str(tmp_path / 'index')) as index:
+        assert index.update([str(tmp_path / 'docs')]) == (0, 0, 30)
+        assert not index.deleted and len(index.keys) == 10
+        for doc_id in index.keys:
+            assert index.vector(index.rows(doc_id)[0]) == before[doc_id]
+        assert index.similar('docs/doc35.txt', 3)
+
+
+def test_like_unknown_key_is_a_usage_error(tmp_path, monkeypatch, capsys):
+    write_corpus(tmp_path / 'docs', documents=3)
+    with SimilarityIndex(str(tmp_path / 'index')) as index:
+        index.update([str(tmp_path / 'docs')])
+    monkeypatch.setattr(sys, 'argv', ['similarity_index.py', '--index', str(tmp_path / 'index'),
+                                      '--like', 'docs/missing.txt'])
+    with pytest.raises(SystemExit) as exc:
+        similarity_index.main()
+    assert exc.value.code == 2
+    assert 'docs/missing.txt is not in the index' in capsys.readouterr().err